@@ -3,6 +3,18 @@ let cognitoUser = null;
 let jwtToken = null;
 let currentImages = [];
 let currentImageId = null;
+let uploadQueue = null;
+let galleryPager = null;
+let galleryObserver = null;
+let libraryStore = null;
+let libraryOpening = null;
+let librarySync = null;
+let searchIndex = null;
+let searchTimer = null;
+let searchGeneration = 0;
+let suggestTimer = null;
+let suggestController = null;
+const searchCache = new Map();  // query -> first page of search-images results
 let signupEmail = '';
 
 // Initialize Cognito User Pool
@@ -17,8 +29,31 @@ document.addEventListener('DOMContentLoaded', function() {
     hideLoading();
     checkAuthStatus();
     setupDragAndDrop();
+    registerServiceWorker();
 });
 
+// Service worker: cached renditions and gallery pages for repeat visits/offline
+function registerServiceWorker() {
+    if (!('serviceWorker' in navigator)) return;
+    
+    navigator.serviceWorker.register('sw.js').catch(error => {
+        console.error('Service worker registration failed:', error);
+    });
+    
+    // A cached gallery page was shown and the network copy turned out newer
+    navigator.serviceWorker.addEventListener('message', event => {
+        if (event.data && event.data.type === 'api-updated') {
+            refreshGallery();
+        }
+    });
+}
+
+function postToServiceWorker(message) {
+    if ('serviceWorker' in navigator && navigator.serviceWorker.controller) {
+        navigator.serviceWorker.controller.postMessage(message);
+    }
+}
+
 // Authentication Functions
 function checkAuthStatus() {
     const cognitoUser = userPool.getCurrentUser();
@@ -214,9 +249,22 @@ function logout() {
         cognitoUser.signOut();
     }
     
+    // Cached pages, images and the metadata mirror belong to this user
+    postToServiceWorker({ type: 'clear-user-data' });
+    if (libraryStore) {
+        libraryStore.clear().catch(() => {});
+        libraryStore.close();
+    }
+    libraryStore = null;
+    libraryOpening = null;
+    librarySync = null;
+    searchIndex = null;
+    
     jwtToken = null;
     cognitoUser = null;
     currentImages = [];
+    replaceGalleryPager(null);
+    searchCache.clear();
     
     showAuth();
     showLogin();
@@ -224,41 +272,309 @@ function logout() {
 
 // Gallery Functions
 async function loadGallery() {
+    const library = await openLibrary();
+    if (library && await library.isComplete()) {
+        return loadGalleryFromLibrary();
+    }
+    
     showGalleryLoading();
+    currentImages = [];
+    const pager = replaceGalleryPager(createPager(CONFIG.api.endpoints.images, {
+        limit: CONFIG.gallery.pageSize,
+        sortOrder: 'desc'
+    }));
+    
+    try {
+        await loadNextPage();
+        if (pager !== galleryPager) return;
+        console.log('Number of images:', currentImages.length);
+        
+        displayGallery(currentImages);
+        updatePhotoCount();
+        observeGallerySentinel();
+        
+        // First visit: build the local mirror in the background for next time
+        if (library) {
+            syncLibrary().catch(error => console.error('Error syncing library:', error));
+        }
+        
+    } catch (error) {
+        if (error.name === 'AbortError') return;
+        console.error('Error loading gallery:', error);
+        alert('Failed to load gallery: ' + error.message);
+    } finally {
+        hideGalleryLoading();
+    }
+}
+
+// Local metadata mirror (library-store.js)
+function openLibrary() {
+    if (typeof indexedDB === 'undefined' || typeof LibraryStore === 'undefined' || !jwtToken) {
+        return Promise.resolve(null);
+    }
+    if (!libraryOpening) {
+        libraryOpening = new LibraryStore().open(tokenSubject(jwtToken))
+            .then(store => {
+                libraryStore = store;
+                return store;
+            })
+            .catch(error => {
+                // Private browsing and the like: fall back to paging the API
+                console.error('Local library unavailable:', error);
+                return null;
+            });
+    }
+    return libraryOpening;
+}
+
+async function loadGalleryFromLibrary() {
+    // The whole library is local, so there is nothing to page
+    replaceGalleryPager(null);
+    observeGallerySentinel();
+    await showLibraryImages();
     
     try {
-        console.log('Loading gallery with token:', jwtToken ? 'Token exists' : 'No token');
-        const response = await fetch(`${CONFIG.api.baseUrl}${CONFIG.api.endpoints.images}?limit=50&sortOrder=desc`, {
+        if (await syncLibrary()) await showLibraryImages();
+    } catch (error) {
+        // Offline: keep showing the mirror
+        console.error('Error syncing library:', error);
+    }
+}
+
+async function showLibraryImages() {
+    if (!libraryStore || galleryPager !== null) return;
+    
+    const images = await libraryStore.getAll();
+    images.sort((a, b) => (b.uploadTimestamp - a.uploadTimestamp) || (a.imageId < b.imageId ? -1 : 1));
+    currentImages = images;
+    displayGallery(currentImages);
+    updatePhotoCount();
+}
+
+// Applies everything since the stored cursor; resolves to whether anything changed
+function syncLibrary() {
+    if (!libraryStore) return Promise.resolve(false);
+    
+    if (!librarySync) {
+        const store = libraryStore;
+        librarySync = fetchLibraryChanges(store).finally(() => {
+            librarySync = null;
+        });
+    }
+    return librarySync;
+}
+
+async function fetchLibraryChanges(store) {
+    let since = (await store.getCursor()) || 0;
+    let nextKey = null;
+    let changed = false;
+    
+    do {
+        const params = new URLSearchParams({ since, limit: CONFIG.library.syncPageSize });
+        if (nextKey) params.set('lastKey', nextKey);
+        
+        const response = await fetch(`${CONFIG.api.baseUrl}${CONFIG.api.endpoints.changes}?${params}`, {
             headers: {
                 'Authorization': `Bearer ${jwtToken}`
             }
         });
-        
-        console.log('Gallery response status:', response.status);
-        
         if (!response.ok) {
-            const errorText = await response.text();
-            console.error('Gallery error response:', errorText);
-            throw new Error('Failed to load gallery');
+            throw new Error('Failed to sync library');
         }
         
         const data = await response.json();
-        console.log('Gallery data received:', data);
-        console.log('Number of images:', data.images ? data.images.length : 0);
+        // Logged out or switched user meanwhile
+        if (store !== libraryStore) return false;
         
-        currentImages = data.images || [];
+        if (data.fullResync) {
+            searchIndex = null;
+            await store.clear();
+            since = 0;
+            nextKey = null;
+            changed = true;
+            continue;
+        }
         
+        const hasMore = Boolean(data.hasMore && data.nextKey);
+        await store.apply(data.changes || [], data.deleted || [], hasMore ? null : data.cursor);
+        changed = changed || (data.changes || []).length > 0 || (data.deleted || []).length > 0;
+        if (changed) searchIndex = null;
+        nextKey = hasMore ? data.nextKey : null;
+    } while (nextKey);
+    
+    return changed;
+}
+
+// Resolves to local results, or null when the mirror can't answer yet
+async function searchLibrary(criteria) {
+    const library = await openLibrary();
+    if (!library || !(await library.isComplete())) return null;
+    
+    if (!searchIndex) {
+        searchIndex = new SearchIndex(await library.getAll());
+    }
+    return searchIndex.query(criteria);
+}
+
+function tokenSubject(token) {
+    const payload = token.split('.')[1].replace(/-/g, '+').replace(/_/g, '/');
+    return JSON.parse(atob(payload)).sub;
+}
+
+// Cursor paging shared by the gallery and search results
+function createPager(endpoint, params) {
+    return {
+        endpoint,
+        params,
+        nextKey: null,
+        hasMore: true,
+        inflight: null,
+        pages: 0,
+        controller: new AbortController()
+    };
+}
+
+// Switches the gallery to a new result set, cancelling the old one's request
+function replaceGalleryPager(pager) {
+    if (galleryPager && galleryPager !== pager) {
+        galleryPager.controller.abort();
+    }
+    galleryPager = pager;
+    return pager;
+}
+
+function loadNextPage() {
+    const pager = galleryPager;
+    if (!pager || !pager.hasMore) return Promise.resolve([]);
+    
+    // Observer callbacks and manual calls share one request per page
+    if (!pager.inflight) {
+        pager.inflight = fetchPage(pager).finally(() => {
+            pager.inflight = null;
+        });
+    }
+    return pager.inflight;
+}
+
+async function fetchPage(pager) {
+    const params = new URLSearchParams(pager.params);
+    if (pager.nextKey) params.set('lastKey', pager.nextKey);
+    
+    const response = await fetch(`${CONFIG.api.baseUrl}${pager.endpoint}?${params}`, {
+        headers: {
+            'Authorization': `Bearer ${jwtToken}`
+        },
+        signal: pager.controller.signal
+    });
+    
+    if (!response.ok) {
+        const errorText = await response.text();
+        console.error('Page error response:', errorText);
+        throw new Error('Failed to load images');
+    }
+    
+    const data = await response.json();
+    
+    // A newer gallery load or search replaced this pager meanwhile
+    if (pager !== galleryPager) return [];
+    
+    pager.nextKey = data.nextKey || null;
+    pager.hasMore = Boolean(data.hasMore && data.nextKey);
+    pager.pages++;
+    
+    if (pager.pages === 1 && pager.cacheKey) {
+        cacheSearchResults(pager.cacheKey, {
+            images: data.images || [],
+            nextKey: pager.nextKey,
+            hasMore: pager.hasMore
+        });
+    }
+    
+    // Skip images already shown (e.g. spliced in after an upload)
+    const knownIds = new Set(currentImages.map(img => img.imageId));
+    const images = (data.images || []).filter(img => !knownIds.has(img.imageId));
+    currentImages = currentImages.concat(images);
+    return images;
+}
+
+async function refreshGallery() {
+    // Only swap in fresh data while the user is still on the first gallery
+    // page; deeper in the list the stale copy is kept rather than jumping.
+    const pager = galleryPager;
+    if (!pager || pager.endpoint !== CONFIG.api.endpoints.images || pager.pages !== 1 || pager.inflight) {
+        return;
+    }
+    
+    const previous = currentImages;
+    currentImages = [];
+    galleryPager = createPager(pager.endpoint, pager.params);
+    
+    try {
+        await loadNextPage();
         displayGallery(currentImages);
-        const photoCountEl = document.getElementById('photo-count');
-        if (photoCountEl) {
-            photoCountEl.textContent = `${currentImages.length} photo${currentImages.length !== 1 ? 's' : ''}`;
+        updatePhotoCount();
+        observeGallerySentinel();
+    } catch (error) {
+        console.error('Error refreshing gallery:', error);
+        currentImages = previous;
+        galleryPager = pager;
+    }
+}
+
+async function loadMoreImages() {
+    const pager = galleryPager;
+    
+    try {
+        const images = await loadNextPage();
+        if (pager !== galleryPager) return;
+        if (images.length > 0) {
+            appendToGallery(images);
+            updatePhotoCount();
         }
-        
+        // Re-observing re-checks the sentinel, so a page that didn't fill
+        // the prefetch margin immediately pulls the next one
+        observeGallerySentinel();
     } catch (error) {
-        console.error('Error loading gallery:', error);
-        alert('Failed to load gallery: ' + error.message);
-    } finally {
-        hideGalleryLoading();
+        if (error.name === 'AbortError') return;
+        console.error('Error loading more images:', error);
+        setTimeout(() => {
+            if (pager === galleryPager) observeGallerySentinel();
+        }, CONFIG.gallery.retryDelay);
+    }
+}
+
+function observeGallerySentinel() {
+    const sentinel = document.getElementById('gallery-sentinel');
+    if (!sentinel || typeof IntersectionObserver === 'undefined') return;
+    
+    if (!galleryObserver) {
+        // Fetch ahead of the viewport so the next page is ready before it's needed
+        galleryObserver = new IntersectionObserver(entries => {
+            if (entries.some(entry => entry.isIntersecting)) {
+                loadMoreImages();
+            }
+        }, { rootMargin: `0px 0px ${CONFIG.gallery.prefetchMargin}px 0px` });
+    }
+    
+    galleryObserver.unobserve(sentinel);
+    if (galleryPager && galleryPager.hasMore) {
+        galleryObserver.observe(sentinel);
+    }
+}
+
+function updatePhotoCount() {
+    const photoCountEl = document.getElementById('photo-count');
+    if (photoCountEl) {
+        const more = galleryPager && galleryPager.hasMore ? '+' : '';
+        photoCountEl.textContent = `${currentImages.length}${more} photo${currentImages.length !== 1 ? 's' : ''}`;
+    }
+}
+
+function appendToGallery(images) {
+    if (typeof appendGalleryNew === 'function') {
+        appendGalleryNew(images);
+    } else {
+        displayGallery(currentImages);
     }
 }
 
@@ -297,9 +613,18 @@ function displayGallery(images) {
 }
 
 // Search Functions
-async function searchImages(event) {
+// True when the search box holds query syntax rather than plain tags
+function isStructuredQuery(text) {
+    return /[:"()]|\b(AND|OR|NOT)\b/.test(text);
+}
+
+async function searchImages(event, options = {}) {
     if (event) event.preventDefault();
     
+    // Only the newest search may render; older ones bail after each await
+    const generation = ++searchGeneration;
+    clearTimeout(searchTimer);
+    
     // Try to get search term from either the top search bar or search panel
     const topSearchInput = document.getElementById('search-input');
     const panelSearchInput = document.getElementById('search-tags');
@@ -328,51 +653,191 @@ async function searchImages(event) {
         return;
     }
     
-    showGalleryLoading();
+    // Query-language searches (fields, AND/OR/NOT, phrases) run on the server
+    const structured = isStructuredQuery(searchTerm);
+    
+    // Answer from the local mirror when it has the whole library
+    const localResults = structured ? null : await searchLibrary({
+        terms: searchTerm.split(','),
+        hasFaces,
+        hasText,
+        dateFrom: dateFrom ? new Date(`${dateFrom}T00:00:00`).getTime() / 1000 : null,
+        dateTo: dateTo ? new Date(`${dateTo}T23:59:59`).getTime() / 1000 : null
+    });
+    if (generation !== searchGeneration) return;
+    if (localResults) {
+        replaceGalleryPager(createPager(null, {})).hasMore = false;  // Local results are complete
+        currentImages = localResults;
+        displayGallery(currentImages);
+        updatePhotoCount();
+        observeGallerySentinel();
+        return;
+    }
     
     const params = new URLSearchParams();
-    if (searchTerm) params.append('tags', searchTerm);
-    if (hasFaces) params.append('hasFaces', 'true');
-    if (hasText) params.append('hasText', 'true');
-    if (dateFrom) params.append('dateFrom', dateFrom);
-    if (dateTo) params.append('dateTo', dateTo);
-    params.append('limit', '50');
+    if (structured) {
+        // Panel filters become query terms; q replaces the other parameters
+        const terms = [`(${searchTerm})`];
+        if (hasFaces) terms.push('has:faces');
+        if (hasText) terms.push('has:text');
+        if (dateFrom || dateTo) terms.push(`date:${dateFrom || '1970-01-01'}..${dateTo || '9999-12-31'}`);
+        params.append('q', terms.join(' '));
+    } else {
+        if (searchTerm) params.append('tags', searchTerm);
+        if (hasFaces) params.append('hasFaces', 'true');
+        if (hasText) params.append('hasText', 'true');
+        if (dateFrom) params.append('dateFrom', dateFrom);
+        if (dateTo) params.append('dateTo', dateTo);
+    }
+    params.append('limit', String(CONFIG.gallery.pageSize));
     
     console.log('Search URL:', `${CONFIG.api.baseUrl}${CONFIG.api.endpoints.search}?${params}`);
     
+    const cacheKey = params.toString();
+    const pager = replaceGalleryPager(createPager(CONFIG.api.endpoints.search, params));
+    pager.cacheKey = cacheKey;
+    
+    // A query seen before (e.g. after backspacing) renders without a request
+    const cached = searchCache.get(cacheKey);
+    if (cached) {
+        pager.nextKey = cached.nextKey;
+        pager.hasMore = cached.hasMore;
+        pager.pages = 1;
+        currentImages = cached.images.slice();
+        displayGallery(currentImages);
+        updatePhotoCount();
+        observeGallerySentinel();
+        return;
+    }
+    
+    // Typing keeps the current results up until the new ones arrive
+    if (!options.typed) showGalleryLoading();
+    currentImages = [];
+    
     try {
-        const response = await fetch(`${CONFIG.api.baseUrl}${CONFIG.api.endpoints.search}?${params}`, {
-            headers: {
-                'Authorization': `Bearer ${jwtToken}`
-            }
-        });
-        
-        console.log('Search response status:', response.status);
-        
-        if (!response.ok) {
-            const errorText = await response.text();
-            console.error('Search error response:', errorText);
-            throw new Error('Search failed');
-        }
-        
-        const data = await response.json();
-        console.log('Search results:', data);
-        currentImages = data.images || [];
+        await loadNextPage();
+        if (pager !== galleryPager) return;
+        console.log('Search results:', currentImages.length);
         
         displayGallery(currentImages);
-        const photoCountEl = document.getElementById('photo-count');
-        if (photoCountEl) {
-            photoCountEl.textContent = `${currentImages.length} photo${currentImages.length !== 1 ? 's' : ''}`;
-        }
+        updatePhotoCount();
+        observeGallerySentinel();
         
     } catch (error) {
+        if (error.name === 'AbortError') return;
         console.error('Search error:', error);
-        alert('Search failed: ' + error.message);
+        if (!options.typed) alert('Search failed: ' + error.message);
     } finally {
-        hideGalleryLoading();
+        if (!options.typed) hideGalleryLoading();
+    }
+}
+
+function searchAsYouType() {
+    clearTimeout(searchTimer);
+    clearTimeout(suggestTimer);
+    suggestTimer = setTimeout(suggestTags, CONFIG.search.debounceDelay);
+    
+    // The local index is cheap enough to query on every keystroke; API
+    // searches wait for a pause in typing
+    const input = document.getElementById('search-input');
+    if (searchIndex && !isStructuredQuery(input ? input.value : '')) {
+        searchImages(null, { typed: true });
+    } else {
+        searchTimer = setTimeout(() => searchImages(null, { typed: true }), CONFIG.search.debounceDelay);
+    }
+}
+
+// Completes the last comma-separated term from the user's tag dictionary
+async function suggestTags() {
+    const input = document.getElementById('search-input');
+    const list = document.getElementById('tag-suggestions');
+    if (!input || !list) return;
+    
+    const terms = input.value.split(',');
+    const prefix = terms.pop().trim();
+    if (suggestController) suggestController.abort();
+    if (!prefix) {
+        list.replaceChildren();
+        return;
+    }
+    
+    const controller = new AbortController();
+    suggestController = controller;
+    const params = new URLSearchParams({ prefix, limit: CONFIG.search.suggestions });
+    
+    try {
+        const response = await fetch(`${CONFIG.api.baseUrl}${CONFIG.api.endpoints.tags}?${params}`, {
+            headers: {
+                'Authorization': `Bearer ${jwtToken}`
+            },
+            signal: controller.signal
+        });
+        if (!response.ok) return;
+        
+        const data = await response.json();
+        const head = terms.map(term => term.trim()).filter(Boolean);
+        list.replaceChildren(...(data.tags || []).map(({ tag, count }) => {
+            const option = document.createElement('option');
+            option.value = head.concat(tag).join(',');
+            option.label = `${tag} (${count})`;
+            return option;
+        }));
+    } catch (error) {
+        if (error.name !== 'AbortError') console.error('Error loading tag suggestions:', error);
+    }
+}
+
+function cacheSearchResults(key, results) {
+    searchCache.delete(key);
+    searchCache.set(key, results);
+    // Map keeps insertion order, so the first key is the least recently stored
+    if (searchCache.size > CONFIG.search.cacheSize) {
+        searchCache.delete(searchCache.keys().next().value);
+    }
+}
+
+// Precomputed counts for the search panel (GET /images/facets)
+async function loadFacets() {
+    try {
+        const response = await fetch(`${CONFIG.api.baseUrl}${CONFIG.api.endpoints.facets}?tagLimit=${CONFIG.search.facetTags}`, {
+            headers: {
+                'Authorization': `Bearer ${jwtToken}`
+            }
+        });
+        if (!response.ok) return;
+        renderFacets(await response.json());
+    } catch (error) {
+        console.error('Error loading facets:', error);
     }
 }
 
+function renderFacets(facets) {
+    document.getElementById('facet-faces').textContent = facets.withFaces ? String(facets.withFaces) : '';
+    document.getElementById('facet-text').textContent = facets.withText ? String(facets.withText) : '';
+    
+    renderFacetChips('facet-tags', facets.tags || [], ({ tag }) => tag);
+    
+    // Face attributes search through the query language (face:, emotion:, age:)
+    renderFacetChips('facet-people', facets.faceAttributes || [], ({ attribute }) =>
+        attribute.includes(':') ? attribute : `face:${attribute}`);
+}
+
+// Chips in a facet section; clicking one searches for query(entry)
+function renderFacetChips(listId, entries, query) {
+    document.getElementById(`${listId}-section`).style.display = entries.length > 0 ? 'block' : 'none';
+    document.getElementById(listId).replaceChildren(...entries.map(entry => {
+        const chip = document.createElement('span');
+        chip.className = 'tag-chip';
+        chip.textContent = `${entry.tag || entry.attribute} · ${entry.count}`;
+        chip.onclick = () => {
+            document.getElementById('search-tags').value = query(entry);
+            document.getElementById('search-input').value = '';
+            searchImages();
+        };
+        return chip;
+    }));
+}
+
 function clearSearch() {
     document.getElementById('search-input').value = '';
     document.getElementById('filter-faces').checked = false;
@@ -438,12 +903,12 @@ function handleFileSelect(e) {
 async function handleFiles(files) {
     const validFiles = Array.from(files).filter(file => {
         const isImage = file.type.startsWith('image/');
-        const isValidSize = file.size <= 10 * 1024 * 1024; // 10MB
+        const isValidSize = file.size <= CONFIG.upload.maxFileSize;
         
         if (!isImage) {
             alert(`${file.name} is not an image file`);
         } else if (!isValidSize) {
-            alert(`${file.name} is too large (max 10MB)`);
+            alert(`${file.name} is too large (max ${formatFileSize(CONFIG.upload.maxFileSize)})`);
         }
         
         return isImage && isValidSize;
@@ -454,77 +919,520 @@ async function handleFiles(files) {
     const progress = document.getElementById('upload-progress');
     if (progress) {
         progress.style.display = 'block';
-        progress.innerHTML = '<p style="text-align: center; padding: 12px;">Uploading images...</p>';
+        progress.innerHTML = `
+            <div class="upload-progress-header">
+                <span id="upload-summary">Preparing ${validFiles.length} file${validFiles.length !== 1 ? 's' : ''}...</span>
+                <button class="btn btn-secondary" onclick="cancelUploads()">Cancel all</button>
+            </div>
+        `;
+    }
+    
+    const rows = validFiles.map(file => createUploadRow(progress, file));
+    
+    // Hash the selected files so the server can skip ones already in the
+    // library (hashes describe the originals, even if we upload a resized copy)
+    const hashes = await hashFiles(validFiles);
+    
+    // Downscale and re-encode unless the user wants full-resolution originals
+    const keepOriginalsEl = document.getElementById('keep-originals');
+    const keepOriginals = keepOriginalsEl ? keepOriginalsEl.checked : !CONFIG.upload.preprocess.enabled;
+    if (!keepOriginals) {
+        const summary = document.getElementById('upload-summary');
+        if (summary) summary.textContent = 'Optimizing photos...';
+        const resized = await preprocessFiles(validFiles);
+        resized.forEach((file, index) => {
+            validFiles[index] = file;
+        });
     }
     
+    // Step 1: Get pre-signed URLs for every small file in one request; the
+    // server sizes their expiry to the batch, and an upload that still finds
+    // its URL expired re-signs it (uploadFileWithRefresh). Large files use a
+    // multipart upload instead, started per file.
+    const uploads = validFiles.map((file, index) => ({
+        index,
+        multipart: file.size > CONFIG.upload.multipartThreshold
+    }));
+    const singleIndexes = uploads.filter(upload => !upload.multipart).map(upload => upload.index);
+    
+    if (singleIndexes.length > 0) {
+        try {
+            const presigned = await requestUploadUrls(
+                singleIndexes.map(index => validFiles[index]),
+                singleIndexes.map(index => hashes[index])
+            );
+            presigned.forEach(upload => {
+                const index = singleIndexes[upload.index];
+                uploads[index] = { ...upload, index };
+            });
+        } catch (error) {
+            singleIndexes.forEach(index => {
+                uploads[index].error = error.message;
+            });
+        }
+    }
+    
+    // Step 2: Upload to S3 through a bounded-concurrency queue
+    const queue = new UploadQueue({
+        concurrency: CONFIG.upload.concurrency,
+        retries: CONFIG.upload.retries,
+        retryDelay: CONFIG.upload.retryDelay
+    });
+    uploadQueue = queue;
+    
+    const jobs = uploads.map(upload => {
+        const file = validFiles[upload.index];
+        const row = rows[upload.index];
+        
+        if (upload.error) {
+            return Promise.reject(new Error(upload.error));
+        }
+        if (upload.duplicate) {
+            return Promise.resolve(upload);
+        }
+        
+        const onProgress = (loaded, total) => row.setProgress(total ? loaded / total : 0);
+        
+        // Multipart retries failed parts itself, so the queue doesn't retry it
+        const job = upload.multipart
+            ? queue.add(signal => uploadFileMultipart(file, hashes[upload.index], { signal, onProgress }), { retries: 0 })
+            : queue.add(signal => uploadFileWithRefresh(file, upload, hashes[upload.index], { signal, onProgress }));
+        
+        row.onCancel(job.cancel);
+        return job.promise;
+    });
+    
+    const results = await Promise.allSettled(jobs);
+    
     let successCount = 0;
     let errorCount = 0;
+    const newImageIds = [];
     
-    for (const file of validFiles) {
-        try {
-            await uploadFile(file);
+    results.forEach((result, index) => {
+        if (result.status === 'fulfilled') {
             successCount++;
-            if (progress) {
-                progress.innerHTML += `<div class="upload-item"><span class="material-icons" style="color: green;">check_circle</span><span>${file.name}</span></div>`;
-            }
-        } catch (error) {
+            rows[index].setDone(result.value.duplicate ? 'Already in library' : 'Uploaded');
+            if (!result.value.duplicate) newImageIds.push(result.value.imageId);
+        } else {
             errorCount++;
-            if (progress) {
-                progress.innerHTML += `<div class="upload-item"><span class="material-icons" style="color: red;">error</span><span>${file.name}: ${error.message}</span></div>`;
-            }
+            rows[index].setFailed(result.reason.message);
         }
+    });
+    
+    if (uploadQueue === queue) uploadQueue = null;
+    
+    const summary = document.getElementById('upload-summary');
+    if (summary) {
+        summary.textContent = `${successCount} uploaded${errorCount ? `, ${errorCount} failed` : ''}`;
     }
     
-    setTimeout(() => {
+    // Reset file input
+    const fileInput = document.getElementById('file-input');
+    if (fileInput) fileInput.value = '';
+    
+    // Keep the dialog open when something failed so the errors stay visible
+    if (errorCount === 0) {
         if (progress) {
             progress.style.display = 'none';
             progress.innerHTML = '';
         }
-        // Reset file input
-        const fileInput = document.getElementById('file-input');
-        if (fileInput) fileInput.value = '';
-        
-        // Close dialog and reload
         if (typeof closeUploadDialog === 'function') {
             closeUploadDialog();
         }
-        loadGallery();
-    }, 2000);
+    }
+    
+    if (newImageIds.length > 0) {
+        insertUploadedImages(newImageIds);
+    }
+}
+
+function cancelUploads() {
+    if (uploadQueue) {
+        uploadQueue.cancelAll();
+    }
+}
+
+function createUploadRow(container, file) {
+    const row = document.createElement('div');
+    row.className = 'upload-item';
+    row.innerHTML = `
+        <span class="material-icons upload-item-icon">schedule</span>
+        <div class="upload-item-info">
+            <div class="upload-item-name"></div>
+            <div class="upload-item-progress"><div class="upload-item-progress-bar" style="width: 0%"></div></div>
+            <div class="upload-item-status">Waiting...</div>
+        </div>
+        <button class="icon-btn" title="Cancel">
+            <span class="material-icons">close</span>
+        </button>
+    `;
+    row.querySelector('.upload-item-name').textContent = file.name;
+    if (container) container.appendChild(row);
+    
+    const icon = row.querySelector('.upload-item-icon');
+    const bar = row.querySelector('.upload-item-progress-bar');
+    const status = row.querySelector('.upload-item-status');
+    const cancelButton = row.querySelector('button');
+    
+    return {
+        setProgress(fraction) {
+            icon.textContent = 'cloud_upload';
+            bar.style.width = `${Math.round(fraction * 100)}%`;
+            status.textContent = `${Math.round(fraction * 100)}% of ${formatFileSize(file.size)}`;
+        },
+        setDone(message) {
+            icon.textContent = 'check_circle';
+            icon.style.color = 'green';
+            bar.style.width = '100%';
+            status.textContent = message;
+            cancelButton.remove();
+        },
+        setFailed(message) {
+            icon.textContent = 'error';
+            icon.style.color = 'red';
+            status.textContent = message;
+            cancelButton.remove();
+        },
+        onCancel(cancel) {
+            cancelButton.onclick = cancel;
+        }
+    };
+}
+
+async function insertUploadedImages(imageIds) {
+    // New images appear once ProcessImage has run, so poll the newest page
+    // with backoff and splice them in instead of reloading the gallery.
+    const missing = new Set(imageIds);
+    let delay = CONFIG.upload.pollDelay;
+    
+    for (let attempt = 0; attempt < CONFIG.upload.pollAttempts && missing.size > 0; attempt++) {
+        await sleep(delay);
+        delay *= 2;
+        
+        try {
+            const newest = await fetchNewestImages(imageIds.length + 10);
+            if (!newest) continue;
+            
+            const knownIds = new Set(currentImages.map(img => img.imageId));
+            const added = newest.filter(img => missing.has(img.imageId) && !knownIds.has(img.imageId));
+            
+            if (added.length > 0) {
+                searchCache.clear();
+                added.forEach(img => missing.delete(img.imageId));
+                currentImages = added.concat(currentImages);
+                displayGallery(currentImages);
+                updatePhotoCount();
+            }
+        } catch (error) {
+            console.error('Error fetching new uploads:', error);
+        }
+    }
+    
+    syncLibrary().catch(error => console.error('Error syncing library:', error));
+}
+
+async function fetchNewestImages(count) {
+    // The newest `count` images, paging past get-images' 100-item limit
+    // so large uploads are found too. Returns null if a page failed.
+    const images = [];
+    let nextKey = null;
+    
+    while (images.length < count) {
+        const params = new URLSearchParams({
+            limit: Math.min(100, count - images.length),
+            sortOrder: 'desc'
+        });
+        if (nextKey) params.set('lastKey', nextKey);
+        
+        // no-store: skip the service worker's cached copy of the page
+        const response = await fetch(`${CONFIG.api.baseUrl}${CONFIG.api.endpoints.images}?${params}`, {
+            headers: {
+                'Authorization': `Bearer ${jwtToken}`
+            },
+            cache: 'no-store'
+        });
+        if (!response.ok) return null;
+        
+        const data = await response.json();
+        images.push(...(data.images || []));
+        nextKey = data.nextKey || null;
+        if (!data.hasMore || !nextKey) break;
+    }
+    
+    return images;
+}
+
+function preprocessFiles(files) {
+    // Resolves to the files to upload: a smaller re-encoded copy where that
+    // helps, otherwise the original File
+    if (typeof Worker === 'undefined' || typeof OffscreenCanvas === 'undefined') {
+        return Promise.resolve(files);
+    }
+    
+    const { maxEdge, quality } = CONFIG.upload.preprocess;
+    // Animated GIFs would lose their animation
+    const candidates = files
+        .map((file, id) => ({ file, id }))
+        .filter(({ file }) => file.type !== 'image/gif');
+    
+    if (candidates.length === 0) {
+        return Promise.resolve(files);
+    }
+    
+    return new Promise(resolve => {
+        const worker = new Worker('resize-worker.js');
+        const results = files.slice();
+        let remaining = candidates.length;
+        
+        worker.onmessage = event => {
+            const { id, blob } = event.data;
+            const original = files[id];
+            
+            if (blob && blob.size < original.size) {
+                const name = blob.type === original.type
+                    ? original.name
+                    : original.name.replace(/\.[^.]+$/, '') + '.jpg';
+                results[id] = new File([blob], name, { type: blob.type, lastModified: original.lastModified });
+            }
+            
+            if (--remaining === 0) {
+                worker.terminate();
+                resolve(results);
+            }
+        };
+        worker.onerror = error => {
+            console.error('Resize worker error:', error);
+            worker.terminate();
+            resolve(files);
+        };
+        
+        candidates.forEach(({ file, id }) => worker.postMessage({ id, file, maxEdge, quality }));
+    });
+}
+
+function hashFiles(files) {
+    // Resolves to one hex SHA-256 per file (null where hashing isn't possible)
+    if (typeof Worker === 'undefined' || !window.crypto || !window.crypto.subtle) {
+        return Promise.resolve(files.map(() => null));
+    }
+    
+    return new Promise(resolve => {
+        const worker = new Worker('hash-worker.js');
+        const hashes = new Array(files.length).fill(null);
+        let remaining = files.length;
+        
+        worker.onmessage = event => {
+            hashes[event.data.id] = event.data.hash;
+            if (--remaining === 0) {
+                worker.terminate();
+                resolve(hashes);
+            }
+        };
+        worker.onerror = error => {
+            console.error('Hash worker error:', error);
+            worker.terminate();
+            resolve(files.map(() => null));
+        };
+        
+        files.forEach((file, id) => worker.postMessage({ id, file }));
+    });
+}
+
+async function requestUploadUrls(files, hashes) {
+    // One API call per batch of files instead of one per file
+    const batchSize = CONFIG.upload.urlBatchSize;
+    const uploads = [];
+    
+    for (let start = 0; start < files.length; start += batchSize) {
+        const batch = files.slice(start, start + batchSize);
+        const batchHashes = hashes.slice(start, start + batchSize);
+        const response = await fetch(`${CONFIG.api.baseUrl}${CONFIG.api.endpoints.upload}`, {
+            method: 'POST',
+            headers: {
+                'Authorization': `Bearer ${jwtToken}`,
+                'Content-Type': 'application/json'
+            },
+            body: JSON.stringify({
+                uploadMethod: 'POST',  // S3 enforces size and type via the signed policy
+                files: batch.map((file, i) => ({
+                    filename: file.name,
+                    contentType: file.type,
+                    fileSize: file.size,
+                    ...(batchHashes[i] ? { sha256: batchHashes[i] } : {})
+                }))
+            })
+        });
+        
+        if (!response.ok) {
+            throw new Error('Failed to get upload URLs');
+        }
+        
+        const data = await response.json();
+        // Server indexes are relative to the batch
+        (data.uploads || []).forEach(upload => {
+            uploads.push({ ...upload, index: start + upload.index });
+        });
+    }
+    
+    return uploads;
+}
+
+async function uploadFile(file, upload, options = {}) {
+    if (upload.uploadMethod === 'POST') {
+        // Policy fields must precede the file in the form
+        const formData = new FormData();
+        Object.entries(upload.fields).forEach(([name, value]) => formData.append(name, value));
+        formData.append('file', file);
+        
+        await sendRequest({
+            method: 'POST',
+            url: upload.uploadUrl,
+            body: formData,
+            signal: options.signal,
+            onProgress: options.onProgress
+        });
+    } else {
+        await sendRequest({
+            method: 'PUT',
+            url: upload.uploadUrl,
+            headers: {
+                'Content-Type': file.type
+            },
+            body: file,
+            signal: options.signal,
+            onProgress: options.onProgress
+        });
+    }
+    
+    return upload;
+}
+
+async function uploadFileWithRefresh(file, upload, sha256, options) {
+    try {
+        return await uploadFile(file, upload, options);
+    } catch (error) {
+        // The pre-signed URL may have expired while queued; get a fresh one
+        if (error.status !== 403) throw error;
+        const [fresh] = await requestUploadUrls([file], [sha256]);
+        if (fresh.error) throw new Error(fresh.error);
+        if (fresh.duplicate) return fresh;
+        return uploadFile(file, fresh, options);
+    }
 }
 
-async function uploadFile(file) {
-    // Step 1: Get pre-signed URL
+async function postUploadAction(payload) {
     const response = await fetch(`${CONFIG.api.baseUrl}${CONFIG.api.endpoints.upload}`, {
         method: 'POST',
         headers: {
             'Authorization': `Bearer ${jwtToken}`,
             'Content-Type': 'application/json'
         },
-        body: JSON.stringify({
-            filename: file.name,
-            contentType: file.type,
-            fileSize: file.size
-        })
+        body: JSON.stringify(payload)
     });
     
+    const data = await response.json();
     if (!response.ok) {
-        throw new Error('Failed to get upload URL');
+        throw new Error(data.error || 'Upload request failed');
     }
+    return data;
+}
+
+async function uploadFileMultipart(file, sha256, options = {}) {
+    // Step 1: Start the multipart upload and get a URL per part
+    const upload = await postUploadAction({
+        action: 'createMultipart',
+        filename: file.name,
+        contentType: file.type,
+        fileSize: file.size,
+        ...(sha256 ? { sha256 } : {})
+    });
     
-    const data = await response.json();
+    if (upload.duplicate) {
+        return upload;
+    }
     
-    // Step 2: Upload to S3
-    const uploadResponse = await fetch(data.uploadUrl, {
-        method: 'PUT',
-        headers: {
-            'Content-Type': file.type
-        },
-        body: file
+    const partUrls = {};
+    upload.parts.forEach(part => {
+        partUrls[part.partNumber] = part.uploadUrl;
     });
+    const partNumbers = upload.parts.map(part => part.partNumber);
+    const completedParts = [];
+    const partProgress = {};
+    
+    const reportProgress = () => {
+        if (!options.onProgress) return;
+        const loaded = Object.values(partProgress).reduce((sum, bytes) => sum + bytes, 0);
+        options.onProgress(loaded, file.size);
+    };
     
-    if (!uploadResponse.ok) {
-        throw new Error('Failed to upload to S3');
+    // Step 2: Upload parts in parallel; a failed part is retried on its own
+    async function uploadPart(partNumber) {
+        const start = (partNumber - 1) * upload.partSize;
+        const blob = file.slice(start, start + upload.partSize);
+        
+        for (let attempt = 0; attempt <= CONFIG.upload.partRetries; attempt++) {
+            try {
+                if (attempt > 0) {
+                    await sleep(CONFIG.upload.retryDelay * Math.pow(2, attempt - 1), options.signal);
+                    
+                    // Refresh the URL in case it expired
+                    const refreshed = await postUploadAction({
+                        action: 'presignParts',
+                        key: upload.key,
+                        uploadId: upload.uploadId,
+                        partNumbers: [partNumber]
+                    });
+                    partUrls[partNumber] = refreshed.parts[0].uploadUrl;
+                }
+                
+                const xhr = await sendRequest({
+                    method: 'PUT',
+                    url: partUrls[partNumber],
+                    body: blob,
+                    signal: options.signal,
+                    onProgress: loaded => {
+                        partProgress[partNumber] = loaded;
+                        reportProgress();
+                    }
+                });
+                
+                partProgress[partNumber] = blob.size;
+                reportProgress();
+                completedParts.push({ partNumber, etag: xhr.getResponseHeader('ETag') });
+                return;
+            } catch (error) {
+                partProgress[partNumber] = 0;
+                if (error.name === 'AbortError' || attempt === CONFIG.upload.partRetries) throw error;
+            }
+        }
+    }
+    
+    const queue = partNumbers.slice();
+    const workers = Array.from({ length: Math.min(CONFIG.upload.partConcurrency, queue.length) }, async () => {
+        while (queue.length > 0) {
+            await uploadPart(queue.shift());
+        }
+    });
+    
+    try {
+        await Promise.all(workers);
+    } catch (error) {
+        // Release the stored parts; the lifecycle rule is the backstop
+        queue.length = 0;
+        postUploadAction({ action: 'abortMultipart', key: upload.key, uploadId: upload.uploadId })
+            .catch(abortError => console.error('Abort failed:', abortError));
+        throw error;
     }
+    
+    // Step 3: Stitch the parts together
+    await postUploadAction({
+        action: 'completeMultipart',
+        key: upload.key,
+        uploadId: upload.uploadId,
+        parts: completedParts
+    });
+    
+    return upload;
 }
 
 // Modal Functions
@@ -615,6 +1523,7 @@ function downloadImage() {
 
 async function deleteCurrentImage() {
     if (!currentImageId) return;
+    const imageId = currentImageId;
     
     if (!confirm('Are you sure you want to delete this image? This cannot be undone.')) {
         return;
@@ -623,7 +1532,7 @@ async function deleteCurrentImage() {
     showLoading();
     
     try {
-        const response = await fetch(`${CONFIG.api.baseUrl}${CONFIG.api.endpoints.delete}/${currentImageId}`, {
+        const response = await fetch(`${CONFIG.api.baseUrl}${CONFIG.api.endpoints.delete}/${imageId}`, {
             method: 'DELETE',
             headers: {
                 'Authorization': `Bearer ${jwtToken}`
@@ -634,6 +1543,11 @@ async function deleteCurrentImage() {
             throw new Error('Failed to delete image');
         }
         
+        if (libraryStore) {
+            await libraryStore.remove(imageId).catch(error => console.error('Error updating library:', error));
+            searchIndex = null;
+        }
+        searchCache.clear();
         closeModal();
         loadGallery();
         
@@ -645,6 +1559,47 @@ async function deleteCurrentImage() {
     }
 }
 
+// Shows photos that look like the open one (perceptual hash neighbours)
+async function showSimilarImages() {
+    if (!currentImageId) return;
+    const imageId = currentImageId;
+    const generation = ++searchGeneration;
+    
+    showLoading();
+    
+    try {
+        const url = `${CONFIG.api.baseUrl}${CONFIG.api.endpoints.similar}/${imageId}/similar?limit=${CONFIG.gallery.pageSize}`;
+        const response = await fetch(url, {
+            headers: {
+                'Authorization': `Bearer ${jwtToken}`
+            }
+        });
+        
+        if (!response.ok) {
+            throw new Error('Failed to find similar images');
+        }
+        
+        const data = await response.json();
+        if (generation !== searchGeneration) return;
+        
+        closeModal();
+        replaceGalleryPager(createPager(null, {})).hasMore = false;  // One ranked page
+        currentImages = data.images || [];
+        displayGallery(currentImages);
+        updatePhotoCount();
+        
+        if (currentImages.length === 0) {
+            alert(data.message || 'No similar photos found');
+        }
+        
+    } catch (error) {
+        console.error('Similar images error:', error);
+        alert('Failed to find similar images: ' + error.message);
+    } finally {
+        hideLoading();
+    }
+}
+
 // Helper Functions
 function showLoading() {
     document.getElementById('loading').style.display = 'flex';
@@ -662,6 +1617,7 @@ function showGalleryLoading() {
     // Show spinner in gallery
     const gallery = document.getElementById('gallery');
     if (gallery) {
+        if (typeof resetGalleryContainer === 'function') resetGalleryContainer(gallery);
         gallery.innerHTML = '<div style="grid-column: 1/-1; text-align: center; padding: 40px;"><div class="spinner"></div></div>';
     }
 }
@@ -14,10 +14,59 @@ const CONFIG = {
             upload: '/upload',
             images: '/images',
             search: '/images/search',
-            delete: '/images'  // + /{imageId}
+            changes: '/images/changes',
+            tags: '/tags',
+            facets: '/images/facets',
+            delete: '/images',  // + /{imageId}
+            similar: '/images'  // + /{imageId}/similar
         }
     },
     
+    upload: {
+        urlBatchSize: 200,                        // Matches MAX_BATCH_SIZE in GetUploadUrl
+        maxFileSize: 200 * 1024 * 1024,           // Matches MAX_MULTIPART_FILE_SIZE
+        multipartThreshold: 10 * 1024 * 1024,     // Larger files use multipart upload
+        partConcurrency: 4,
+        partRetries: 3,
+        concurrency: 4,                           // Files uploaded at once
+        retries: 3,                               // Per-file retries on network/5xx errors
+        retryDelay: 1000,                         // Base backoff in ms (doubles per attempt)
+        pollDelay: 1500,                          // First check for processed uploads
+        pollAttempts: 6,
+        preprocess: {
+            enabled: true,                        // Downscale before upload unless originals are kept
+            maxEdge: 2560,                        // Longest edge in px
+            quality: 0.85                         // JPEG re-encode quality
+        }
+    },
+    
+    gallery: {
+        pageSize: 50,                             // Images per get-images page
+        prefetchMargin: 1500,                     // px below the viewport to start the next page
+        retryDelay: 5000,                         // Wait before retrying a failed page
+        gap: 8,                                   // px between tiles
+        overscan: 800,                            // px rendered above/below the viewport
+        rowHeights: {                             // Target justified-row heights in px
+            comfortable: { desktop: 240, mobile: 150 },
+            compact: { desktop: 160, mobile: 110 }
+        }
+    },
+    
+    search: {
+        debounceDelay: 300,                       // ms of typing pause before an API search
+        cacheSize: 30,                            // Recent queries whose first page is kept
+        suggestions: 8,                           // Tag completions shown while typing
+        facetTags: 12                             // Top tags listed in the search panel
+    },
+    
+    library: {
+        syncPageSize: 100                         // Changes per GET /images/changes page
+    },
+    
+    cache: {
+        maxRenditionBytes: 200 * 1024 * 1024      // Service worker LRU budget for cached image files
+    },
+    
     s3: {
         uploadsBucket: 'photogallery-uploads-23brs1079',
         processedBucket: 'photogallery-processed-23brs1079'
@@ -0,0 +1,200 @@
+// Virtualized, justified gallery grid
+//
+// Rows are laid out from each image's stored width/height, so positions are
+// known before any thumbnail loads. Only rows near the viewport (plus
+// overscan) are in the DOM; tiles that scroll away are recycled for the ones
+// scrolling in, and a tile that stays visible is never touched again.
+
+class VirtualGallery {
+    constructor(container, options = {}) {
+        this.container = container;
+        this.targetRowHeight = options.targetRowHeight || 240;
+        this.gap = options.gap !== undefined ? options.gap : 8;
+        this.overscan = options.overscan !== undefined ? options.overscan : 800;
+        this.renderTile = options.renderTile;
+        this.resizeTile = options.resizeTile;  // optional (node, width, height)
+
+        this.images = [];
+        this.rows = [];          // { top, height, items: [{ image, left, width }] }
+        this.height = 0;
+        this.width = 0;
+        this.mounted = new Map(); // imageId -> tile node
+        this.pool = [];           // detached tiles ready for reuse
+        this.frame = null;
+
+        this.onScroll = () => this.scheduleRender();
+        this.onResize = () => {
+            if (this.container.clientWidth !== this.width) {
+                this.layout();
+                this.scheduleRender();
+            }
+        };
+        window.addEventListener('scroll', this.onScroll, { passive: true });
+        window.addEventListener('resize', this.onResize);
+    }
+
+    setImages(images) {
+        this.images = images.slice();
+        this.prepareContainer();
+        this.layout();
+        this.render();
+    }
+
+    append(images) {
+        this.images = this.images.concat(images);
+        this.layout();
+        this.render();
+    }
+
+    setTargetRowHeight(height) {
+        if (height === this.targetRowHeight) return;
+        this.targetRowHeight = height;
+        this.layout();
+        this.render();
+    }
+
+    destroy() {
+        window.removeEventListener('scroll', this.onScroll);
+        window.removeEventListener('resize', this.onResize);
+        if (this.frame) cancelAnimationFrame(this.frame);
+        this.mounted.clear();
+        this.pool = [];
+    }
+
+    prepareContainer() {
+        // Someone else (spinner, empty state) may have replaced our content
+        this.mounted.forEach((node, imageId) => {
+            if (node.parentNode !== this.container) this.mounted.delete(imageId);
+        });
+        this.pool = this.pool.filter(node => node.parentNode === this.container);
+        Array.from(this.container.children).forEach(child => {
+            if (!child.classList.contains('gallery-item')) child.remove();
+        });
+        this.container.classList.add('virtual');
+    }
+
+    layout() {
+        this.width = this.container.clientWidth;
+        this.rows = [];
+
+        const gap = this.gap;
+        const maxWidth = this.width;
+        let row = [];
+        let ratioSum = 0;
+        let top = 0;
+
+        const closeRow = (height) => {
+            let left = 0;
+            const items = row.map(({ image, ratio }) => {
+                const width = ratio * height;
+                const item = { image, left, width };
+                left += width + gap;
+                return item;
+            });
+            this.rows.push({ top, height, items });
+            top += height + gap;
+            row = [];
+            ratioSum = 0;
+        };
+
+        this.images.forEach(image => {
+            const ratio = aspectRatio(image);
+            row.push({ image, ratio });
+            ratioSum += ratio;
+
+            // Height at which this row exactly fills the width
+            const fitHeight = (maxWidth - gap * (row.length - 1)) / ratioSum;
+            if (fitHeight <= this.targetRowHeight) {
+                closeRow(fitHeight);
+            }
+        });
+
+        // Last, incomplete row keeps the target height instead of stretching
+        if (row.length > 0) {
+            closeRow(this.targetRowHeight);
+        }
+
+        this.height = Math.max(0, top - gap);
+        this.container.style.height = `${this.height}px`;
+    }
+
+    scheduleRender() {
+        if (this.frame) return;
+        this.frame = requestAnimationFrame(() => {
+            this.frame = null;
+            this.render();
+        });
+    }
+
+    render() {
+        const rect = this.container.getBoundingClientRect();
+        const viewTop = -rect.top - this.overscan;
+        const viewBottom = -rect.top + window.innerHeight + this.overscan;
+
+        // Rows are sorted by top, so binary search the first visible one
+        let low = 0;
+        let high = this.rows.length;
+        while (low < high) {
+            const mid = (low + high) >> 1;
+            const row = this.rows[mid];
+            if (row.top + row.height < viewTop) low = mid + 1;
+            else high = mid;
+        }
+
+        const visible = new Map();
+        for (let i = low; i < this.rows.length && this.rows[i].top <= viewBottom; i++) {
+            const row = this.rows[i];
+            row.items.forEach(item => visible.set(item.image.imageId, { row, item }));
+        }
+
+        // Release tiles that left the window
+        this.mounted.forEach((node, imageId) => {
+            if (!visible.has(imageId)) {
+                this.mounted.delete(imageId);
+                node.style.display = 'none';
+                this.pool.push(node);
+            }
+        });
+
+        visible.forEach(({ row, item }, imageId) => {
+            let node = this.mounted.get(imageId);
+            if (!node) {
+                node = this.pool.pop() || this.createTile();
+                node.dataset.imageId = imageId;
+                node.style.display = '';
+                this.mounted.set(imageId, node);
+            }
+            node.style.top = `${row.top}px`;
+            node.style.left = `${item.left}px`;
+            if (node.tileWidth !== item.width || node.tileHeight !== row.height) {
+                node.tileWidth = item.width;
+                node.tileHeight = row.height;
+                node.style.width = `${item.width}px`;
+                node.style.height = `${row.height}px`;
+                if (this.resizeTile) this.resizeTile(node, item.width, row.height);
+            }
+            // Only (re)fill a tile when it shows a different image record
+            if (node.galleryImage !== item.image) {
+                node.galleryImage = item.image;
+                this.renderTile(node, item.image);
+            }
+        });
+    }
+
+    createTile() {
+        const node = document.createElement('div');
+        node.tileWidth = null;
+        node.tileHeight = null;
+        node.className = 'gallery-item';
+        this.container.appendChild(node);
+        return node;
+    }
+}
+
+function aspectRatio(image) {
+    const width = Number(image.width) || 0;
+    const height = Number(image.height) || 0;
+    if (width <= 0 || height <= 0) return 1;
+    // Clamp panoramas and slivers so one image can't dominate a row
+    return Math.min(Math.max(width / height, 0.5), 3);
+}
@@ -0,0 +1,14 @@
+// SHA-256 hashing off the main thread, used for pre-upload duplicate checks
+self.onmessage = async function(event) {
+    const { id, file } = event.data;
+    
+    try {
+        const digest = await crypto.subtle.digest('SHA-256', await file.arrayBuffer());
+        const hash = Array.from(new Uint8Array(digest))
+            .map(byte => byte.toString(16).padStart(2, '0'))
+            .join('');
+        self.postMessage({ id, hash });
+    } catch (error) {
+        self.postMessage({ id, hash: null, error: error.message });
+    }
+};
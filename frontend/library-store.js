@@ -0,0 +1,108 @@
+// Local mirror of the user's image metadata in IndexedDB
+//
+// Kept current with GET /images/changes, so startup paints from disk and
+// costs one delta query instead of re-listing the library. A stored cursor
+// means at least one full sync has finished and the mirror is complete.
+
+// Bumped when mirrors built by older code can't be trusted: 2 = the full
+// sync lists the whole library (format 1 missed images without updatedAt)
+const LIBRARY_FORMAT = 2;
+
+class LibraryStore {
+    constructor(name = 'photoinsights-library') {
+        this.name = name;
+        this.db = null;
+    }
+
+    // Opens the database for owner; another user's or an outdated mirror is discarded
+    async open(owner) {
+        this.db = await idbRequest(this.openRequest());
+        const storedOwner = await this.getMeta('owner');
+        const storedFormat = await this.getMeta('format');
+        if (storedOwner !== owner || storedFormat !== LIBRARY_FORMAT) {
+            await this.clear();
+            await this.setMeta('owner', owner);
+            await this.setMeta('format', LIBRARY_FORMAT);
+        }
+        return this;
+    }
+
+    openRequest() {
+        const request = indexedDB.open(this.name, 1);
+        request.onupgradeneeded = () => {
+            const db = request.result;
+            db.createObjectStore('images', { keyPath: 'imageId' });
+            db.createObjectStore('meta');
+        };
+        return request;
+    }
+
+    async getAll() {
+        const tx = this.db.transaction('images', 'readonly');
+        return idbRequest(tx.objectStore('images').getAll());
+    }
+
+    async getCursor() {
+        const cursor = await this.getMeta('cursor');
+        return cursor === undefined ? null : cursor;
+    }
+
+    async isComplete() {
+        return (await this.getCursor()) !== null;
+    }
+
+    // Applies one page of changes; cursor is only stored with the last page
+    async apply(changes, deleted, cursor = null) {
+        const tx = this.db.transaction(['images', 'meta'], 'readwrite');
+        const images = tx.objectStore('images');
+        changes.forEach(image => images.put(image));
+        deleted.forEach(imageId => images.delete(imageId));
+        if (cursor !== null) tx.objectStore('meta').put(cursor, 'cursor');
+        return idbTransaction(tx);
+    }
+
+    async remove(imageId) {
+        const tx = this.db.transaction('images', 'readwrite');
+        tx.objectStore('images').delete(imageId);
+        return idbTransaction(tx);
+    }
+
+    // Drops images and the cursor, keeping the owner
+    async clear() {
+        const tx = this.db.transaction(['images', 'meta'], 'readwrite');
+        tx.objectStore('images').clear();
+        tx.objectStore('meta').delete('cursor');
+        return idbTransaction(tx);
+    }
+
+    close() {
+        if (this.db) this.db.close();
+        this.db = null;
+    }
+
+    async getMeta(key) {
+        const tx = this.db.transaction('meta', 'readonly');
+        return idbRequest(tx.objectStore('meta').get(key));
+    }
+
+    async setMeta(key, value) {
+        const tx = this.db.transaction('meta', 'readwrite');
+        tx.objectStore('meta').put(value, key);
+        return idbTransaction(tx);
+    }
+}
+
+function idbRequest(request) {
+    return new Promise((resolve, reject) => {
+        request.onsuccess = () => resolve(request.result);
+        request.onerror = () => reject(request.error);
+    });
+}
+
+function idbTransaction(tx) {
+    return new Promise((resolve, reject) => {
+        tx.oncomplete = () => resolve();
+        tx.onerror = () => reject(tx.error);
+        tx.onabort = () => reject(tx.error);
+    });
+}
@@ -0,0 +1,30 @@
+// Pre-upload downscaling: caps the longest edge and re-encodes off the main thread
+let queue = Promise.resolve();
+
+self.onmessage = function(event) {
+    // One image at a time; decoding several 48 MP photos at once exhausts memory
+    queue = queue.then(() => resizeImage(event.data));
+};
+
+async function resizeImage({ id, file, maxEdge, quality }) {
+    try {
+        const bitmap = await createImageBitmap(file, { imageOrientation: 'from-image' });
+        const scale = Math.min(1, maxEdge / Math.max(bitmap.width, bitmap.height));
+        const width = Math.round(bitmap.width * scale);
+        const height = Math.round(bitmap.height * scale);
+        
+        const canvas = new OffscreenCanvas(width, height);
+        const context = canvas.getContext('2d');
+        context.imageSmoothingQuality = 'high';
+        context.drawImage(bitmap, 0, 0, width, height);
+        bitmap.close();
+        
+        // PNG keeps its alpha channel; everything else becomes JPEG
+        const type = file.type === 'image/png' ? 'image/png' : 'image/jpeg';
+        const blob = await canvas.convertToBlob({ type, quality });
+        
+        self.postMessage({ id, blob, width, height });
+    } catch (error) {
+        self.postMessage({ id, blob: null, error: error.message });
+    }
+}
@@ -0,0 +1,97 @@
+// In-browser inverted index over the local metadata mirror
+//
+// Tags (detected and derived) and filename tokens map to posting sets of imageIds; the term list is
+// kept sorted so a partially typed word is a prefix range found by binary
+// search. Face/text flags are precomputed sets and dates are checked on the
+// (already small) candidate set.
+//
+// Term matching is deliberately looser than search-images, which matches
+// whole tags only (tags/derivedTags contains the term) and ignores
+// filenames in its tags parameter. Here a term matches every tag or
+// filename word it is a prefix of, so results keep up while a word is
+// still being typed; a local search can return more images than the same
+// search answered by the server.
+
+class SearchIndex {
+    constructor(images) {
+        this.images = new Map();
+        this.postings = new Map();   // term -> Set(imageId)
+        this.withFaces = new Set();
+        this.withText = new Set();
+
+        images.forEach(image => this.add(image));
+        this.terms = Array.from(this.postings.keys()).sort();
+    }
+
+    add(image) {
+        const imageId = image.imageId;
+        this.images.set(imageId, image);
+
+        const tags = (image.tags || []).concat(image.derivedTags || []);
+        const terms = new Set(tags.map(tag => String(tag).toLowerCase()));
+        tokenize(image.imageName).forEach(token => terms.add(token));
+        terms.forEach(term => {
+            if (!this.postings.has(term)) this.postings.set(term, new Set());
+            this.postings.get(term).add(imageId);
+        });
+
+        const ai = image.aiAnalysis || {};
+        if (Number(ai.faceCount) > 0) this.withFaces.add(imageId);
+        if (ai.hasText) this.withText.add(imageId);
+    }
+
+    // Images whose tags or filename words start with the prefix
+    matchPrefix(prefix) {
+        const matches = new Set();
+        let low = 0;
+        let high = this.terms.length;
+        while (low < high) {
+            const mid = (low + high) >> 1;
+            if (this.terms[mid] < prefix) low = mid + 1;
+            else high = mid;
+        }
+        for (let i = low; i < this.terms.length && this.terms[i].startsWith(prefix); i++) {
+            this.postings.get(this.terms[i]).forEach(imageId => matches.add(imageId));
+        }
+        return matches;
+    }
+
+    // Any of the terms (as prefixes, see above), and every filter, like
+    // search-images' tags/hasFaces/hasText/dateFrom/dateTo parameters.
+    // dateFrom/dateTo are inclusive Unix timestamps (seconds).
+    query({ terms = [], hasFaces = false, hasText = false, dateFrom = null, dateTo = null }) {
+        let candidates = null;
+
+        const prefixes = terms.map(term => term.toLowerCase()).filter(Boolean);
+        if (prefixes.length > 0) {
+            candidates = new Set();
+            prefixes.forEach(prefix => {
+                this.matchPrefix(prefix).forEach(imageId => candidates.add(imageId));
+            });
+        }
+
+        // Intersect starting from the smallest set
+        const sets = [];
+        if (hasFaces) sets.push(this.withFaces);
+        if (hasText) sets.push(this.withText);
+        if (candidates) sets.push(candidates);
+        sets.sort((a, b) => a.size - b.size);
+
+        let ids = sets.length > 0 ? Array.from(sets[0]) : Array.from(this.images.keys());
+        sets.slice(1).forEach(set => {
+            ids = ids.filter(imageId => set.has(imageId));
+        });
+
+        return ids
+            .map(imageId => this.images.get(imageId))
+            .filter(image => {
+                const uploaded = Number(image.uploadTimestamp) || 0;
+                return (dateFrom === null || uploaded >= dateFrom) && (dateTo === null || uploaded <= dateTo);
+            })
+            .sort((a, b) => (b.uploadTimestamp - a.uploadTimestamp) || (a.imageId < b.imageId ? -1 : 1));
+    }
+}
+
+function tokenize(text) {
+    return String(text || '').toLowerCase().split(/[^\p{L}\p{N}]+/u).filter(Boolean);
+}
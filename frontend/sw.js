@@ -0,0 +1,245 @@
+// Service worker: offline app shell, cache-first renditions, stale-while-revalidate gallery API
+importScripts('config.js');
+
+const SHELL_CACHE = 'shell-v3';
+const RENDITION_CACHE = 'renditions-v1';
+const API_CACHE = 'api-v1';
+
+const SHELL_FILES = [
+    './',
+    'index.html',
+    'styles.css',
+    'config.js',
+    'upload-queue.js',
+    'library-store.js',
+    'search-index.js',
+    'gallery-grid.js',
+    'ui.js',
+    'app.js',
+    'hash-worker.js',
+    'resize-worker.js',
+    'logo.png'
+];
+
+const API_ORIGIN = new URL(CONFIG.api.baseUrl).origin;
+const API_PATH = new URL(CONFIG.api.baseUrl).pathname;
+const IMAGES_PATH = API_PATH + CONFIG.api.endpoints.images;
+
+// Rendition URLs touched during this worker's lifetime (see touchRendition)
+const touched = new Set();
+
+// Promise of rendition URL -> size in bytes, read from the cache once per
+// worker lifetime and kept up to date as entries are added and removed
+let renditionSizes = null;
+
+self.addEventListener('install', event => {
+    event.waitUntil(
+        caches.open(SHELL_CACHE)
+            .then(cache => cache.addAll(SHELL_FILES))
+            .then(() => self.skipWaiting())
+    );
+});
+
+self.addEventListener('activate', event => {
+    const current = [SHELL_CACHE, RENDITION_CACHE, API_CACHE];
+    event.waitUntil(
+        caches.keys()
+            .then(names => Promise.all(names.filter(name => !current.includes(name)).map(name => caches.delete(name))))
+            .then(() => self.clients.claim())
+    );
+});
+
+self.addEventListener('fetch', event => {
+    const request = event.request;
+    const url = new URL(request.url);
+
+    if (url.origin === API_ORIGIN && url.pathname.startsWith(API_PATH)) {
+        if (request.method === 'GET' && url.pathname === IMAGES_PATH) {
+            event.respondWith(staleWhileRevalidate(event));
+        } else if (request.method !== 'GET') {
+            event.respondWith(invalidateAfter(request, url));
+        }
+        return;
+    }
+
+    if (request.method !== 'GET') return;
+
+    if (url.pathname.includes('/processed/')) {
+        event.respondWith(cacheFirst(event));
+    } else if (url.origin === self.location.origin) {
+        event.respondWith(networkFirst(request));
+    }
+});
+
+self.addEventListener('message', event => {
+    const message = event.data || {};
+    if (message.type === 'clear-user-data') {
+        touched.clear();
+        renditionSizes = null;
+        event.waitUntil(Promise.all([caches.delete(API_CACHE), caches.delete(RENDITION_CACHE)]));
+    }
+});
+
+// Renditions: immutable per imageId, so cache-first with an LRU byte budget
+async function cacheFirst(event) {
+    const request = event.request;
+    const cache = await caches.open(RENDITION_CACHE);
+    const cached = await cache.match(request.url);
+
+    if (cached) {
+        event.waitUntil(touchRendition(cache, request.url, cached));
+        return cached;
+    }
+
+    const response = await fetch(request);
+    // Opaque (no-CORS) responses are padded to several MB by quota accounting
+    if (response.ok && response.type !== 'opaque') {
+        event.waitUntil(storeRendition(cache, request.url, response.clone()));
+    }
+    return response;
+}
+
+// Cache keys are kept in insertion order, so re-inserting an entry on use
+// moves it to the back; trimming drops from the front (least recently used).
+// Each entry is touched at most once per worker lifetime to keep hits cheap.
+async function touchRendition(cache, url, response) {
+    if (touched.has(url)) return;
+    touched.add(url);
+    const copy = response.clone();
+    await cache.delete(url);
+    await cache.put(url, copy);
+}
+
+async function storeRendition(cache, url, response) {
+    const bytes = await responseBytes(response.clone());
+    const sizes = await loadRenditionSizes(cache);
+    await cache.put(url, response);
+    sizes.set(url, bytes);
+    await trimCache(cache, CONFIG.cache.maxRenditionBytes);
+}
+
+// Content-Length when the server sent it, otherwise the body's size
+async function responseBytes(response) {
+    const length = Number(response.headers.get('Content-Length'));
+    return length > 0 ? length : (await response.blob()).size;
+}
+
+function loadRenditionSizes(cache) {
+    if (!renditionSizes) {
+        renditionSizes = cache.keys().then(async keys => {
+            const sizes = new Map();
+            for (const key of keys) {
+                const cached = await cache.match(key);
+                if (cached) sizes.set(key.url, await responseBytes(cached));
+            }
+            return sizes;
+        });
+    }
+    return renditionSizes;
+}
+
+// Drops least recently used entries until the cache fits in maxBytes
+async function trimCache(cache, maxBytes) {
+    const sizes = await loadRenditionSizes(cache);
+    const keys = await cache.keys();
+    let total = keys.reduce((sum, key) => sum + (sizes.get(key.url) || 0), 0);
+    for (let i = 0; i < keys.length && total > maxBytes; i++) {
+        total -= sizes.get(keys[i].url) || 0;
+        sizes.delete(keys[i].url);
+        touched.delete(keys[i].url);
+        await cache.delete(keys[i]);
+    }
+}
+
+// Gallery pages: answer from cache immediately and refresh in the background.
+// Requests made with cache: 'no-store' (refresh, post-upload polling) skip the
+// cached copy but still update it.
+async function staleWhileRevalidate(event) {
+    const request = event.request;
+    const cache = await caches.open(API_CACHE);
+    const cacheKey = apiCacheKey(request);
+    const cached = request.cache === 'no-store' ? null : await cache.match(cacheKey);
+
+    const network = fetch(request).then(async response => {
+        if (response.ok) {
+            const body = await response.clone().text();
+            const previous = cached ? await cached.clone().text() : null;
+            await cache.put(cacheKey, response.clone());
+            if (previous !== null && previous !== body) {
+                notifyClients({ type: 'api-updated', url: request.url });
+            }
+        }
+        return response;
+    });
+
+    if (cached) {
+        event.waitUntil(network.catch(() => {}));
+        return cached;
+    }
+    return network;
+}
+
+// Writes through the API (upload URLs, deletes) make cached pages stale
+async function invalidateAfter(request, url) {
+    const response = await fetch(request);
+    if (response.ok) {
+        const imagesPrefix = IMAGES_PATH + '/';
+        const imageId = request.method === 'DELETE' && url.pathname.startsWith(imagesPrefix)
+            ? decodeURIComponent(url.pathname.slice(imagesPrefix.length))
+            : null;
+        await invalidateImages(imageId ? [imageId] : []);
+    }
+    return response;
+}
+
+async function invalidateImages(imageIds) {
+    await caches.delete(API_CACHE);
+    if (imageIds.length === 0) return;
+
+    const cache = await caches.open(RENDITION_CACHE);
+    const sizes = await loadRenditionSizes(cache);
+    const keys = await cache.keys();
+    await Promise.all(keys
+        .filter(key => imageIds.some(imageId => key.url.includes(imageId)))
+        .map(key => {
+            touched.delete(key.url);
+            sizes.delete(key.url);
+            return cache.delete(key);
+        }));
+}
+
+// Responses depend on the caller, so key them by the token's subject
+function apiCacheKey(request) {
+    const key = new URL(request.url);
+    key.searchParams.set('__user', tokenSubject(request.headers.get('Authorization')));
+    return key.toString();
+}
+
+function tokenSubject(authorization) {
+    try {
+        const payload = (authorization || '').replace(/^Bearer\s+/, '').split('.')[1];
+        const json = atob(payload.replace(/-/g, '+').replace(/_/g, '/'));
+        return JSON.parse(json).sub || 'anonymous';
+    } catch (error) {
+        return 'anonymous';
+    }
+}
+
+// App shell: prefer fresh files, fall back to the cached copy offline
+async function networkFirst(request) {
+    const cache = await caches.open(SHELL_CACHE);
+    try {
+        const response = await fetch(request);
+        if (response.ok) await cache.put(request, response.clone());
+        return response;
+    } catch (error) {
+        const cached = await cache.match(request, { ignoreSearch: true });
+        if (cached) return cached;
+        throw error;
+    }
+}
+
+async function notifyClients(message) {
+    const clients = await self.clients.matchAll({ type: 'window' });
+    clients.forEach(client => client.postMessage(message));
+}
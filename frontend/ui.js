@@ -64,6 +64,7 @@ function showSearch(event) {
         event.currentTarget.classList.add('active');
     }
     document.getElementById('search-panel').classList.add('show');
+    if (typeof loadFacets === 'function') loadFacets();
 }
 
 function closeSearch() {
@@ -82,17 +83,25 @@ function showPhotos(event) {
 }
 
 // View Toggle
-function setView(viewType) {
+function setView(viewType, clickEvent) {
     const gallery = document.getElementById('gallery');
-    gallery.className = 'gallery ' + viewType + '-view';
+    gallery.classList.remove('comfortable-view', 'compact-view');
+    gallery.classList.add(viewType + '-view');
     
     // Update active button
     document.querySelectorAll('.view-toggle .icon-btn').forEach(btn => {
         btn.classList.remove('active');
     });
-    event.currentTarget.classList.add('active');
+    const activeEvent = clickEvent || window.event;
+    if (activeEvent && activeEvent.currentTarget && activeEvent.currentTarget.classList) {
+        activeEvent.currentTarget.classList.add('active');
+    }
     
     localStorage.setItem('galleryView', viewType);
+    
+    if (galleryGrid) {
+        galleryGrid.setTargetRowHeight(getTargetRowHeight());
+    }
 }
 
 // Load saved view preference
@@ -113,11 +122,14 @@ function updateShowApp(email) {
     userInitials.forEach(el => el.textContent = initial);
 }
 
-// Enhanced Image Display for Gallery
+// Enhanced Image Display for Gallery (virtualized, see gallery-grid.js)
+let galleryGrid = null;
+
 function displayGalleryNew(images) {
     const gallery = document.getElementById('gallery');
     
     if (!images || images.length === 0) {
+        resetGalleryContainer(gallery);
         gallery.innerHTML = `
             <div class="empty-state">
                 <span class="material-icons">photo_library</span>
@@ -132,33 +144,119 @@ function displayGalleryNew(images) {
         return;
     }
     
-    gallery.innerHTML = images.map(image => {
-        const tags = (image.tags || []).slice(0, 3);
-        const tagsHTML = tags.map(tag => 
-            `<span class="tag-chip-small">${tag}</span>`
-        ).join('');
-        
-        return `
-            <div class="gallery-item" onclick="openModal('${image.imageId}')">
-                <img src="${image.urls.thumbnail}" alt="${image.imageName}" loading="lazy">
-                <div class="gallery-item-overlay">
-                    <div class="gallery-item-info">
-                        <div>${image.imageName}</div>
-                        ${tagsHTML ? `<div class="gallery-item-tags">${tagsHTML}</div>` : ''}
-                    </div>
-                </div>
-            </div>
-        `;
-    }).join('');
+    getGalleryGrid(gallery).setImages(images);
     
     // Update title
     document.getElementById('gallery-title').textContent = `Your Photos`;
-    document.getElementById('photo-count').textContent = `${images.length} photo${images.length !== 1 ? 's' : ''}`;
+}
+
+// Append the next page of images without re-rendering the rest
+function appendGalleryNew(images) {
+    const gallery = document.getElementById('gallery');
+    if (!galleryGrid || gallery.querySelector('.empty-state')) {
+        displayGalleryNew(currentImages);
+        return;
+    }
+    galleryGrid.append(images);
+}
+
+function getGalleryGrid(gallery) {
+    if (!galleryGrid) {
+        galleryGrid = new VirtualGallery(gallery, {
+            targetRowHeight: getTargetRowHeight(),
+            gap: CONFIG.gallery.gap,
+            overscan: CONFIG.gallery.overscan,
+            renderTile: renderGalleryTile,
+            resizeTile: (node, width) => {
+                // Tile widths are exact, so the browser can pick the smallest
+                // rendition that covers width x devicePixelRatio
+                const img = node.querySelector('img');
+                if (img) img.sizes = `${Math.ceil(width)}px`;
+            }
+        });
+        // One delegated listener instead of one per tile
+        gallery.addEventListener('click', event => {
+            const tile = event.target.closest('.gallery-item');
+            if (tile && tile.dataset.imageId) openModal(tile.dataset.imageId);
+        });
+    }
+    return galleryGrid;
+}
+
+function resetGalleryContainer(gallery) {
+    gallery.classList.remove('virtual');
+    gallery.style.height = '';
+}
+
+function getTargetRowHeight() {
+    const view = localStorage.getItem('galleryView') || 'comfortable';
+    const heights = CONFIG.gallery.rowHeights[view] || CONFIG.gallery.rowHeights.comfortable;
+    return window.innerWidth <= 768 ? heights.mobile : heights.desktop;
+}
+
+function renderGalleryTile(node, image) {
+    node.innerHTML = `
+        <img alt="" loading="lazy" decoding="async" crossorigin="anonymous">
+        <div class="gallery-item-overlay">
+            <div class="gallery-item-info">
+                <div class="gallery-item-name"></div>
+                <div class="gallery-item-tags"></div>
+            </div>
+        </div>
+    `;
+    // Dominant color from the API fills the tile until the thumbnail loads
+    node.style.backgroundColor = (image.palette && image.palette[0]) || '';
+    const img = node.querySelector('img');
+    applyResponsiveImage(img, image, node.tileWidth);
+    img.alt = image.imageName;
+    node.querySelector('.gallery-item-name').textContent = image.imageName;
+    
+    const tagsEl = node.querySelector('.gallery-item-tags');
+    const tags = (image.tags || []).slice(0, 3);
+    if (tags.length === 0) {
+        tagsEl.remove();
+    }
+    tags.forEach(tag => {
+        const chip = document.createElement('span');
+        chip.className = 'tag-chip-small';
+        chip.textContent = tag;
+        tagsEl.appendChild(chip);
+    });
+}
+
+// Responsive images: srcset from the rendition manifest returned by the API
+function buildSrcset(image) {
+    return (image.renditions || [])
+        .map(rendition => `${rendition.url} ${rendition.width}w`)
+        .join(', ');
+}
+
+function applyResponsiveImage(img, image, displayWidth) {
+    const srcset = buildSrcset(image);
+    // sizes must be set before srcset so the first pick uses it
+    img.sizes = displayWidth ? `${Math.ceil(displayWidth)}px` : '100vw';
+    if (srcset) {
+        img.srcset = srcset;
+    } else {
+        img.removeAttribute('srcset');
+    }
+    img.src = image.urls.thumbnail;
+}
+
+// Width the modal will actually draw the image at (object-fit: contain)
+function modalDisplayWidth(image) {
+    const container = document.querySelector('.modal-image');
+    if (!container || !image.width || !image.height) return window.innerWidth;
+    const availableWidth = container.clientWidth - 80;   // 40px padding each side
+    const availableHeight = container.clientHeight - 80;
+    return Math.max(1, Math.min(availableWidth, availableHeight * image.width / image.height, image.width));
 }
 
 // Enhanced Modal Display
 function displayModalNew(image) {
-    document.getElementById('modal-img').src = image.urls.large;
+    const modalImg = document.getElementById('modal-img');
+    modalImg.removeAttribute('srcset');
+    modalImg.removeAttribute('src');
     document.getElementById('modal-filename').textContent = image.imageName;
     document.getElementById('modal-filesize').textContent = formatFileSize(image.fileSize);
     document.getElementById('modal-date').textContent = formatDate(image.uploadTimestamp);
@@ -202,6 +300,13 @@ function displayModalNew(image) {
     
     document.getElementById('image-modal').classList.add('show');
     currentImageId = image.imageId;
+    
+    // Size the request once the modal is laid out
+    requestAnimationFrame(() => {
+        if (currentImageId !== image.imageId) return;
+        applyResponsiveImage(modalImg, image, modalDisplayWidth(image));
+        if (!modalImg.srcset) modalImg.src = image.urls.large;
+    });
 }
 
 // Helper Functions
@@ -234,5 +339,6 @@ window.closeSearch = closeSearch;
 window.showPhotos = showPhotos;
 window.setView = setView;
 window.displayGalleryNew = displayGalleryNew;
+window.appendGalleryNew = appendGalleryNew;
 window.displayModalNew = displayModalNew;
 window.updateShowApp = updateShowApp;
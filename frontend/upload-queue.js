@@ -0,0 +1,160 @@
+// Upload queue: bounded concurrency, retry with backoff, cancellation
+
+class UploadQueue {
+    constructor(options = {}) {
+        this.concurrency = options.concurrency || 4;
+        this.retries = options.retries !== undefined ? options.retries : 3;
+        this.retryDelay = options.retryDelay || 1000;
+        this.pending = [];
+        this.active = 0;
+        this.jobs = new Set();
+    }
+
+    // run(signal) must return a promise and honour the abort signal.
+    // Returns { promise, cancel }.
+    add(run, options = {}) {
+        const controller = new AbortController();
+        const job = {
+            run,
+            controller,
+            retries: options.retries !== undefined ? options.retries : this.retries
+        };
+
+        job.promise = new Promise((resolve, reject) => {
+            job.resolve = resolve;
+            job.reject = reject;
+        });
+        job.cancel = () => controller.abort();
+
+        // Cancelling a job that hasn't started yet rejects it straight away
+        controller.signal.addEventListener('abort', () => {
+            const index = this.pending.indexOf(job);
+            if (index !== -1) {
+                this.pending.splice(index, 1);
+                this.jobs.delete(job);
+                job.reject(createAbortError());
+            }
+        });
+
+        this.jobs.add(job);
+        this.pending.push(job);
+        this._next();
+
+        return { promise: job.promise, cancel: job.cancel };
+    }
+
+    cancelAll() {
+        Array.from(this.jobs).forEach(job => job.cancel());
+    }
+
+    _next() {
+        while (this.active < this.concurrency && this.pending.length > 0) {
+            const job = this.pending.shift();
+            this.active++;
+            this._execute(job).finally(() => {
+                this.active--;
+                this.jobs.delete(job);
+                this._next();
+            });
+        }
+    }
+
+    async _execute(job) {
+        const signal = job.controller.signal;
+
+        for (let attempt = 0; ; attempt++) {
+            try {
+                job.resolve(await job.run(signal));
+                return;
+            } catch (error) {
+                if (signal.aborted || attempt >= job.retries || !isRetryableError(error)) {
+                    job.reject(signal.aborted ? createAbortError() : error);
+                    return;
+                }
+
+                // Exponential backoff with jitter
+                const delay = this.retryDelay * Math.pow(2, attempt) * (0.5 + Math.random());
+                try {
+                    await sleep(delay, signal);
+                } catch (abortError) {
+                    job.reject(abortError);
+                    return;
+                }
+            }
+        }
+    }
+}
+
+// XHR-based request so uploads can report progress (fetch can't)
+function sendRequest({ method, url, body, headers = {}, signal, onProgress }) {
+    return new Promise((resolve, reject) => {
+        if (signal && signal.aborted) {
+            reject(createAbortError());
+            return;
+        }
+
+        const xhr = new XMLHttpRequest();
+        xhr.open(method, url);
+        Object.entries(headers).forEach(([name, value]) => xhr.setRequestHeader(name, value));
+
+        if (onProgress) {
+            xhr.upload.onprogress = event => {
+                if (event.lengthComputable) onProgress(event.loaded, event.total);
+            };
+        }
+
+        const onAbort = () => xhr.abort();
+        if (signal) signal.addEventListener('abort', onAbort);
+        const cleanup = () => {
+            if (signal) signal.removeEventListener('abort', onAbort);
+        };
+
+        xhr.onload = () => {
+            cleanup();
+            if (xhr.status >= 200 && xhr.status < 300) {
+                resolve(xhr);
+            } else {
+                const error = new Error(`Request failed with status ${xhr.status}`);
+                error.status = xhr.status;
+                reject(error);
+            }
+        };
+        xhr.onerror = () => {
+            cleanup();
+            const error = new Error('Network error');
+            error.status = 0;
+            reject(error);
+        };
+        xhr.onabort = () => {
+            cleanup();
+            reject(createAbortError());
+        };
+
+        xhr.send(body);
+    });
+}
+
+function isRetryableError(error) {
+    if (error.name === 'AbortError') return false;
+    // Network failures, throttling and server errors are worth retrying
+    return error.status === undefined || error.status === 0 ||
+        error.status === 408 || error.status === 429 || error.status >= 500;
+}
+
+function createAbortError() {
+    const error = new Error('Upload cancelled');
+    error.name = 'AbortError';
+    return error;
+}
+
+function sleep(ms, signal) {
+    return new Promise((resolve, reject) => {
+        const timer = setTimeout(resolve, ms);
+        if (signal) {
+            signal.addEventListener('abort', () => {
+                clearTimeout(timer);
+                reject(createAbortError());
+            }, { once: true });
+        }
+    });
+}
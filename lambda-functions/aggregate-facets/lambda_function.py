@@ -0,0 +1,217 @@
+"""
+Lambda Function: AggregateFacets
+Purpose: Keep per-user facet counts (faces, text, unsafe, uploads per month, face attributes) current
+Trigger: DynamoDB Stream on PhotoGallery-Images (NEW_AND_OLD_IMAGES), or direct invocation to rebuild
+"""
+
+import json
+import os
+from collections import defaultdict
+from datetime import datetime, timezone
+import boto3
+from boto3.dynamodb.conditions import Key
+from boto3.dynamodb.types import TypeDeserializer
+from botocore.exceptions import ClientError
+
+# Initialize AWS clients
+dynamodb = boto3.resource('dynamodb')
+
+# Environment variables
+DYNAMODB_TABLE = os.environ.get('DYNAMODB_TABLE', 'PhotoGallery-Images')
+
+# Per-user facet aggregate item read by SearchImages (GET /images/facets)
+FACETS_ITEM_ID = 'meta#facets'
+COUNTERS = ('imageCount', 'withFaces', 'withText', 'unsafe', 'analyzed')
+
+# Delta name prefix -> map attribute of the facets item
+MAPS = {'month:': 'months', 'face:': 'faceAttributes'}
+
+table = dynamodb.Table(DYNAMODB_TABLE)
+deserializer = TypeDeserializer()
+
+
+def lambda_handler(event, context):
+    """
+    Apply facet deltas for a batch of stream records, one record at a time.
+
+    Deltas are not idempotent, so a failed record must not make Lambda
+    retry records that were already applied: processing stops at the first
+    failure and only that record is reported (ReportBatchItemFailures on
+    the event source mapping); the retry resumes from it.
+
+    Direct invocation with {"userId": "..."} recomputes that user's facets
+    from scratch (backfill for libraries that predate the aggregate).
+    """
+
+    if 'Records' not in event:
+        return rebuild_facets(event['userId'])
+
+    applied = 0
+    for record in event['Records']:
+        try:
+            user_id, delta = record_delta(record)
+            if delta:
+                apply_delta(user_id, delta)
+                applied += 1
+        except Exception as e:
+            sequence_number = record['dynamodb']['SequenceNumber']
+            print(f"Failed to apply record {sequence_number}, stopping batch: {e}")
+            return {'batchItemFailures': [{'itemIdentifier': sequence_number}]}
+
+    print(f"Applied facet deltas for {applied} of {len(event['Records'])} records")
+    return {'batchItemFailures': []}
+
+
+def record_delta(record):
+    """(userId, facet delta) of one stream record: new contribution minus old."""
+    ddb = record.get('dynamodb', {})
+    old = deserialize(ddb.get('OldImage'))
+    new = deserialize(ddb.get('NewImage'))
+
+    user_id = (new or old or {}).get('userId')
+    delta = defaultdict(int)
+    for name, value in facet_contribution(new).items():
+        delta[name] += value
+    for name, value in facet_contribution(old).items():
+        delta[name] -= value
+    return user_id, {name: value for name, value in delta.items() if value}
+
+
+def deserialize(image):
+    """Convert a stream record image (DynamoDB JSON) to plain values."""
+    if not image:
+        return None
+    return {name: deserializer.deserialize(value) for name, value in image.items()}
+
+
+def facet_contribution(item):
+    """
+    What one item adds to its owner's facets. Only image items count;
+    hash index, tombstone and meta# items have no uploadTimestamp.
+    """
+    if not item or 'uploadTimestamp' not in item:
+        return {}
+
+    ai = item.get('aiAnalysis') or {}
+    uploaded = datetime.fromtimestamp(int(item['uploadTimestamp']), tz=timezone.utc)
+
+    contribution = {
+        'imageCount': 1,
+        'withFaces': 1 if int(ai.get('faceCount', 0)) > 0 else 0,
+        'withText': 1 if ai.get('hasText') else 0,
+        'unsafe': 1 if ai and not ai.get('isSafe', True) else 0,
+        'analyzed': 1 if item.get('analysisStatus') == 'completed' else 0,
+        f"month:{uploaded.strftime('%Y-%m')}": 1
+    }
+    for attribute in item.get('faceAttributes') or []:
+        contribution[f'face:{attribute}'] = 1
+    return contribution
+
+
+def map_entry(name):
+    """(map attribute, key) for a map delta name, or None for a counter."""
+    for prefix, attribute in MAPS.items():
+        if name.startswith(prefix):
+            return attribute, name[len(prefix):]
+    return None
+
+
+def apply_delta(user_id, delta):
+    """
+    Add the delta to the user's facets item: counters are top-level numbers
+    (ADD), months and face attributes live in maps (months keyed YYYY-MM).
+    """
+    if not delta:
+        return
+
+    names = {}
+    values = {':zero': 0}
+    add_clauses = []
+    set_clauses = []
+    for i, (name, value) in enumerate(sorted(delta.items())):
+        values[f':d{i}'] = value
+        entry = map_entry(name)
+        if entry:
+            attribute, key = entry
+            names[f'#m{i}'] = key
+            set_clauses.append(f'{attribute}.#m{i} = if_not_exists({attribute}.#m{i}, :zero) + :d{i}')
+        else:
+            add_clauses.append(f'{name} :d{i}')
+
+    expression = []
+    if set_clauses:
+        expression.append('SET ' + ', '.join(set_clauses))
+    if add_clauses:
+        expression.append('ADD ' + ', '.join(add_clauses))
+
+    update = {
+        'Key': {'userId': user_id, 'imageId': FACETS_ITEM_ID},
+        'UpdateExpression': ' '.join(expression),
+        'ExpressionAttributeValues': values
+    }
+    if names:
+        update['ExpressionAttributeNames'] = names
+
+    try:
+        table.update_item(**update)
+    except ClientError as e:
+        # A map has to exist before a key can be set inside it
+        if e.response['Error']['Code'] != 'ValidationException':
+            raise
+        ensure_maps(user_id)
+        table.update_item(**update)
+
+
+def ensure_maps(user_id):
+    """Create the facets item and/or its maps if missing."""
+    table.update_item(
+        Key={'userId': user_id, 'imageId': FACETS_ITEM_ID},
+        UpdateExpression='SET ' + ', '.join(
+            f'{attribute} = if_not_exists({attribute}, :empty)' for attribute in MAPS.values()),
+        ExpressionAttributeValues={':empty': {}}
+    )
+
+
+def rebuild_facets(user_id):
+    """
+    Recompute a user's facets from their image items and overwrite the
+    aggregate. Writes landing during the rebuild may need another run.
+    """
+    totals = defaultdict(int)
+    query_params = {
+        'IndexName': 'UploadTimeIndex',
+        'KeyConditionExpression': Key('userId').eq(user_id)
+    }
+
+    while True:
+        response = table.query(**query_params)
+        for item in response.get('Items', []):
+            for name, value in facet_contribution(item).items():
+                totals[name] += value
+        if 'LastEvaluatedKey' not in response:
+            break
+        query_params['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+    item = {'userId': user_id, 'imageId': FACETS_ITEM_ID}
+    for attribute in MAPS.values():
+        item[attribute] = {}
+    for name in COUNTERS:
+        item[name] = totals.get(name, 0)
+    for name, value in totals.items():
+        entry = map_entry(name)
+        if entry:
+            item[entry[0]][entry[1]] = value
+
+    table.put_item(Item=item)
+    print(f"Rebuilt facets for {user_id}: {item['imageCount']} images")
+
+    return {
+        'statusCode': 200,
+        'body': json.dumps({'message': 'Facets rebuilt', 'imageCount': item['imageCount']})
+    }
+
+
+# For local testing
+if __name__ == "__main__":
+    result = lambda_handler({"userId": "test-user-123"}, None)
+    print(json.dumps(result, indent=2))
@@ -6,6 +6,8 @@ Trigger: DynamoDB Stream or invoked by ProcessImage Lambda
 
 import json
 import os
+import re
+import time
 import boto3
 from decimal import Decimal
 from botocore.exceptions import ClientError
@@ -21,6 +23,37 @@ DYNAMODB_TABLE = os.environ.get('DYNAMODB_TABLE', 'PhotoGallery-Images')
 MAX_LABELS = int(os.environ.get('MAX_LABELS', '10'))
 MIN_CONFIDENCE = float(os.environ.get('MIN_CONFIDENCE', '80'))
 
+# Extra tags derived from a label (or one of its parents), lowercase.
+# TAG_SYNONYMS overrides the table with a JSON object, e.g. {"dog": ["puppy"]}
+DEFAULT_TAG_SYNONYMS = {
+    'dog': ['puppy'],
+    'cat': ['kitten'],
+    'car': ['automobile'],
+    'person': ['people'],
+    'human': ['people'],
+    'sea': ['ocean'],
+    'ocean': ['sea'],
+    'food': ['meal'],
+    'plant': ['greenery'],
+    'mountain': ['hill'],
+}
+TAG_SYNONYMS = {
+    label.lower(): [synonym.lower() for synonym in synonyms]
+    for label, synonyms in json.loads(os.environ.get('TAG_SYNONYMS') or json.dumps(DEFAULT_TAG_SYNONYMS)).items()
+}
+
+# Per-user tag dictionary item (tag -> image count, last seen) read by GetTags
+TAG_DICTIONARY_ID = 'meta#tags'
+
+# Per-user usage counters maintained with ProcessImage and DeleteImage
+STATS_ITEM_ID = 'meta#stats'
+
+# Term index over detected text and filenames: one posting item per
+# (term, image) keyed term#<term>#<imageId>, read by SearchImages
+TERM_ITEM_PREFIX = 'term#'
+TERM_LINE_GAP = 1000  # Position offset between lines so phrases never span two
+MAX_TERM_LENGTH = 64
+
 table = dynamodb.Table(DYNAMODB_TABLE)
 
 def lambda_handler(event, context):
@@ -114,6 +147,10 @@ def handle_dynamodb_stream(event):
             # New image added
             new_image = record['dynamodb']['NewImage']
             
+            # Hash index items and tombstones share the table but aren't images
+            if 'uploadTimestamp' not in new_image:
+                continue
+            
             user_id = new_image['userId']['S']
             image_id = new_image['imageId']['S']
             
@@ -166,7 +203,9 @@ def analyze_image(bucket, key):
         results['labels'] = [
             {
                 'name': label['Name'],
-                'confidence': Decimal(str(round(label['Confidence'], 2)))
+                'confidence': Decimal(str(round(label['Confidence'], 2))),
+                # Ancestors in Rekognition's taxonomy, e.g. Dog -> Animal, Pet
+                'parents': [parent['Name'] for parent in label.get('Parents', [])]
             }
             for label in labels_response['Labels']
         ]
@@ -278,16 +317,24 @@ def update_image_metadata(user_id, image_id, analysis_results):
     
     # Extract simple tag list from labels
     tags = [label['name'].lower() for label in analysis_results['labels']]
+    derived_tags = derive_tags(analysis_results['labels'])
+    face_attributes = summarize_faces(analysis_results['faces'])
+    now = int(time.time() * 1000)
     
     try:
-        table.update_item(
+        response = table.update_item(
             Key={
                 'userId': user_id,
                 'imageId': image_id
             },
-            UpdateExpression='SET tags = :tags, aiAnalysis = :ai, analysisStatus = :status',
+            UpdateExpression='SET tags = :tags, derivedTags = :derived, faceAttributes = :faceAttributes, '
+                             'aiAnalysis = :ai, analysisStatus = :status, updatedAt = :updatedAt',
+            # Don't recreate an image deleted while it was being analyzed
+            ConditionExpression='attribute_exists(imageId)',
             ExpressionAttributeValues={
                 ':tags': tags,
+                ':derived': derived_tags,
+                ':faceAttributes': face_attributes,
                 ':ai': {
                     'labels': analysis_results['labels'],
                     'faceCount': analysis_results['faceCount'],
@@ -297,15 +344,200 @@ def update_image_metadata(user_id, image_id, analysis_results):
                     'faces': analysis_results['faces'],
                     'moderationFlags': analysis_results['moderation']
                 },
-                ':status': 'completed'
-            }
+                ':status': 'completed',
+                ':updatedAt': now
+            },
+            ReturnValues='ALL_OLD'
         )
         
         print(f"✓ Updated DynamoDB for image {image_id} with {len(tags)} tags")
         
     except ClientError as e:
+        if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+            print(f"Image {image_id} was deleted before analysis finished, skipping")
+            return
         print(f"Error updating DynamoDB: {str(e)}")
         raise
+    
+    old_item = response.get('Attributes', {})
+    
+    # Re-analysis only counts the difference against the previous tags;
+    # derived tags are counted too so broad terms get completions
+    new_tags = set(tags) | set(derived_tags)
+    old_tags = set(old_item.get('tags', [])) | set(old_item.get('derivedTags', []))
+    update_tag_dictionary(user_id, new_tags - old_tags, old_tags - new_tags, now)
+    
+    # Only images ProcessImage counted (renditionBytes set) are in the stats
+    if old_item.get('analysisStatus') != 'completed' and 'renditionBytes' in old_item:
+        increment_analyzed_count(user_id)
+    
+    if 'uploadTimestamp' in old_item:
+        lines = [detection['text'] for detection in analysis_results['text'][:5]]
+        filename = os.path.splitext(old_item.get('imageName', ''))[0]
+        update_term_index(user_id, image_id, lines + [filename], old_item)
+
+
+def tokenize(text):
+    """Case-folded words (letters and digits) of a line."""
+    return [token for token in re.findall(r'[^\W_]+', text.casefold()) if len(token) <= MAX_TERM_LENGTH]
+
+
+def term_postings(lines):
+    """
+    Map each term to its positions across lines. Line n starts at position
+    n * TERM_LINE_GAP, so consecutive positions always mean adjacent words.
+    """
+    postings = {}
+    for line_number, line in enumerate(lines):
+        for offset, token in enumerate(tokenize(line)):
+            postings.setdefault(token, []).append(line_number * TERM_LINE_GAP + offset)
+    return postings
+
+
+def update_term_index(user_id, image_id, lines, old_item):
+    """
+    Write the image's posting items and remove those for terms it no longer
+    has. The term list is kept on the image (textTerms) so re-analysis and
+    DeleteImage know which postings to remove.
+    """
+    postings = term_postings(lines)
+    stale_terms = set(old_item.get('textTerms', [])) - set(postings)
+    
+    try:
+        with table.batch_writer() as batch:
+            for term, positions in postings.items():
+                batch.put_item(Item={
+                    'userId': user_id,
+                    'imageId': f"{TERM_ITEM_PREFIX}{term}#{image_id}",
+                    'targetImageId': image_id,
+                    'positions': positions,
+                    # Lets search order candidates without reading the images;
+                    # not named uploadTimestamp so postings stay out of UploadTimeIndex
+                    'uploadedAt': old_item['uploadTimestamp']
+                })
+            for term in stale_terms:
+                batch.delete_item(Key={'userId': user_id, 'imageId': f"{TERM_ITEM_PREFIX}{term}#{image_id}"})
+        
+        table.update_item(
+            Key={'userId': user_id, 'imageId': image_id},
+            UpdateExpression='SET textTerms = :terms',
+            ConditionExpression='attribute_exists(imageId)',
+            ExpressionAttributeValues={':terms': sorted(postings)}
+        )
+        print(f"Indexed {len(postings)} terms for image {image_id}")
+    except ClientError as e:
+        # Search falls back to unindexed text matching; don't fail the analysis
+        print(f"Error updating term index: {str(e)}")
+
+
+def derive_tags(labels):
+    """
+    Tags implied by the detected labels but not detected themselves: the
+    labels' parents plus synonyms of labels and parents. Stored apart from
+    tags so a search for "animal" matches dog photos with one contains()
+    instead of an OR over every kind of animal.
+    """
+    direct = {label['name'].lower() for label in labels}
+    derived = set()
+    for label in labels:
+        names = [label['name'].lower()] + [parent.lower() for parent in label.get('parents', [])]
+        derived.update(names[1:])
+        for name in names:
+            derived.update(TAG_SYNONYMS.get(name, []))
+    return sorted(derived - direct)
+
+
+def summarize_faces(faces):
+    """
+    Roll the per-face details up into flat attributes any face in the photo
+    has, e.g. ["age:20-30", "emotion:happy", "eyeglasses", "smiling"], so
+    search can filter with contains() instead of reading the faces array.
+    Emotion is each face's strongest one; age is the decade of the
+    midpoint of the estimated range.
+    """
+    attributes = set()
+    for face in faces:
+        for flag, attribute in (('smile', 'smiling'), ('eyeglasses', 'eyeglasses'),
+                                ('sunglasses', 'sunglasses'), ('beard', 'beard')):
+            if face.get(flag):
+                attributes.add(attribute)
+        if face.get('emotions'):
+            attributes.add(f"emotion:{face['emotions'][0]['type'].lower()}")
+        if face.get('ageRange'):
+            decade = (int(face['ageRange']['low']) + int(face['ageRange']['high'])) // 20 * 10
+            attributes.add(f"age:{decade}-{decade + 10}")
+    return sorted(attributes)
+
+
+def increment_analyzed_count(user_id):
+    """Atomically count one more analyzed image in the user's stats item."""
+    try:
+        table.update_item(
+            Key={'userId': user_id, 'imageId': STATS_ITEM_ID},
+            UpdateExpression='ADD analyzedCount :one',
+            ExpressionAttributeValues={':one': 1}
+        )
+    except ClientError as e:
+        print(f"Error updating usage stats: {str(e)}")
+
+
+def update_tag_dictionary(user_id, added, removed, now):
+    """
+    Adjust per-tag image counts in the user's tag dictionary item.
+    
+    Counts live in the tagCounts map and last-seen times (epoch ms) in
+    tagLastSeen; tags whose count drops to 0 stay in the map and are
+    skipped by readers.
+    """
+    if not added and not removed:
+        return
+    
+    names = {}
+    clauses = []
+    for i, tag in enumerate(sorted(added)):
+        names[f'#a{i}'] = tag
+        clauses.append(f'tagCounts.#a{i} = if_not_exists(tagCounts.#a{i}, :zero) + :one')
+        clauses.append(f'tagLastSeen.#a{i} = :now')
+    for i, tag in enumerate(sorted(removed)):
+        names[f'#r{i}'] = tag
+        clauses.append(f'tagCounts.#r{i} = if_not_exists(tagCounts.#r{i}, :one) - :one')
+    
+    update = {
+        'Key': {'userId': user_id, 'imageId': TAG_DICTIONARY_ID},
+        'UpdateExpression': 'SET ' + ', '.join(clauses),
+        'ExpressionAttributeNames': names,
+        'ExpressionAttributeValues': {':zero': 0, ':one': 1, ':now': now}
+    }
+    
+    try:
+        try:
+            table.update_item(**update)
+        except ClientError as e:
+            # Nested map paths need the maps to exist: create them and retry
+            if e.response['Error']['Code'] != 'ValidationException':
+                raise
+            create_tag_dictionary(user_id)
+            table.update_item(**update)
+    except ClientError as e:
+        # The dictionary only feeds suggestions; never fail the analysis on it
+        print(f"Error updating tag dictionary: {str(e)}")
+
+
+def create_tag_dictionary(user_id):
+    """Create the empty tag dictionary item unless another writer already has."""
+    try:
+        table.put_item(
+            Item={
+                'userId': user_id,
+                'imageId': TAG_DICTIONARY_ID,
+                'tagCounts': {},
+                'tagLastSeen': {}
+            },
+            ConditionExpression='attribute_not_exists(imageId)'
+        )
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+            raise
 
 
 def get_cors_headers():
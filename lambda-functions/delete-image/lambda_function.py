@@ -6,6 +6,8 @@ Trigger: API Gateway DELETE /images/{imageId}
 
 import json
 import os
+import time
+import unicodedata
 import boto3
 from botocore.exceptions import ClientError
 
@@ -18,6 +20,33 @@ UPLOADS_BUCKET = os.environ.get('UPLOADS_BUCKET', 'photogallery-uploads-23brs107
 PROCESSED_BUCKET = os.environ.get('PROCESSED_BUCKET', 'photogallery-processed-23brs1079')
 DYNAMODB_TABLE = os.environ.get('DYNAMODB_TABLE', 'PhotoGallery-Images')
 
+# Prefix of the per-user content hash index items
+HASH_ITEM_PREFIX = 'hash#'
+
+# Deletions are recorded as tombstone items on the UpdatedAtIndex change feed
+# and expire (DynamoDB TTL on expiresAt) after TOMBSTONE_TTL_DAYS
+TOMBSTONE_ITEM_PREFIX = 'tombstone#'
+TOMBSTONE_TTL_DAYS = int(os.environ.get('TOMBSTONE_TTL_DAYS', '30'))
+
+# Per-user tag dictionary item maintained by AnalyzeImage
+TAG_DICTIONARY_ID = 'meta#tags'
+
+# Per-user usage counters maintained by ProcessImage and AnalyzeImage
+STATS_ITEM_ID = 'meta#stats'
+
+# Term index postings (term#<term>#<imageId>) written by AnalyzeImage
+TERM_ITEM_PREFIX = 'term#'
+
+# Filename trigram postings (gram#<trigram>#<imageId>) written by ProcessImage
+GRAM_ITEM_PREFIX = 'gram#'
+
+# Perceptual hash band postings (phash#<type><band>#<value>#<imageId>) written by ProcessImage
+PHASH_ITEM_PREFIX = 'phash#'
+PHASH_BANDS = 8
+
+# Burst group items (group#<groupId>) holding a members map, written by ProcessImage
+GROUP_ITEM_PREFIX = 'group#'
+
 table = dynamodb.Table(DYNAMODB_TABLE)
 
 def lambda_handler(event, context):
@@ -42,12 +71,25 @@ def lambda_handler(event, context):
         # Extract image ID from path parameters
         image_id = event['pathParameters']['imageId']
         
+        # Index and meta items (hash#, meta#stats, group#...) share the
+        # user's partition; image IDs never contain '#'
+        if '#' in image_id:
+            return {
+                'statusCode': 400,
+                'headers': get_cors_headers(),
+                'body': json.dumps({
+                    'error': 'Bad Request',
+                    'message': f'Invalid image ID: {image_id}'
+                })
+            }
+        
         print(f"Delete request - UserId: {user_id}, ImageId: {image_id}")
         
         # Step 1: Get image metadata from DynamoDB
         image_metadata = get_image_metadata(user_id, image_id)
         
-        if not image_metadata:
+        # Only image items have an upload time
+        if not image_metadata or 'uploadTimestamp' not in image_metadata:
             return {
                 'statusCode': 404,
                 'headers': get_cors_headers(),
@@ -61,7 +103,7 @@ def lambda_handler(event, context):
         delete_from_s3(user_id, image_id, image_metadata)
         
         # Step 3: Delete from DynamoDB
-        delete_from_dynamodb(user_id, image_id)
+        delete_from_dynamodb(user_id, image_id, image_metadata)
         
         print(f"Successfully deleted image {image_id} for user {user_id}")
         
@@ -152,13 +194,13 @@ def delete_from_s3(user_id, image_id, metadata):
     
     # Construct S3 keys
     # Original file in uploads bucket
-    original_key = f"uploads/{user_id}/{image_id}-{timestamp}-{original_filename}"
+    original_key = metadata.get('originalKey') or f"uploads/{user_id}/{image_id}-{timestamp}-{original_filename}"
     
     # Processed files in processed bucket
     processed_keys = [
-        f"processed/{user_id}/thumb-{image_id}.jpg",      # Thumbnail 150x150
-        f"processed/{user_id}/med-{image_id}.jpg",        # Medium 800x800
-        f"processed/{user_id}/{image_id}.webp"            # Large WebP
+        f"processed/{user_id}/thumb-{image_id}.jpg",      # Thumbnail 400px
+        f"processed/{user_id}/med-{image_id}.jpg",        # Medium 1024px
+        f"processed/{user_id}/{image_id}.jpg"             # Large 2048px
     ]
     
     # Delete original from uploads bucket
@@ -188,13 +230,14 @@ def delete_from_s3(user_id, image_id, metadata):
     print(f"Deleted all S3 files for image {image_id}")
 
 
-def delete_from_dynamodb(user_id, image_id):
+def delete_from_dynamodb(user_id, image_id, metadata):
     """
     Delete image metadata from DynamoDB.
     
     Args:
         user_id (str): User ID
         image_id (str): Image ID
+        metadata (dict): Image metadata (for the content hash)
     """
     try:
         table.delete_item(
@@ -208,6 +251,169 @@ def delete_from_dynamodb(user_id, image_id):
     except ClientError as e:
         print(f"Error deleting from DynamoDB: {str(e)}")
         raise
+    
+    put_tombstone_item(user_id, image_id)
+    
+    tags = metadata.get('tags', []) + metadata.get('derivedTags', [])
+    if tags:
+        decrement_tag_counts(user_id, tags)
+    
+    # Only images ProcessImage counted carry renditionBytes
+    if 'renditionBytes' in metadata:
+        subtract_usage_stats(user_id, metadata)
+    
+    if metadata.get('contentHash'):
+        delete_hash_index_item(user_id, image_id, metadata['contentHash'])
+    
+    if metadata.get('textTerms'):
+        delete_term_postings(user_id, image_id, metadata['textTerms'])
+    
+    if metadata.get('imageName'):
+        delete_name_grams(user_id, image_id, metadata['imageName'])
+    
+    if metadata.get('phash'):
+        delete_phash_bands(user_id, image_id, metadata['phash'], metadata.get('phashType', 'dct'))
+    
+    if metadata.get('groupId'):
+        remove_group_member(user_id, image_id, metadata['groupId'])
+
+
+def put_tombstone_item(user_id, image_id):
+    """
+    Record the deletion so clients syncing via GET /images/changes drop it.
+    Tombstones have no uploadTimestamp, so they stay out of UploadTimeIndex.
+    """
+    now = time.time()
+    try:
+        table.put_item(
+            Item={
+                'userId': user_id,
+                'imageId': f"{TOMBSTONE_ITEM_PREFIX}{image_id}",
+                'targetImageId': image_id,
+                'deleted': True,
+                'updatedAt': int(now * 1000),
+                'expiresAt': int(now) + TOMBSTONE_TTL_DAYS * 86400
+            }
+        )
+    except ClientError as e:
+        # Clients fall back to a full resync once tombstones could be missing
+        print(f"Error writing tombstone: {str(e)}")
+
+
+def subtract_usage_stats(user_id, metadata):
+    """
+    Atomically remove the image from the user's stats item.
+    """
+    values = {
+        ':count': -1,
+        ':original': -int(metadata.get('fileSize', 0)),
+        ':renditions': -int(metadata['renditionBytes'])
+    }
+    expression = 'ADD imageCount :count, originalBytes :original, renditionBytes :renditions'
+    if metadata.get('analysisStatus') == 'completed':
+        values[':analyzed'] = -1
+        expression += ', analyzedCount :analyzed'
+    
+    try:
+        table.update_item(
+            Key={'userId': user_id, 'imageId': STATS_ITEM_ID},
+            UpdateExpression=expression,
+            ExpressionAttributeValues=values
+        )
+    except ClientError as e:
+        print(f"Error updating usage stats: {str(e)}")
+
+
+def decrement_tag_counts(user_id, tags):
+    """
+    Subtract the deleted image's tags from the user's tag dictionary.
+    """
+    names = {f'#t{i}': tag for i, tag in enumerate(sorted(set(tags)))}
+    clauses = [f'tagCounts.{name} = if_not_exists(tagCounts.{name}, :one) - :one' for name in names]
+    try:
+        table.update_item(
+            Key={'userId': user_id, 'imageId': TAG_DICTIONARY_ID},
+            UpdateExpression='SET ' + ', '.join(clauses),
+            ConditionExpression='attribute_exists(tagCounts)',
+            ExpressionAttributeNames=names,
+            ExpressionAttributeValues={':one': 1}
+        )
+    except ClientError as e:
+        # No dictionary yet (images analyzed before it existed)
+        print(f"Tag dictionary not updated: {str(e)}")
+
+
+def delete_hash_index_item(user_id, image_id, content_hash):
+    """
+    Remove the content hash entry so the file can be uploaded again.
+    Only removed if it still points at this image.
+    """
+    try:
+        table.delete_item(
+            Key={
+                'userId': user_id,
+                'imageId': f"{HASH_ITEM_PREFIX}{content_hash}"
+            },
+            ConditionExpression='targetImageId = :imageId',
+            ExpressionAttributeValues={':imageId': image_id}
+        )
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+            print(f"Error deleting hash index item: {str(e)}")
+
+
+def delete_term_postings(user_id, image_id, terms):
+    """Remove the image from the term index."""
+    try:
+        with table.batch_writer() as batch:
+            for term in terms:
+                batch.delete_item(Key={'userId': user_id, 'imageId': f"{TERM_ITEM_PREFIX}{term}#{image_id}"})
+    except ClientError as e:
+        # Search verifies candidates against live images, so leftovers only cost a read
+        print(f"Error deleting term postings: {str(e)}")
+
+
+def delete_name_grams(user_id, image_id, name):
+    """Remove the image from the filename trigram index (same trigrams as ProcessImage)."""
+    normalized = unicodedata.normalize('NFKC', name).casefold()
+    grams = {normalized[i:i + 3] for i in range(len(normalized) - 2)}
+    try:
+        with table.batch_writer() as batch:
+            for gram in grams:
+                batch.delete_item(Key={'userId': user_id, 'imageId': f"{GRAM_ITEM_PREFIX}{gram}#{image_id}"})
+    except ClientError as e:
+        print(f"Error deleting filename index postings: {str(e)}")
+
+
+def delete_phash_bands(user_id, image_id, phash, phash_type):
+    """Remove the image from the similar-image band index (same bands as ProcessImage)."""
+    try:
+        with table.batch_writer() as batch:
+            for band in range(PHASH_BANDS):
+                batch.delete_item(Key={
+                    'userId': user_id,
+                    'imageId': f"{PHASH_ITEM_PREFIX}{phash_type}{band}#{phash[band * 2:band * 2 + 2]}#{image_id}"
+                })
+    except ClientError as e:
+        print(f"Error deleting perceptual hash postings: {str(e)}")
+
+
+def remove_group_member(user_id, image_id, group_id):
+    """Drop the image from its burst group, deleting the group item once empty."""
+    key = {'userId': user_id, 'imageId': f"{GROUP_ITEM_PREFIX}{group_id}"}
+    try:
+        response = table.update_item(
+            Key=key,
+            UpdateExpression='REMOVE members.#image',
+            ConditionExpression='attribute_exists(members)',
+            ExpressionAttributeNames={'#image': image_id},
+            ReturnValues='ALL_NEW'
+        )
+        if not response['Attributes'].get('members'):
+            table.delete_item(Key=key, ConditionExpression='size(members) = :zero',
+                              ExpressionAttributeValues={':zero': 0})
+    except ClientError as e:
+        print(f"Error removing image from group {group_id}: {str(e)}")
 
 
 def get_cors_headers():
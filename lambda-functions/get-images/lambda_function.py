@@ -1,11 +1,12 @@
 """
 Lambda Function: GetImages
-Purpose: Retrieve user's photo gallery with metadata
-Trigger: API Gateway (GET /images)
+Purpose: Retrieve user's photo gallery with metadata, and changes since a cursor
+Trigger: API Gateway (GET /images, GET /images/changes)
 Runtime: Python 3.11
 """
 
 import json
+import time
 import boto3
 import os
 from boto3.dynamodb.conditions import Key
@@ -16,6 +17,24 @@ DYNAMODB_TABLE = os.environ.get('DYNAMODB_TABLE', 'PhotoGallery-Images')
 PROCESSED_BUCKET = os.environ.get('PROCESSED_BUCKET', 'photogallery-processed-23brs1079')
 CLOUDFRONT_DOMAIN = os.environ.get('CLOUDFRONT_DOMAIN', '')  # Will add later
 
+# Nominal rendition sizes for items processed before ProcessImage stored a manifest
+DEFAULT_RENDITIONS = [
+    {'name': 'thumbnail', 'width': 400, 'format': 'jpeg'},
+    {'name': 'medium', 'width': 1024, 'format': 'jpeg'},
+    {'name': 'large', 'width': 2048, 'format': 'jpeg'},
+]
+
+# Change feed: GSI on userId + updatedAt (epoch ms), written by ProcessImage,
+# AnalyzeImage and DeleteImage (tombstones)
+UPDATED_AT_INDEX = 'UpdatedAtIndex'
+UPLOAD_TIME_INDEX = 'UploadTimeIndex'
+TOMBSTONE_ITEM_PREFIX = 'tombstone#'
+TOMBSTONE_TTL_DAYS = int(os.environ.get('TOMBSTONE_TTL_DAYS', '30'))  # Must match DeleteImage
+CHANGES_OVERLAP_MS = 5000  # Re-read recent writes to cover clock skew between Lambdas
+
+# Burst / near-duplicate groups (group#<groupId>, members map) written by ProcessImage
+GROUP_ITEM_PREFIX = 'group#'
+
 # Initialize DynamoDB
 dynamodb = boto3.resource('dynamodb')
 table = dynamodb.Table(DYNAMODB_TABLE)
@@ -33,7 +52,8 @@ def lambda_handler(event, context):
         "queryStringParameters": {
             "limit": "20",
             "sortOrder": "desc",
-            "lastKey": "{encoded_key}"
+            "lastKey": "{encoded_key}",
+            "collapseGroups": "true"
         },
         "requestContext": {
             "authorizer": {
@@ -51,9 +71,14 @@ def lambda_handler(event, context):
         
         # Parse query parameters
         params = event.get('queryStringParameters') or {}
+        
+        if is_changes_request(event):
+            return handle_changes(user_id, params)
+        
         limit = int(params.get('limit', '20'))
         sort_order = params.get('sortOrder', 'desc').lower()
         last_key = params.get('lastKey')
+        collapse = params.get('collapseGroups', '').lower() == 'true'
         
         # Limit validation
         if limit > 100:
@@ -79,9 +104,13 @@ def lambda_handler(event, context):
         # Execute query
         response = table.query(**query_params)
         
+        items = response.get('Items', [])
+        if collapse:
+            items = collapse_groups(user_id, items, sort_order != 'asc')
+        
         # Build image list with URLs
         images = []
-        for item in response.get('Items', []):
+        for item in items:
             image_data = build_image_response(item, user_id)
             images.append(image_data)
         
@@ -114,6 +143,185 @@ def lambda_handler(event, context):
         return error_response(500, f'Internal server error: {str(e)}')
 
 
+def collapse_groups(user_id, items, sort_desc):
+    """
+    Replace each burst group with its sharpest member, at the position of
+    the group's first member in sort order, carrying `groupCount`. Later
+    members are skipped, so a group never appears on two pages; a page can
+    hold fewer than `limit` images.
+    """
+    group_ids = {item['groupId'] for item in items if item.get('groupId')}
+    if not group_ids:
+        return items
+    
+    groups = {
+        group['imageId'][len(GROUP_ITEM_PREFIX):]: group.get('members') or {}
+        for group in batch_get(user_id, [GROUP_ITEM_PREFIX + group_id for group_id in group_ids])
+    }
+    
+    def order(member_id, members):
+        return (int(members[member_id].get('uploadTimestamp', 0)), member_id)
+    
+    slots = []
+    representative_ids = set()
+    for item in items:
+        members = groups.get(item.get('groupId'))
+        if not members or item['imageId'] not in members:
+            slots.append((item, None, 1))
+            continue
+        pick = max if sort_desc else min
+        if pick(members, key=lambda member_id: order(member_id, members)) != item['imageId']:
+            continue
+        representative = max(members, key=lambda member_id: (members[member_id].get('sharpness', 0),) + order(member_id, members))
+        slots.append((item, representative, len(members)))
+        representative_ids.add(representative)
+    
+    by_id = {item['imageId']: item for item in items}
+    missing = [image_id for image_id in representative_ids if image_id not in by_id]
+    by_id.update((item['imageId'], item) for item in batch_get(user_id, missing))
+    
+    collapsed = []
+    for item, representative, count in slots:
+        if representative:
+            # A member deleted since the group was read falls back to the anchor
+            item = dict(by_id.get(representative, item), groupCount=count)
+        collapsed.append(item)
+    return collapsed
+
+
+def batch_get(user_id, image_ids):
+    """
+    Read items by imageId (at most 100, one page of results) with BatchGetItem.
+    """
+    keys = [{'userId': user_id, 'imageId': image_id} for image_id in image_ids]
+    items = []
+    while keys:
+        response = dynamodb.batch_get_item(RequestItems={DYNAMODB_TABLE: {'Keys': keys}})
+        items.extend(response.get('Responses', {}).get(DYNAMODB_TABLE, []))
+        keys = response.get('UnprocessedKeys', {}).get(DYNAMODB_TABLE, {}).get('Keys', [])
+    return items
+
+
+def is_changes_request(event):
+    """
+    GET /images/changes is routed to this function as well
+    """
+    path = event.get('resource') or event.get('path') or ''
+    return path.rstrip('/').endswith('/changes')
+
+
+def handle_changes(user_id, params):
+    """
+    Return images written or deleted since the `since` cursor (epoch ms),
+    oldest first, from the UpdatedAtIndex GSI. A full sync (since=0) lists
+    the library instead (see seed_changes).
+    """
+    try:
+        since = int(params.get('since') or 0)
+        limit = min(max(int(params.get('limit', '100')), 1), 100)
+    except ValueError:
+        return error_response(400, 'since and limit must be integers')
+    
+    now_ms = int(time.time() * 1000)
+    
+    # Tombstones older than this have expired, so a delta could miss deletions
+    if since and since < now_ms - TOMBSTONE_TTL_DAYS * 86400 * 1000:
+        return {
+            'statusCode': 200,
+            'headers': get_cors_headers(),
+            'body': json.dumps({'fullResync': True, 'changes': [], 'deleted': [], 'cursor': 0, 'hasMore': False})
+        }
+    
+    if not since:
+        return seed_changes(user_id, limit, params.get('lastKey'), now_ms)
+    
+    query_params = {
+        'IndexName': UPDATED_AT_INDEX,
+        'KeyConditionExpression': Key('userId').eq(user_id) & Key('updatedAt').gt(max(since - CHANGES_OVERLAP_MS, 0)),
+        'Limit': limit,
+        'ScanIndexForward': True
+    }
+    
+    last_key = params.get('lastKey')
+    if last_key:
+        try:
+            query_params['ExclusiveStartKey'] = json.loads(last_key)
+        except ValueError:
+            return error_response(400, 'Invalid lastKey')
+    
+    response = table.query(**query_params)
+    
+    changes = []
+    deleted = []
+    cursor = since
+    for item in response.get('Items', []):
+        cursor = max(cursor, int(item['updatedAt']))
+        if item['imageId'].startswith(TOMBSTONE_ITEM_PREFIX):
+            deleted.append(item['targetImageId'])
+        else:
+            changes.append(build_image_response(item, user_id))
+    
+    result = {
+        'changes': changes,
+        'deleted': deleted,
+        'cursor': cursor,
+        'fullResync': False,
+        'hasMore': 'LastEvaluatedKey' in response
+    }
+    if 'LastEvaluatedKey' in response:
+        result['nextKey'] = json.dumps(response['LastEvaluatedKey'], cls=DecimalEncoder)
+    
+    return {
+        'statusCode': 200,
+        'headers': get_cors_headers(),
+        'body': json.dumps(result, cls=DecimalEncoder)
+    }
+
+
+def seed_changes(user_id, limit, last_key, now_ms):
+    """
+    Full sync: every image, oldest upload first, from UploadTimeIndex.
+    
+    UpdatedAtIndex only holds items written since updatedAt was introduced,
+    so older images would be missing from a mirror built from it. The
+    cursor is the time the first page was read (carried in nextKey): the
+    next delta sync then returns anything written or deleted meanwhile.
+    """
+    query_params = {
+        'IndexName': UPLOAD_TIME_INDEX,
+        'KeyConditionExpression': Key('userId').eq(user_id),
+        'Limit': limit,
+        'ScanIndexForward': True
+    }
+    
+    seed_start = now_ms
+    if last_key:
+        try:
+            token = json.loads(last_key)
+            seed_start = int(token['seedStart'])
+            query_params['ExclusiveStartKey'] = token['key']
+        except (ValueError, KeyError, TypeError):
+            return error_response(400, 'Invalid lastKey')
+    
+    response = table.query(**query_params)
+    
+    result = {
+        'changes': [build_image_response(item, user_id) for item in response.get('Items', [])],
+        'deleted': [],
+        'cursor': seed_start,
+        'fullResync': False,
+        'hasMore': 'LastEvaluatedKey' in response
+    }
+    if 'LastEvaluatedKey' in response:
+        result['nextKey'] = json.dumps({'seedStart': seed_start, 'key': response['LastEvaluatedKey']}, cls=DecimalEncoder)
+    
+    return {
+        'statusCode': 200,
+        'headers': get_cors_headers(),
+        'body': json.dumps(result, cls=DecimalEncoder)
+    }
+
+
 def build_image_response(item, user_id):
     """
     Build image response object with URLs
@@ -142,10 +350,30 @@ def build_image_response(item, user_id):
         }
     }
     
+    image_data['renditions'] = build_renditions(item, image_data['urls'])
+    
     # Add optional fields if they exist
     if 'tags' in item:
         image_data['tags'] = item['tags']
     
+    if 'derivedTags' in item:
+        image_data['derivedTags'] = item['derivedTags']
+    
+    if 'faceAttributes' in item:
+        image_data['faceAttributes'] = item['faceAttributes']
+    
+    if 'palette' in item:
+        image_data['palette'] = item['palette']
+    
+    if 'colors' in item:
+        image_data['colors'] = item['colors']
+    
+    if 'groupId' in item:
+        image_data['groupId'] = item['groupId']
+    
+    if 'groupCount' in item:
+        image_data['groupCount'] = int(item['groupCount'])
+    
     if 'aiAnalysis' in item:
         ai_analysis = item['aiAnalysis']
         image_data['aiAnalysis'] = {
@@ -158,9 +386,34 @@ def build_image_response(item, user_id):
     if 'processingStatus' in item:
         image_data['processingStatus'] = item['processingStatus']
     
+    if 'updatedAt' in item:
+        image_data['updatedAt'] = int(item['updatedAt'])
+    
     return image_data
 
 
+def build_renditions(item, urls):
+    """
+    Build the rendition manifest (smallest first) for srcset selection.
+    Items processed before manifests were stored get nominal widths.
+    """
+    renditions = []
+    seen_widths = set()
+    for rendition in sorted(item.get('renditions') or DEFAULT_RENDITIONS, key=lambda r: int(r['width'])):
+        width = int(rendition['width'])
+        # Small originals produce identical renditions; list each width once
+        if width in seen_widths or rendition['name'] not in urls:
+            continue
+        seen_widths.add(width)
+        renditions.append({
+            'name': rendition['name'],
+            'url': urls[rendition['name']],
+            'width': width,
+            'format': rendition.get('format', 'jpeg')
+        })
+    return renditions
+
+
 def get_cors_headers():
     """
     Return CORS headers for API response
@@ -0,0 +1,143 @@
+"""
+Lambda Function: GetTags
+Purpose: Tag completions for search, most used first
+Trigger: API Gateway GET /tags
+"""
+
+import heapq
+import json
+import os
+import boto3
+from decimal import Decimal
+
+# Initialize AWS clients
+dynamodb = boto3.resource('dynamodb')
+
+# Environment variables
+DYNAMODB_TABLE = os.environ.get('DYNAMODB_TABLE', 'PhotoGallery-Images')
+DEFAULT_LIMIT = 10
+MAX_LIMIT = 50
+
+# Per-user tag dictionary item maintained by AnalyzeImage and DeleteImage
+TAG_DICTIONARY_ID = 'meta#tags'
+
+table = dynamodb.Table(DYNAMODB_TABLE)
+
+def lambda_handler(event, context):
+    """
+    Return the user's tags starting with a prefix, by image count.
+    
+    Query Parameters:
+    - prefix: Start of the tag (case-insensitive, default: all tags)
+    - limit: Number of completions (1-50, default: 10)
+    """
+    
+    try:
+        # Extract user ID from Cognito JWT
+        user_id = event['requestContext']['authorizer']['claims']['sub']
+        
+        params = event.get('queryStringParameters') or {}
+        prefix = params.get('prefix', '').strip().lower()
+        try:
+            limit = min(max(int(params.get('limit', DEFAULT_LIMIT)), 1), MAX_LIMIT)
+        except ValueError:
+            limit = DEFAULT_LIMIT
+        
+        # The whole dictionary is one item: a single GetItem, no index reads
+        response = table.get_item(
+            Key={'userId': user_id, 'imageId': TAG_DICTIONARY_ID},
+            ProjectionExpression='tagCounts, tagLastSeen'
+        )
+        item = response.get('Item', {})
+        
+        result = {
+            'prefix': prefix,
+            'tags': top_completions(item.get('tagCounts', {}), item.get('tagLastSeen', {}), prefix, limit)
+        }
+        
+        return {
+            'statusCode': 200,
+            'headers': get_cors_headers(),
+            'body': json.dumps(result, cls=DecimalEncoder)
+        }
+        
+    except KeyError as e:
+        print(f"Missing required field: {str(e)}")
+        return {
+            'statusCode': 400,
+            'headers': get_cors_headers(),
+            'body': json.dumps({
+                'error': 'Bad Request',
+                'message': f'Missing required field: {str(e)}'
+            })
+        }
+    
+    except Exception as e:
+        print(f"Tags error: {str(e)}")
+        return {
+            'statusCode': 500,
+            'headers': get_cors_headers(),
+            'body': json.dumps({
+                'error': 'Internal Server Error',
+                'message': str(e)
+            })
+        }
+
+
+def top_completions(counts, last_seen, prefix, limit):
+    """
+    Highest-count tags starting with prefix; ties go to the most recently seen.
+    Tags whose images were all deleted (count 0) are skipped.
+    
+    One pass over the map with a bounded heap (O(n log limit)) instead of
+    sorting every tag on each keystroke.
+    """
+    matches = (
+        (tag, int(count)) for tag, count in counts.items()
+        if count > 0 and tag.startswith(prefix)
+    )
+    top = heapq.nsmallest(limit, matches, key=lambda match: (-match[1], -int(last_seen.get(match[0], 0)), match[0]))
+    
+    return [
+        {'tag': tag, 'count': count, 'lastSeen': int(last_seen.get(tag, 0))}
+        for tag, count in top
+    ]
+
+
+def get_cors_headers():
+    """Return CORS headers for API Gateway responses."""
+    return {
+        'Content-Type': 'application/json',
+        'Access-Control-Allow-Origin': '*',
+        'Access-Control-Allow-Headers': 'Content-Type,Authorization',
+        'Access-Control-Allow-Methods': 'GET,OPTIONS'
+    }
+
+
+class DecimalEncoder(json.JSONEncoder):
+    """Helper class to convert DynamoDB Decimal types to JSON."""
+    def default(self, obj):
+        if isinstance(obj, Decimal):
+            return float(obj) if obj % 1 else int(obj)
+        return super(DecimalEncoder, self).default(obj)
+
+
+# For local testing
+if __name__ == "__main__":
+    # Test event
+    test_event = {
+        "requestContext": {
+            "authorizer": {
+                "claims": {
+                    "sub": "test-user-123"
+                }
+            }
+        },
+        "queryStringParameters": {
+            "prefix": "be",
+            "limit": "5"
+        }
+    }
+    
+    result = lambda_handler(test_event, None)
+    print(json.dumps(result, indent=2))
@@ -6,20 +6,50 @@ Runtime: Python 3.11
 """
 
 import json
+import math
+import re
 import boto3
 import uuid
 import os
 from datetime import datetime
+from botocore.exceptions import ClientError
 
 # Environment variables
 UPLOADS_BUCKET = os.environ.get('UPLOADS_BUCKET', 'photogallery-uploads-23brs1079')
+DYNAMODB_TABLE = os.environ.get('DYNAMODB_TABLE', 'PhotoGallery-Images')
 
 # Initialize S3 client (region is automatically detected in Lambda)
 s3_client = boto3.client('s3')
+dynamodb = boto3.resource('dynamodb')
+table = dynamodb.Table(DYNAMODB_TABLE)
 
 # Allowed file extensions
 ALLOWED_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif', '.webp'}
-MAX_FILE_SIZE = 10 * 1024 * 1024  # 10 MB
+MAX_FILE_SIZE = 10 * 1024 * 1024  # 10 MB (single PUT)
+MAX_BATCH_SIZE = int(os.environ.get('MAX_BATCH_SIZE', '200'))
+URL_EXPIRATION = 300  # 5 minutes
+# Batch URLs must outlive the whole (client-side queued) upload: 5 minutes
+# plus the batch's bytes at a slow uplink, at most 1 hour
+MIN_UPLOAD_RATE = 256 * 1024  # bytes per second
+MAX_BATCH_URL_EXPIRATION = 3600
+UPLOAD_METHODS = {'PUT', 'POST'}
+
+# Multipart uploads (large originals)
+MAX_MULTIPART_FILE_SIZE = int(os.environ.get('MAX_MULTIPART_FILE_SIZE', str(200 * 1024 * 1024)))  # 200 MB
+MULTIPART_PART_SIZE = 8 * 1024 * 1024  # 8 MB (S3 minimum is 5 MB)
+MULTIPART_URL_EXPIRATION = 3600  # 1 hour, parts may be retried
+
+# Duplicate detection: hash index items live beside the image items as
+# {userId, imageId: "hash#<sha256>", targetImageId} (written by ProcessImage)
+HASH_ITEM_PREFIX = 'hash#'
+SHA256_PATTERN = re.compile(r'^[0-9a-f]{64}$')
+BATCH_GET_LIMIT = 100  # DynamoDB BatchGetItem maximum
+
+# Quotas, checked against the per-user stats item kept by the pipeline
+# ({userId, imageId: "meta#stats", imageCount, originalBytes, ...}); 0 disables
+STATS_ITEM_ID = 'meta#stats'
+STORAGE_QUOTA_BYTES = int(os.environ.get('STORAGE_QUOTA_BYTES', str(5 * 1024 ** 3)))  # 5 GB
+IMAGE_QUOTA = int(os.environ.get('IMAGE_QUOTA', '0'))
 
 def lambda_handler(event, context):
     """
@@ -32,6 +62,20 @@ def lambda_handler(event, context):
             "contentType": "image/jpeg",
             "fileSize": 2458624
         },
+        -- or, for a batch --
+        "body": {
+            "uploadMethod": "POST",  (optional, default "PUT"; also valid for single files)
+            "files": [
+                {"filename": "sunset.jpg", "contentType": "image/jpeg", "fileSize": 2458624,
+                 "sha256": "<hex digest, optional>"},
+                ...
+            ]
+        },
+        -- or, for a multipart upload --
+        "body": {
+            "action": "createMultipart" | "presignParts" | "completeMultipart" | "abortMultipart",
+            ...
+        },
         "requestContext": {
             "authorizer": {
                 "claims": {
@@ -52,62 +96,37 @@ def lambda_handler(event, context):
         # Extract user ID from Cognito JWT token (via API Gateway authorizer)
         user_id = event['requestContext']['authorizer']['claims']['sub']
         
+        # Multipart upload steps
+        action = body.get('action')
+        if action:
+            return handle_multipart_action(user_id, action, body)
+        
+        upload_method = str(body.get('uploadMethod', 'PUT')).upper()
+        if upload_method not in UPLOAD_METHODS:
+            return error_response(400, f'Invalid uploadMethod. Allowed: {", ".join(sorted(UPLOAD_METHODS))}')
+        
+        # Batch request: {"files": [{filename, contentType, fileSize}, ...]}
+        if 'files' in body:
+            return handle_batch_request(user_id, body['files'], upload_method)
+        
         # Validate input
-        filename = body.get('filename')
-        content_type = body.get('contentType', 'image/jpeg')
-        file_size = body.get('fileSize', 0)
-        
-        if not filename:
-            return error_response(400, 'Filename is required')
-        
-        # Validate file extension
-        file_ext = os.path.splitext(filename.lower())[1]
-        if file_ext not in ALLOWED_EXTENSIONS:
-            return error_response(400, f'Invalid file type. Allowed: {", ".join(ALLOWED_EXTENSIONS)}')
-        
-        # Validate file size
-        if file_size > MAX_FILE_SIZE:
-            return error_response(400, f'File too large. Maximum size: {MAX_FILE_SIZE / (1024*1024)}MB')
-        
-        # Generate unique image ID
-        image_id = str(uuid.uuid4())
-        
-        # Create S3 key (path)
-        # Format: uploads/{userId}/{imageId}-{filename}
-        timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
-        s3_key = f"uploads/{user_id}/{image_id}-{timestamp}-{filename}"
-        
-        # Generate pre-signed URL for PUT operation
-        # Valid for 5 minutes (300 seconds)
-        presigned_url = s3_client.generate_presigned_url(
-            'put_object',
-            Params={
-                'Bucket': UPLOADS_BUCKET,
-                'Key': s3_key,
-                'ContentType': content_type,
-            },
-            ExpiresIn=300,  # 5 minutes
-            HttpMethod='PUT'
-        )
+        validation_error = validate_file(body, upload_method=upload_method)
+        if validation_error:
+            return error_response(400, validation_error)
+        
+        existing = find_existing_images(user_id, [body.get('sha256')])
+        if body.get('sha256') in existing:
+            return success_response(duplicate_result(body, existing[body['sha256']]))
+        
+        quota_error = reserve_quota(get_usage(user_id), body)
+        if quota_error:
+            return error_response(403, quota_error)
+        
+        upload = create_upload(user_id, body, upload_method)
+        upload['message'] = 'Upload URL generated successfully'
         
         # Return success response
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*',  # CORS
-                'Access-Control-Allow-Headers': 'Content-Type,Authorization',
-                'Access-Control-Allow-Methods': 'POST,OPTIONS'
-            },
-            'body': json.dumps({
-                'uploadUrl': presigned_url,
-                'imageId': image_id,
-                'key': s3_key,
-                'bucket': UPLOADS_BUCKET,
-                'expiresIn': 300,
-                'message': 'Upload URL generated successfully'
-            })
-        }
+        return success_response(upload)
         
     except KeyError as e:
         return error_response(401, f'Unauthorized: Missing {str(e)}')
@@ -116,10 +135,484 @@ def lambda_handler(event, context):
         return error_response(500, f'Internal server error: {str(e)}')
 
 
-def error_response(status_code, message):
+def handle_batch_request(user_id, files, upload_method='PUT'):
+    """
+    Issue pre-signed URLs for several files in a single invocation.
+    
+    Each file is validated on its own; invalid entries get an 'error'
+    instead of an 'uploadUrl' so one bad file doesn't fail the batch.
+    Results are returned in the same order as the request.
+    """
+    if not isinstance(files, list) or len(files) == 0:
+        return error_response(400, 'files must be a non-empty list')
+    
+    if len(files) > MAX_BATCH_SIZE:
+        return error_response(400, f'Too many files. Maximum per request: {MAX_BATCH_SIZE}')
+    
+    # Validate everything first so duplicates can be looked up in bulk
+    errors = {}
+    for index, descriptor in enumerate(files):
+        if not isinstance(descriptor, dict):
+            errors[index] = 'Invalid file descriptor'
+        else:
+            errors[index] = validate_file(descriptor, upload_method=upload_method)
+    
+    existing = find_existing_images(
+        user_id,
+        [descriptor.get('sha256') for index, descriptor in enumerate(files) if not errors[index]]
+    )
+    usage = get_usage(user_id)
+    expiration = batch_url_expiration(
+        [descriptor for index, descriptor in enumerate(files) if not errors[index]]
+    )
+    
+    uploads = []
+    for index, descriptor in enumerate(files):
+        if errors[index]:
+            uploads.append({
+                'index': index,
+                'filename': descriptor.get('filename') if isinstance(descriptor, dict) else None,
+                'error': errors[index]
+            })
+            continue
+        
+        sha256 = descriptor.get('sha256')
+        if sha256 in existing:
+            result = duplicate_result(descriptor, existing[sha256])
+            result['index'] = index
+            uploads.append(result)
+            continue
+        
+        # Files are admitted in order until the quota is used up
+        quota_error = reserve_quota(usage, descriptor)
+        if quota_error:
+            uploads.append({'index': index, 'filename': descriptor.get('filename'), 'error': quota_error})
+            continue
+        
+        upload = create_upload(user_id, descriptor, upload_method, expiration)
+        upload['index'] = index
+        uploads.append(upload)
+        
+        # Same file selected twice in one batch: upload it only once
+        if sha256:
+            existing[sha256] = upload['imageId']
+    
+    accepted = sum(1 for upload in uploads if 'uploadUrl' in upload)
+    duplicates = sum(1 for upload in uploads if upload.get('duplicate'))
+    
+    return success_response({
+        'uploads': uploads,
+        'count': accepted,
+        'duplicates': duplicates,
+        'rejected': len(uploads) - accepted - duplicates,
+        'expiresIn': expiration,
+        'message': f'Generated {accepted} upload URL(s)'
+    })
+
+
+def batch_url_expiration(descriptors):
+    """
+    Seconds a batch's URLs stay valid: the browser uploads the files a few
+    at a time, so the last one starts long after the batch was signed.
+    """
+    total_bytes = sum(int(descriptor.get('fileSize') or 0) for descriptor in descriptors)
+    return min(URL_EXPIRATION + math.ceil(total_bytes / MIN_UPLOAD_RATE), MAX_BATCH_URL_EXPIRATION)
+
+
+def validate_file(descriptor, max_size=MAX_FILE_SIZE, upload_method='PUT'):
     """
-    Generate standardized error response
+    Validate a single file descriptor.
+    
+    The size check here only trusts what the client declares; POST uploads
+    are additionally bound by the policy signed in create_upload().
+    
+    Returns:
+        str: Error message, or None if the file is acceptable
     """
+    filename = descriptor.get('filename')
+    file_size = descriptor.get('fileSize', 0)
+    
+    if not filename:
+        return 'Filename is required'
+    
+    # Validate file extension
+    file_ext = os.path.splitext(filename.lower())[1]
+    if file_ext not in ALLOWED_EXTENSIONS:
+        return f'Invalid file type. Allowed: {", ".join(ALLOWED_EXTENSIONS)}'
+    
+    # Validate file size
+    if not isinstance(file_size, (int, float)) or file_size < 0:
+        return 'fileSize must be a non-negative number'
+    if file_size > max_size:
+        return f'File too large. Maximum size: {max_size / (1024*1024)}MB'
+    
+    sha256 = descriptor.get('sha256')
+    if sha256 is not None and (not isinstance(sha256, str) or not SHA256_PATTERN.match(sha256)):
+        return 'sha256 must be a lowercase hex SHA-256 digest'
+    
+    # POST policies pin the content type, so it must be an image type
+    content_type = descriptor.get('contentType') or 'image/jpeg'
+    if upload_method == 'POST' and not content_type.startswith('image/'):
+        return 'contentType must be an image type'
+    
+    return None
+
+
+def build_upload_key(user_id, filename):
+    """
+    Generate a new image ID and its S3 key.
+    
+    Returns:
+        tuple: (image_id, s3_key)
+    """
+    # Generate unique image ID
+    image_id = str(uuid.uuid4())
+    
+    # Create S3 key (path)
+    # Format: uploads/{userId}/{imageId}-{timestamp}-{filename}
+    timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
+    s3_key = f"uploads/{user_id}/{image_id}-{timestamp}-{filename}"
+    
+    return image_id, s3_key
+
+
+def create_upload(user_id, descriptor, upload_method='PUT', expiration=URL_EXPIRATION):
+    """
+    Generate the S3 key and pre-signed URL for one validated file.
+    
+    PUT returns a plain pre-signed URL. POST returns a URL plus form fields
+    whose signed policy makes S3 itself reject bodies over the size limit
+    or with a different content type, before ProcessImage is triggered.
+    
+    Pre-signing is a local signing operation, so batching many files
+    costs no extra AWS calls.
+    """
+    filename = descriptor['filename']
+    content_type = descriptor.get('contentType') or 'image/jpeg'
+    sha256 = descriptor.get('sha256')
+    
+    image_id, s3_key = build_upload_key(user_id, filename)
+    
+    upload = {
+        'uploadMethod': upload_method,
+        'imageId': image_id,
+        'filename': filename,
+        'key': s3_key,
+        'bucket': UPLOADS_BUCKET,
+        'expiresIn': expiration
+    }
+    
+    if upload_method == 'POST':
+        # Bind the body to the declared size (never above the hard limit)
+        file_size = int(descriptor.get('fileSize') or 0)
+        max_length = file_size if 0 < file_size <= MAX_FILE_SIZE else MAX_FILE_SIZE
+        
+        fields = {'Content-Type': content_type}
+        conditions = [
+            {'Content-Type': content_type},
+            ['content-length-range', 1, max_length]
+        ]
+        if sha256:
+            # ProcessImage reads the hash back to maintain the hash index
+            fields['x-amz-meta-sha256'] = sha256
+            conditions.append({'x-amz-meta-sha256': sha256})
+        
+        presigned_post = s3_client.generate_presigned_post(
+            Bucket=UPLOADS_BUCKET,
+            Key=s3_key,
+            Fields=fields,
+            Conditions=conditions,
+            ExpiresIn=expiration
+        )
+        upload['uploadUrl'] = presigned_post['url']
+        upload['fields'] = presigned_post['fields']
+        upload['maxContentLength'] = max_length
+        return upload
+    
+    params = {
+        'Bucket': UPLOADS_BUCKET,
+        'Key': s3_key,
+        'ContentType': content_type,
+    }
+    if sha256:
+        # Client must send the matching x-amz-meta-sha256 header
+        params['Metadata'] = {'sha256': sha256}
+    
+    # Generate pre-signed URL for PUT operation
+    upload['uploadUrl'] = s3_client.generate_presigned_url(
+        'put_object',
+        Params=params,
+        ExpiresIn=expiration,
+        HttpMethod='PUT'
+    )
+    return upload
+
+
+def handle_multipart_action(user_id, action, body):
+    """
+    Dispatch one step of a multipart upload.
+    
+    Flow: createMultipart -> (browser PUTs parts, presignParts to retry)
+          -> completeMultipart, or abortMultipart on failure.
+    Incomplete uploads are also removed by the uploads bucket lifecycle rule.
+    """
+    if action == 'createMultipart':
+        validation_error = validate_file(body, max_size=MAX_MULTIPART_FILE_SIZE)
+        if validation_error:
+            return error_response(400, validation_error)
+        existing = find_existing_images(user_id, [body.get('sha256')])
+        if body.get('sha256') in existing:
+            return success_response(duplicate_result(body, existing[body['sha256']]))
+        quota_error = reserve_quota(get_usage(user_id), body)
+        if quota_error:
+            return error_response(403, quota_error)
+        return success_response(create_multipart_upload(user_id, body))
+    
+    if action not in ('presignParts', 'completeMultipart', 'abortMultipart'):
+        return error_response(400, f'Unknown action: {action}')
+    
+    s3_key = body.get('key')
+    upload_id = body.get('uploadId')
+    if not s3_key or not upload_id:
+        return error_response(400, 'key and uploadId are required')
+    
+    # Users may only touch uploads under their own prefix
+    if not s3_key.startswith(f"uploads/{user_id}/"):
+        return error_response(403, 'Forbidden: key does not belong to user')
+    
+    if action == 'presignParts':
+        part_numbers = body.get('partNumbers') or []
+        if not part_numbers or not all(isinstance(n, int) and not isinstance(n, bool) and 1 <= n <= 10000 for n in part_numbers):
+            return error_response(400, 'partNumbers must be a list of integers between 1 and 10000')
+        return success_response({
+            'uploadId': upload_id,
+            'key': s3_key,
+            'parts': presign_parts(s3_key, upload_id, part_numbers),
+            'expiresIn': MULTIPART_URL_EXPIRATION
+        })
+    
+    if action == 'completeMultipart':
+        parts = body.get('parts') or []
+        if not parts:
+            return error_response(400, 'parts is required')
+        try:
+            completed_parts = sorted(
+                ({'PartNumber': int(part['partNumber']), 'ETag': part['etag']} for part in parts),
+                key=lambda part: part['PartNumber']
+            )
+        except (KeyError, TypeError, ValueError):
+            return error_response(400, 'Each part needs partNumber and etag')
+        
+        try:
+            s3_client.complete_multipart_upload(
+                Bucket=UPLOADS_BUCKET,
+                Key=s3_key,
+                UploadId=upload_id,
+                MultipartUpload={'Parts': completed_parts}
+            )
+        except ClientError as e:
+            # Bad or missing parts (InvalidPart, InvalidPartOrder, EntityTooSmall,
+            # NoSuchUpload) are the client's to fix; pass S3's code on
+            error = e.response.get('Error', {})
+            return error_response(
+                400,
+                f"Could not complete multipart upload: {error.get('Message', str(e))}",
+                code=error.get('Code')
+            )
+        return success_response({
+            'key': s3_key,
+            'bucket': UPLOADS_BUCKET,
+            'message': 'Multipart upload completed successfully'
+        })
+    
+    # abortMultipart
+    try:
+        s3_client.abort_multipart_upload(
+            Bucket=UPLOADS_BUCKET,
+            Key=s3_key,
+            UploadId=upload_id
+        )
+    except ClientError as e:
+        # NoSuchUpload: already completed, aborted or expired, nothing left to abort
+        error = e.response.get('Error', {})
+        if error.get('Code') != 'NoSuchUpload':
+            return error_response(
+                400,
+                f"Could not abort multipart upload: {error.get('Message', str(e))}",
+                code=error.get('Code')
+            )
+    return success_response({
+        'key': s3_key,
+        'message': 'Multipart upload aborted'
+    })
+
+
+def create_multipart_upload(user_id, descriptor):
+    """
+    Start a multipart upload and pre-sign a URL for every part.
+    """
+    filename = descriptor['filename']
+    content_type = descriptor.get('contentType') or 'image/jpeg'
+    file_size = descriptor.get('fileSize', 0)
+    
+    image_id, s3_key = build_upload_key(user_id, filename)
+    
+    create_params = {
+        'Bucket': UPLOADS_BUCKET,
+        'Key': s3_key,
+        'ContentType': content_type
+    }
+    if descriptor.get('sha256'):
+        create_params['Metadata'] = {'sha256': descriptor['sha256']}
+    
+    response = s3_client.create_multipart_upload(**create_params)
+    upload_id = response['UploadId']
+    
+    part_count = max(1, math.ceil(file_size / MULTIPART_PART_SIZE))
+    
+    return {
+        'uploadId': upload_id,
+        'imageId': image_id,
+        'filename': filename,
+        'key': s3_key,
+        'bucket': UPLOADS_BUCKET,
+        'partSize': MULTIPART_PART_SIZE,
+        'parts': presign_parts(s3_key, upload_id, range(1, part_count + 1)),
+        'expiresIn': MULTIPART_URL_EXPIRATION,
+        'message': 'Multipart upload created successfully'
+    }
+
+
+def presign_parts(s3_key, upload_id, part_numbers):
+    """
+    Pre-sign upload_part URLs for the given part numbers.
+    """
+    return [
+        {
+            'partNumber': part_number,
+            'uploadUrl': s3_client.generate_presigned_url(
+                'upload_part',
+                Params={
+                    'Bucket': UPLOADS_BUCKET,
+                    'Key': s3_key,
+                    'UploadId': upload_id,
+                    'PartNumber': part_number
+                },
+                ExpiresIn=MULTIPART_URL_EXPIRATION,
+                HttpMethod='PUT'
+            )
+        }
+        for part_number in part_numbers
+    ]
+
+
+def get_usage(user_id):
+    """
+    Current image count and original bytes: one GetItem on the stats item,
+    whatever the library size. Skipped when no quota is configured.
+    """
+    usage = {'imageCount': 0, 'originalBytes': 0}
+    if not STORAGE_QUOTA_BYTES and not IMAGE_QUOTA:
+        return usage
+    
+    response = table.get_item(
+        Key={'userId': user_id, 'imageId': STATS_ITEM_ID},
+        ProjectionExpression='imageCount, originalBytes'
+    )
+    item = response.get('Item', {})
+    usage['imageCount'] = int(item.get('imageCount', 0))
+    usage['originalBytes'] = int(item.get('originalBytes', 0))
+    return usage
+
+
+def reserve_quota(usage, descriptor):
+    """
+    Check one more file against the quotas and count it in usage.
+    
+    Returns:
+        str: Error message, or None if the file fits
+    """
+    file_size = int(descriptor.get('fileSize', 0))
+    
+    if IMAGE_QUOTA and usage['imageCount'] + 1 > IMAGE_QUOTA:
+        return f'Image quota exceeded ({IMAGE_QUOTA} images)'
+    if STORAGE_QUOTA_BYTES and usage['originalBytes'] + file_size > STORAGE_QUOTA_BYTES:
+        return f'Storage quota exceeded ({STORAGE_QUOTA_BYTES // (1024 * 1024)}MB)'
+    
+    usage['imageCount'] += 1
+    usage['originalBytes'] += file_size
+    return None
+
+
+def find_existing_images(user_id, hashes):
+    """
+    Look up content hashes in the user's hash index.
+    
+    Uses BatchGetItem, so a full upload batch costs a couple of reads
+    rather than one query per file.
+    
+    Returns:
+        dict: sha256 -> existing imageId, for hashes already uploaded
+    """
+    unique_hashes = list({sha256 for sha256 in hashes if sha256})
+    existing = {}
+    
+    for start in range(0, len(unique_hashes), BATCH_GET_LIMIT):
+        request_items = {
+            DYNAMODB_TABLE: {
+                'Keys': [
+                    {'userId': user_id, 'imageId': f"{HASH_ITEM_PREFIX}{sha256}"}
+                    for sha256 in unique_hashes[start:start + BATCH_GET_LIMIT]
+                ],
+                'ProjectionExpression': 'imageId, targetImageId'
+            }
+        }
+        
+        # Retry throttled keys until DynamoDB has answered all of them
+        while request_items:
+            response = dynamodb.batch_get_item(RequestItems=request_items)
+            for item in response.get('Responses', {}).get(DYNAMODB_TABLE, []):
+                existing[item['imageId'][len(HASH_ITEM_PREFIX):]] = item['targetImageId']
+            request_items = response.get('UnprocessedKeys') or {}
+    
+    return existing
+
+
+def duplicate_result(descriptor, image_id):
+    """
+    Build the per-file response for content the user already uploaded.
+    """
+    return {
+        'duplicate': True,
+        'imageId': image_id,
+        'filename': descriptor.get('filename'),
+        'message': 'File already exists'
+    }
+
+
+def success_response(payload):
+    """
+    Generate standardized success response
+    """
+    return {
+        'statusCode': 200,
+        'headers': {
+            'Content-Type': 'application/json',
+            'Access-Control-Allow-Origin': '*',  # CORS
+            'Access-Control-Allow-Headers': 'Content-Type,Authorization',
+            'Access-Control-Allow-Methods': 'POST,OPTIONS'
+        },
+        'body': json.dumps(payload)
+    }
+
+
+def error_response(status_code, message, code=None):
+    """
+    Generate standardized error response (code: upstream error code, if any)
+    """
+    body = {'error': message}
+    if code:
+        body['code'] = code
     return {
         'statusCode': status_code,
         'headers': {
@@ -128,9 +621,7 @@ def error_response(status_code, message):
             'Access-Control-Allow-Headers': 'Content-Type,Authorization',
             'Access-Control-Allow-Methods': 'POST,OPTIONS'
         },
-        'body': json.dumps({
-            'error': message
-        })
+        'body': json.dumps(body)
     }
 
 
@@ -1,14 +1,41 @@
 """
-Lambda Function: ProcessImage (Simplified - No Pillow)
-Purpose: Copy uploaded images and create metadata (without resizing)
+Lambda Function: ProcessImage
+Purpose: Create resized renditions of uploaded images and their metadata
 Trigger: S3 event when image is uploaded to uploads bucket
+
+Renditions are resized with Pillow when the Pillow layer is attached;
+without it the original is copied to every rendition key as before.
+With NumPy also available the perceptual hash is a DCT pHash, otherwise
+a Pillow-only dHash.
 """
 
+import calendar
+import colorsys
+import io
 import json
 import os
+import re
+import unicodedata
 import boto3
+from boto3.dynamodb.conditions import Key, Attr
+from botocore.exceptions import ClientError
 from datetime import datetime
 from decimal import Decimal
+from urllib.parse import unquote_plus
+
+try:
+    from PIL import Image, ImageFilter, ImageOps, ImageStat
+    PIL_AVAILABLE = True
+except ImportError:
+    PIL_AVAILABLE = False
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+    if PIL_AVAILABLE:
+        print("NumPy not available: perceptual hashes fall back to dHash (see lambda-layers/LAYER_SETUP.md)")
 
 # Initialize AWS clients
 s3 = boto3.client('s3')
@@ -18,6 +45,61 @@ dynamodb = boto3.resource('dynamodb')
 UPLOADS_BUCKET = os.environ.get('UPLOADS_BUCKET', 'photogallery-uploads-23brs1079')
 PROCESSED_BUCKET = os.environ.get('PROCESSED_BUCKET', 'photogallery-processed-23brs1079')
 DYNAMODB_TABLE = os.environ.get('DYNAMODB_TABLE', 'PhotoGallery-Images')
+MAX_UPLOAD_SIZE = int(os.environ.get('MAX_UPLOAD_SIZE', str(200 * 1024 * 1024)))  # 200 MB
+
+# Prefix of the per-user content hash index items (read by GetUploadUrl)
+HASH_ITEM_PREFIX = 'hash#'
+
+# Per-user usage counters (read by GetUploadUrl for the storage quota)
+STATS_ITEM_ID = 'meta#stats'
+
+# uploads/{userId}/{imageId}-{timestamp}-{filename}, as built by GetUploadUrl
+UPLOAD_KEY_PATTERN = re.compile(
+    r'^uploads/(?P<user>[^/]+)/'
+    r'(?P<image>[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12})-\d+-(?P<name>.+)$'
+)
+
+# Per-user marker while the filename index is being backfilled; SearchImages
+# filters the partition instead of reading gram# postings until it is gone
+NAME_INDEX_PENDING_ID = 'meta#nameindex-pending'
+
+# Per-user tag dictionary (tag -> image count) maintained with AnalyzeImage and DeleteImage
+TAG_DICTIONARY_ID = 'meta#tags'
+
+# Filename trigram index (gram#<trigram>#<imageId>) read by SearchImages
+GRAM_ITEM_PREFIX = 'gram#'
+
+# Perceptual hash band index (phash#<type><band>#<value>#<imageId>) read by
+# SearchImages for GET /images/{id}/similar: the 64-bit hash is split into
+# 8 bands of 8 bits, so hashes within Hamming distance 7 share a band
+PHASH_ITEM_PREFIX = 'phash#'
+PHASH_BANDS = 8
+
+# Burst / near-duplicate groups: images whose hashes differ by at most
+# GROUP_MAX_DISTANCE bits (<= 7, the band index's guarantee) and that were
+# taken within GROUP_WINDOW_SECONDS share a groupId. The group#<groupId>
+# item maps members to their sharpness for choosing the representative.
+GROUP_ITEM_PREFIX = 'group#'
+GROUP_MAX_DISTANCE = min(int(os.environ.get('GROUP_MAX_DISTANCE', '6')), PHASH_BANDS - 1)
+GROUP_WINDOW_SECONDS = int(os.environ.get('GROUP_WINDOW_SECONDS', '120'))
+
+# Dominant colors: median-cut palette of a 64px copy of the thumbnail.
+# Palette entries covering at least MIN_COLOR_SHARE of the image are named
+# by hue bucket (upper bound in degrees) for color search.
+PALETTE_EDGE = 64
+PALETTE_SIZE = 5
+MIN_COLOR_SHARE = 0.1
+HUE_BUCKETS = [(15, 'red'), (45, 'orange'), (70, 'yellow'), (165, 'green'), (200, 'teal'),
+               (260, 'blue'), (290, 'purple'), (345, 'pink'), (360, 'red')]
+
+# Renditions, largest first: each is resized from the previous one.
+# 'maxEdge' caps the longest side; GetImages exposes them as a srcset manifest.
+RENDITIONS = [
+    {'name': 'large', 'prefix': '', 'maxEdge': 2048},
+    {'name': 'medium', 'prefix': 'med-', 'maxEdge': 1024},
+    {'name': 'thumbnail', 'prefix': 'thumb-', 'maxEdge': 400},
+]
+JPEG_QUALITY = int(os.environ.get('JPEG_QUALITY', '85'))
 
 table = dynamodb.Table(DYNAMODB_TABLE)
 
@@ -25,14 +107,21 @@ def lambda_handler(event, context):
     """
     Process uploaded images: copy to processed bucket and create metadata.
     Simplified version without image resizing.
+    
+    Direct invocation with {"backfillNameIndex": true} (optionally with a
+    "userId") indexes the filenames of images processed before the
+    filename index existed.
     """
     
+    if 'Records' not in event and event.get('backfillNameIndex'):
+        return backfill_name_index(event.get('userId'))
+    
     try:
         # Parse S3 event
         for record in event['Records']:
-            # Get bucket and key from event
+            # Get bucket and key from event (keys arrive URL-encoded)
             bucket = record['s3']['bucket']['name']
-            key = record['s3']['object']['key']
+            key = unquote_plus(record['s3']['object']['key'])
             
             print(f"Processing: s3://{bucket}/{key}")
             
@@ -41,57 +130,47 @@ def lambda_handler(event, context):
                 print(f"Skipping non-upload file: {key}")
                 continue
             
-            # Parse key: uploads/{userId}/{imageId}-{timestamp}-{filename}
-            parts = key.split('/')
-            if len(parts) < 3:
+            parsed = parse_upload_key(key)
+            if not parsed:
                 print(f"Invalid key format: {key}")
                 continue
-            
-            user_id = parts[1]
-            filename_parts = parts[2].split('-', 2)  # Split only first 2 dashes
-            
-            if len(filename_parts) < 3:
-                print(f"Invalid filename format: {parts[2]}")
-                continue
-            
-            image_id = filename_parts[0]
-            timestamp_str = filename_parts[1]
-            original_filename = filename_parts[2]
+            user_id, image_id, original_filename = parsed
             
             # Get object metadata
             head_response = s3.head_object(Bucket=bucket, Key=key)
             file_size = head_response['ContentLength']
             content_type = head_response.get('ContentType', 'application/octet-stream')
+            content_hash = head_response.get('Metadata', {}).get('sha256')
+            
+            # Multipart parts can't be size-bound when pre-signed, so guard here
+            if file_size > MAX_UPLOAD_SIZE:
+                print(f"Skipping oversize upload ({file_size} bytes): {key}")
+                continue
             
-            # Copy original to processed bucket (as "large" version)
             processed_key = f"processed/{user_id}/{image_id}.jpg"
-            s3.copy_object(
-                CopySource={'Bucket': bucket, 'Key': key},
-                Bucket=PROCESSED_BUCKET,
-                Key=processed_key,
-                ContentType=content_type
-            )
-            print(f"Copied to: s3://{PROCESSED_BUCKET}/{processed_key}")
-            
-            # Create thumbnail and medium versions (just copies for now)
             thumb_key = f"processed/{user_id}/thumb-{image_id}.jpg"
-            s3.copy_object(
-                CopySource={'Bucket': bucket, 'Key': key},
-                Bucket=PROCESSED_BUCKET,
-                Key=thumb_key,
-                ContentType=content_type
-            )
-            
             med_key = f"processed/{user_id}/med-{image_id}.jpg"
-            s3.copy_object(
-                CopySource={'Bucket': bucket, 'Key': key},
-                Bucket=PROCESSED_BUCKET,
-                Key=med_key,
-                ContentType=content_type
-            )
+            
+            features = {}
+            if PIL_AVAILABLE:
+                width, height, renditions, features = create_renditions(bucket, key, user_id, image_id)
+            else:
+                # No Pillow layer: copy the original to every rendition key
+                for rendition_key in (processed_key, thumb_key, med_key):
+                    s3.copy_object(
+                        CopySource={'Bucket': bucket, 'Key': key},
+                        Bucket=PROCESSED_BUCKET,
+                        Key=rendition_key,
+                        ContentType=content_type
+                    )
+                print(f"Copied to: s3://{PROCESSED_BUCKET}/{processed_key}")
+                width, height, renditions = 1920, 1080, None  # Placeholders
+            
+            rendition_bytes = sum(r['bytes'] for r in renditions) if renditions else 3 * file_size
             
             # Create DynamoDB entry
-            upload_timestamp = int(datetime.now().timestamp())
+            now = datetime.now()
+            upload_timestamp = int(now.timestamp())
             
             item = {
                 'imageId': image_id,
@@ -99,19 +178,45 @@ def lambda_handler(event, context):
                 'imageName': original_filename,
                 'uploadTimestamp': upload_timestamp,
                 'fileSize': file_size,
-                'width': 1920,  # Placeholder
-                'height': 1080,  # Placeholder
+                'width': width,
+                'height': height,
                 'processingStatus': 'completed',
                 'originalKey': key,
                 'processedKey': processed_key,
                 'thumbnailKey': thumb_key,
-                'mediumKey': med_key
+                'mediumKey': med_key,
+                'updatedAt': int(now.timestamp() * 1000),  # ms, UpdatedAtIndex sort key
+                'renditionBytes': rendition_bytes  # Also marks the image as counted in meta#stats
             }
+            if content_hash:
+                item['contentHash'] = content_hash
+            if renditions:
+                item['renditions'] = renditions
+            item.update(features)
             
             # Write to DynamoDB
-            table.put_item(Item=item)
+            response = table.put_item(Item=item, ReturnValues='ALL_OLD')
             print(f"Created DynamoDB entry for imageId: {image_id}")
             
+            update_usage_stats(user_id, item, response.get('Attributes'))
+            
+            # put_item dropped the previous analysis; AnalyzeImage counts its tags again
+            old_item = response.get('Attributes') or {}
+            old_tags = old_item.get('tags', []) + old_item.get('derivedTags', [])
+            if old_tags:
+                decrement_tag_counts(user_id, old_tags)
+            
+            if 'phash' in item:
+                assign_group(user_id, image_id, item, (response.get('Attributes') or {}).get('groupId'))
+            
+            if content_hash:
+                put_hash_index_item(user_id, content_hash, image_id)
+            
+            put_name_grams(user_id, image_id, original_filename, upload_timestamp)
+            
+            if 'phash' in item:
+                put_phash_bands(user_id, image_id, item)
+            
             # Trigger AnalyzeImage Lambda (async)
             lambda_client = boto3.client('lambda')
             analyze_payload = {
@@ -142,6 +247,515 @@ def lambda_handler(event, context):
         traceback.print_exc()
         raise e
 
+def create_renditions(bucket, key, user_id, image_id):
+    """
+    Decode the original once and write every rendition as JPEG.
+    
+    Returns:
+        tuple: (width, height, renditions, features) where width/height
+        are the oriented original dimensions, renditions is the manifest
+        stored on the item: [{name, width, height, format}] and features
+        are further item attributes: sharpness of the large (analysis)
+        rendition, capture time and image_features() of the thumbnail
+    """
+    body = s3.get_object(Bucket=bucket, Key=key)['Body'].read()
+    image = Image.open(io.BytesIO(body))
+    
+    # Full dimensions before draft(), which may decode JPEGs at a reduced
+    # scale; EXIF orientations 5-8 are rotated by 90 degrees
+    width, height = image.size
+    exif = image.getexif()
+    if exif.get(0x0112, 1) in (5, 6, 7, 8):
+        width, height = height, width
+    
+    features = {}
+    captured_at = capture_time(exif)
+    if captured_at:
+        features['capturedAt'] = captured_at
+    
+    # Let the JPEG decoder skip detail larger renditions would never use
+    largest = RENDITIONS[0]['maxEdge']
+    image.draft('RGB', (largest, largest))
+    
+    image = ImageOps.exif_transpose(image)
+    
+    if image.mode != 'RGB':
+        # Flatten transparency onto white
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        rgba = image.convert('RGBA')
+        background.paste(rgba, mask=rgba.split()[-1])
+        image = background
+    
+    renditions = []
+    for spec in RENDITIONS:
+        image.thumbnail((spec['maxEdge'], spec['maxEdge']), Image.LANCZOS)
+        
+        buffer = io.BytesIO()
+        image.save(buffer, format='JPEG', quality=JPEG_QUALITY, optimize=True, progressive=True)
+        
+        rendition_key = f"processed/{user_id}/{spec['prefix']}{image_id}.jpg"
+        s3.put_object(
+            Bucket=PROCESSED_BUCKET,
+            Key=rendition_key,
+            Body=buffer.getvalue(),
+            ContentType='image/jpeg',
+            CacheControl='public, max-age=31536000, immutable'
+        )
+        
+        renditions.append({
+            'name': spec['name'],
+            'width': image.size[0],
+            'height': image.size[1],
+            'format': 'jpeg',
+            'bytes': len(buffer.getvalue())
+        })
+        print(f"Wrote {spec['name']} {image.size[0]}x{image.size[1]}: {rendition_key}")
+        
+        if spec is RENDITIONS[0]:
+            # The rendition AnalyzeImage reads; ranks burst shots by focus
+            features['sharpness'] = Decimal(str(round(laplacian_variance(image), 2)))
+    
+    features.update(image_features(image))
+    return width, height, renditions, features
+
+
+def capture_time(exif):
+    """EXIF DateTimeOriginal (or DateTime) as a Unix timestamp, camera clock read as UTC."""
+    value = exif.get_ifd(0x8769).get(0x9003) or exif.get(0x0132)
+    try:
+        return calendar.timegm(datetime.strptime(str(value).strip(), '%Y:%m:%d %H:%M:%S').timetuple())
+    except ValueError:
+        return None
+
+
+def laplacian_variance(image):
+    """
+    Focus measure: variance of the 3x3 Laplacian of the grayscale image.
+    Blurred or shaken shots have weak edges and score low.
+    """
+    gray = image.convert('L')
+    if NUMPY_AVAILABLE:
+        pixels = np.asarray(gray, dtype=np.float64)
+        laplacian = (pixels[:-2, 1:-1] + pixels[2:, 1:-1] + pixels[1:-1, :-2] + pixels[1:-1, 2:]
+                     - 4 * pixels[1:-1, 1:-1])
+        return float(laplacian.var())
+    # Pillow only: the kernel output is clipped to 0-255, so centre it on
+    # 128; the 1px border is left unfiltered, so drop it like the slices above
+    laplacian = gray.filter(ImageFilter.Kernel((3, 3), [0, 1, 0, 1, -4, 1, 0, 1, 0], scale=1, offset=128))
+    width, height = laplacian.size
+    return ImageStat.Stat(laplacian.crop((1, 1, width - 1, height - 1))).var[0]
+
+
+def image_features(image):
+    """
+    Cheap descriptors computed from the thumbnail rendition, stored on the
+    item: the 64-bit perceptual hash as 16 hex digits and its type, the
+    dominant color palette and its color names.
+    """
+    if NUMPY_AVAILABLE:
+        features = {'phash': f'{dct_hash(image):016x}', 'phashType': 'dct'}
+    else:
+        features = {'phash': f'{difference_hash(image):016x}', 'phashType': 'dhash'}
+    
+    palette = color_palette(image)
+    features['palette'] = [f'#{red:02x}{green:02x}{blue:02x}' for (red, green, blue), _ in palette]
+    features['colors'] = sorted({color_name(rgb) for rgb, share in palette if share >= MIN_COLOR_SHARE})
+    return features
+
+
+def color_palette(image):
+    """
+    Up to PALETTE_SIZE dominant colors as [((r, g, b), share)], most
+    common first: median-cut quantization of a PALETTE_EDGE copy.
+    """
+    small = image.convert('RGB')
+    small.thumbnail((PALETTE_EDGE, PALETTE_EDGE), Image.BILINEAR)
+    quantized = small.quantize(colors=PALETTE_SIZE, method=Image.Quantize.MEDIANCUT)
+    colors = quantized.getpalette()
+    total = small.size[0] * small.size[1]
+    return [
+        (tuple(colors[index * 3:index * 3 + 3]), count / total)
+        for count, index in sorted(quantized.getcolors(), reverse=True)
+    ]
+
+
+def color_name(rgb):
+    """Name an RGB color: black, white or gray when dark or unsaturated, else its hue bucket."""
+    hue, saturation, value = colorsys.rgb_to_hsv(*(channel / 255 for channel in rgb))
+    if value < 0.2:
+        return 'black'
+    if saturation < 0.15:
+        return 'white' if value > 0.85 else 'gray'
+    degrees = hue * 360
+    if 15 <= degrees < 45 and value < 0.6:
+        return 'brown'
+    return next(name for bound, name in HUE_BUCKETS if degrees < bound)
+
+
+def dct_hash(image, size=32, low=8):
+    """
+    pHash: 2-D DCT of a 32x32 grayscale image (two matrix products), then
+    one bit per low-frequency coefficient of the top-left 8x8 block: above
+    or below their median (DC term excluded).
+    """
+    pixels = np.asarray(image.convert('L').resize((size, size), Image.LANCZOS), dtype=np.float64)
+    n = np.arange(size)
+    basis = np.cos(np.pi * np.outer(n, 2 * n + 1) / (2 * size))
+    basis[0] /= np.sqrt(2)
+    coefficients = (basis @ pixels @ basis.T)[:low, :low].flatten()
+    bits = coefficients > np.median(coefficients[1:])
+    return int(''.join('1' if bit else '0' for bit in bits), 2)
+
+
+def difference_hash(image):
+    """dHash: one bit per horizontally adjacent pixel pair of a 9x8 grayscale image."""
+    pixels = image.convert('L').resize((9, 8), Image.LANCZOS).tobytes()
+    value = 0
+    for row in range(8):
+        for column in range(8):
+            value = (value << 1) | (pixels[row * 9 + column] > pixels[row * 9 + column + 1])
+    return value
+
+
+def phash_bands(phash, phash_type):
+    """Band keys of a hash: <type><band index>#<2 hex digits>."""
+    return [f"{phash_type}{band}#{phash[band * 2:band * 2 + 2]}" for band in range(PHASH_BANDS)]
+
+
+def put_phash_bands(user_id, image_id, item):
+    """
+    Index the hash for similar-image search: one posting per band carrying
+    the full hash and capture time, so candidates are ranked and grouped
+    without reading the images.
+    """
+    try:
+        with table.batch_writer() as batch:
+            for band in phash_bands(item['phash'], item['phashType']):
+                batch.put_item(Item={
+                    'userId': user_id,
+                    'imageId': f"{PHASH_ITEM_PREFIX}{band}#{image_id}",
+                    'targetImageId': image_id,
+                    'phash': item['phash'],
+                    'takenAt': taken_at(item)
+                })
+    except ClientError as e:
+        print(f"Failed to write perceptual hash index: {e}")
+
+
+def taken_at(item):
+    """Capture time when the camera recorded one, else upload time."""
+    return item.get('capturedAt', item['uploadTimestamp'])
+
+
+def find_burst_neighbour(user_id, image_id, item):
+    """
+    The closest earlier image within GROUP_MAX_DISTANCE bits and
+    GROUP_WINDOW_SECONDS, from the band index, or None.
+    """
+    phash = int(item['phash'], 16)
+    nearest = None
+    for band in phash_bands(item['phash'], item['phashType']):
+        query_params = {
+            'KeyConditionExpression': Key('userId').eq(user_id) & Key('imageId').begins_with(
+                f"{PHASH_ITEM_PREFIX}{band}#"),
+            'ProjectionExpression': 'targetImageId, phash, takenAt'
+        }
+        while True:
+            response = table.query(**query_params)
+            for posting in response.get('Items', []):
+                if posting['targetImageId'] == image_id or 'takenAt' not in posting:
+                    continue
+                distance = bin(phash ^ int(posting['phash'], 16)).count('1')
+                gap = abs(int(posting['takenAt']) - taken_at(item))
+                if distance <= GROUP_MAX_DISTANCE and gap <= GROUP_WINDOW_SECONDS:
+                    candidate = (distance, gap, posting['targetImageId'])
+                    nearest = min(nearest, candidate) if nearest else candidate
+            if 'LastEvaluatedKey' not in response:
+                break
+            query_params['ExclusiveStartKey'] = response['LastEvaluatedKey']
+    return nearest[2] if nearest else None
+
+
+def assign_group(user_id, image_id, item, previous_group_id=None):
+    """
+    Put the image in the group of its closest burst neighbour, starting a
+    group (named after the neighbour) if it has none. A reprocessed image
+    stays in the group it was in. Best effort: images processed at the
+    same moment may not see each other.
+    
+    Membership and groupId are written in one transaction, so a group
+    never lists an image that doesn't point back to it.
+    
+    Returns:
+        str: groupId, or None if the image stands alone
+    """
+    try:
+        if previous_group_id:
+            join_group(user_id, image_id, item, previous_group_id)
+            return previous_group_id
+        
+        neighbour_id = find_burst_neighbour(user_id, image_id, item)
+        if not neighbour_id:
+            return None
+        
+        neighbour = table.get_item(
+            Key={'userId': user_id, 'imageId': neighbour_id},
+            ProjectionExpression='imageId, groupId, sharpness, uploadTimestamp'
+        ).get('Item')
+        if not neighbour:
+            return None
+        
+        group_id = neighbour.get('groupId', neighbour_id)
+        join_group(user_id, image_id, item, group_id, None if 'groupId' in neighbour else neighbour)
+        
+        print(f"Grouped {image_id} with {neighbour_id} in {group_id}")
+        return group_id
+        
+    except ClientError as e:
+        # TransactionCanceledException included: nothing was written
+        print(f"Failed to group image: {e}")
+        return None
+
+
+def join_group(user_id, image_id, item, group_id, founder=None):
+    """
+    One transaction: add the image to group#<groupId> and set its groupId.
+    With a founder (the ungrouped neighbour) the group item is created with
+    both members and the founder gets the groupId too.
+    """
+    now = int(datetime.now().timestamp() * 1000)
+    group_key = {'userId': user_id, 'imageId': f"{GROUP_ITEM_PREFIX}{group_id}"}
+    
+    def set_group_id(member_id, condition):
+        # updatedAt puts the groupId on the change feed
+        return {'Update': {
+            'TableName': DYNAMODB_TABLE,
+            'Key': {'userId': user_id, 'imageId': member_id},
+            'UpdateExpression': 'SET groupId = :group, updatedAt = :now',
+            'ConditionExpression': condition,
+            'ExpressionAttributeValues': {':group': group_id, ':now': now}
+        }}
+    
+    actions = [set_group_id(image_id, 'attribute_exists(imageId)')]
+    if founder:
+        actions.append({'Put': {
+            'TableName': DYNAMODB_TABLE,
+            'Item': dict(group_key, members={
+                founder['imageId']: group_member(founder),
+                image_id: group_member(item)
+            }),
+            'ConditionExpression': 'attribute_not_exists(imageId)'
+        }})
+        actions.append(set_group_id(founder['imageId'], 'attribute_exists(imageId) AND attribute_not_exists(groupId)'))
+    else:
+        actions.append({'Update': {
+            'TableName': DYNAMODB_TABLE,
+            'Key': group_key,
+            'UpdateExpression': 'SET members.#image = :member',
+            'ConditionExpression': 'attribute_exists(members)',
+            'ExpressionAttributeNames': {'#image': image_id},
+            'ExpressionAttributeValues': {':member': group_member(item)}
+        }})
+    
+    # The resource's client serializes plain Python values like Table does
+    dynamodb.meta.client.transact_write_items(TransactItems=actions)
+
+
+def group_member(item):
+    """What the group item keeps per member to pick the representative and anchor."""
+    return {'sharpness': item.get('sharpness', Decimal(0)), 'uploadTimestamp': item['uploadTimestamp']}
+
+
+def update_usage_stats(user_id, item, old_item):
+    """
+    Count the image in the user's stats item. A re-processed image (repeated
+    S3 event) replaces what the previous run counted instead of adding twice.
+    """
+    delta = {
+        'imageCount': 1,
+        'originalBytes': item['fileSize'],
+        'renditionBytes': item['renditionBytes']
+    }
+    if old_item and 'renditionBytes' in old_item:
+        delta['imageCount'] -= 1
+        delta['originalBytes'] -= int(old_item.get('fileSize', 0))
+        delta['renditionBytes'] -= int(old_item['renditionBytes'])
+        # put_item replaced the analysis too; AnalyzeImage counts it again
+        if old_item.get('analysisStatus') == 'completed':
+            delta['analyzedCount'] = -1
+    
+    names = sorted(name for name, value in delta.items() if value)
+    if not names:
+        return
+    
+    try:
+        # ADD is atomic and creates the item and counters on first use
+        table.update_item(
+            Key={'userId': user_id, 'imageId': STATS_ITEM_ID},
+            UpdateExpression='ADD ' + ', '.join(f'{name} :{name}' for name in names),
+            ExpressionAttributeValues={f':{name}': delta[name] for name in names}
+        )
+    except ClientError as e:
+        print(f"Failed to update usage stats: {e}")
+
+
+def parse_upload_key(key):
+    """
+    Split a GetUploadUrl key, uploads/{userId}/{imageId}-{timestamp}-{filename},
+    into (userId, imageId, filename), or None if it doesn't have that form.
+    The image ID is a UUID, so it can't be split off at the first dash.
+    """
+    match = UPLOAD_KEY_PATTERN.match(key)
+    if not match:
+        return None
+    return match.group('user'), match.group('image'), match.group('name')
+
+
+def decrement_tag_counts(user_id, tags):
+    """
+    Subtract a replaced analysis's tags from the user's tag dictionary.
+    """
+    names = {f'#t{i}': tag for i, tag in enumerate(sorted(set(tags)))}
+    clauses = [f'tagCounts.{name} = if_not_exists(tagCounts.{name}, :one) - :one' for name in names]
+    try:
+        table.update_item(
+            Key={'userId': user_id, 'imageId': TAG_DICTIONARY_ID},
+            UpdateExpression='SET ' + ', '.join(clauses),
+            ConditionExpression='attribute_exists(tagCounts)',
+            ExpressionAttributeNames=names,
+            ExpressionAttributeValues={':one': 1}
+        )
+    except ClientError as e:
+        # No dictionary yet (images analyzed before it existed)
+        print(f"Tag dictionary not updated: {str(e)}")
+
+
+def put_hash_index_item(user_id, content_hash, image_id):
+    """
+    Record the content hash so GetUploadUrl can skip re-uploads.
+    The first image with a given hash wins.
+    """
+    try:
+        table.put_item(
+            Item={
+                'userId': user_id,
+                'imageId': f"{HASH_ITEM_PREFIX}{content_hash}",
+                'targetImageId': image_id
+            },
+            ConditionExpression='attribute_not_exists(imageId)'
+        )
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+            print(f"Failed to write hash index item: {e}")
+
+
+def name_trigrams(name):
+    """Distinct 3-character substrings of the normalized (NFKC, case-folded) name."""
+    normalized = unicodedata.normalize('NFKC', name).casefold()
+    return {normalized[i:i + 3] for i in range(len(normalized) - 2)}
+
+
+def put_name_grams(user_id, image_id, name, upload_timestamp):
+    """
+    Index the filename for substring search: one posting per trigram. A
+    re-processed image overwrites its postings with the new upload time.
+    
+    Returns:
+        bool: False if the postings could not be written
+    """
+    try:
+        with table.batch_writer() as batch:
+            for gram in name_trigrams(name):
+                batch.put_item(Item={
+                    'userId': user_id,
+                    'imageId': f"{GRAM_ITEM_PREFIX}{gram}#{image_id}",
+                    'targetImageId': image_id,
+                    # Not uploadTimestamp: postings must stay out of UploadTimeIndex
+                    'uploadedAt': upload_timestamp
+                })
+    except ClientError as e:
+        # Filename search falls back to filtering the whole library
+        print(f"Failed to write filename index: {e}")
+        return False
+    return True
+
+
+def backfill_name_index(user_id=None):
+    """
+    Write filename postings for every image of one user (or all users).
+    
+    Each user first gets a pending marker, so SearchImages filters their
+    partition while postings are missing; the marker is removed once all
+    their images are indexed. Items processed before upload keys were
+    parsed correctly carry UUID fragments and the timestamp in imageName:
+    the name is repaired from originalKey and the old postings removed.
+    Safe to re-run.
+    """
+    params = {
+        'FilterExpression': Attr('uploadTimestamp').exists(),
+        'ProjectionExpression': 'userId, imageId, imageName, originalKey, uploadTimestamp'
+    }
+    if user_id:
+        params['KeyConditionExpression'] = Key('userId').eq(user_id)
+    
+    images = {}
+    while True:
+        response = table.query(**params) if user_id else table.scan(**params)
+        for item in response.get('Items', []):
+            images.setdefault(item['userId'], []).append(item)
+        if 'LastEvaluatedKey' not in response:
+            break
+        params['ExclusiveStartKey'] = response['LastEvaluatedKey']
+    
+    for owner in images:
+        table.put_item(Item={'userId': owner, 'imageId': NAME_INDEX_PENDING_ID})
+    
+    indexed = 0
+    for owner, items in images.items():
+        complete = True
+        for item in items:
+            name = item.get('imageName', '')
+            parsed = parse_upload_key(item.get('originalKey', ''))
+            if parsed and parsed[2] != name:
+                name = repair_image_name(owner, item['imageId'], name, parsed[2])
+                if name is None:
+                    continue  # Deleted meanwhile
+            if put_name_grams(owner, item['imageId'], name, int(item['uploadTimestamp'])):
+                indexed += 1
+            else:
+                complete = False
+        if complete:
+            table.delete_item(Key={'userId': owner, 'imageId': NAME_INDEX_PENDING_ID})
+        else:
+            print(f"Filename index incomplete for user {owner}; marker kept, re-run the backfill")
+    
+    print(f"Backfilled filename index: {indexed} images, {len(images)} users")
+    return {'users': len(images), 'images': indexed}
+
+
+def repair_image_name(user_id, image_id, old_name, name):
+    """
+    Replace a mis-parsed imageName and drop the postings built from it.
+    Returns the new name, or None if the image no longer exists.
+    """
+    try:
+        table.update_item(
+            Key={'userId': user_id, 'imageId': image_id},
+            UpdateExpression='SET imageName = :name',
+            ConditionExpression='attribute_exists(imageId)',
+            ExpressionAttributeValues={':name': name}
+        )
+    except ClientError as e:
+        if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+            return None
+        raise
+    stale = name_trigrams(old_name) - name_trigrams(name)
+    with table.batch_writer() as batch:
+        for gram in stale:
+            batch.delete_item(Key={'userId': user_id, 'imageId': f"{GRAM_ITEM_PREFIX}{gram}#{image_id}"})
+    return name
+
+
 # For local testing
 if __name__ == '__main__':
     # Test event
@@ -151,7 +765,7 @@ if __name__ == '__main__':
                 's3': {
                     'bucket': {'name': 'photogallery-uploads-23brs1079'},
                     'object': {
-                        'key': 'uploads/test-user/test-image-20231104-photo.jpg',
+                        'key': 'uploads/test-user/550e8400-e29b-41d4-a716-446655440000-20231104120000-photo.jpg',
                         'size': 1024000
                     }
                 }
@@ -1,15 +1,22 @@
 """
 Lambda Function: SearchImages
-Purpose: Search images by tags, filename, date range
-Trigger: API Gateway GET /images/search
+Purpose: Search images by tags, filename, date range; facet counts for search filters;
+         visually similar images
+Trigger: API Gateway GET /images/search, GET /images/facets, GET /images/{imageId}/similar
 """
 
+import base64
+import calendar
+import heapq
 import json
+import math
 import os
+import re
+import unicodedata
 import boto3
 from boto3.dynamodb.conditions import Key, Attr
 from decimal import Decimal
-from datetime import datetime
+from datetime import datetime, timedelta
 
 # Initialize AWS clients
 dynamodb = boto3.resource('dynamodb')
@@ -19,6 +26,42 @@ DYNAMODB_TABLE = os.environ.get('DYNAMODB_TABLE', 'PhotoGallery-Images')
 PROCESSED_BUCKET = os.environ.get('PROCESSED_BUCKET', 'photogallery-processed-23brs1079')
 CLOUDFRONT_DOMAIN = os.environ.get('CLOUDFRONT_DOMAIN', '')
 
+# Nominal rendition sizes for items processed before ProcessImage stored a manifest
+DEFAULT_RENDITIONS = [
+    {'name': 'thumbnail', 'width': 400, 'format': 'jpeg'},
+    {'name': 'medium', 'width': 1024, 'format': 'jpeg'},
+    {'name': 'large', 'width': 2048, 'format': 'jpeg'},
+]
+
+# Per-user aggregate items: facets (AggregateFacets) and tag counts (AnalyzeImage)
+FACETS_ITEM_ID = 'meta#facets'
+TAG_DICTIONARY_ID = 'meta#tags'
+FACET_COUNTERS = ('imageCount', 'withFaces', 'withText', 'unsafe', 'analyzed')
+DEFAULT_FACET_TAGS = 20
+
+# Query language (q=...): read budget per request and cost model for explain
+MAX_QUERY_PAGES = 10
+AVG_ITEM_BYTES = 2048  # Typical image item with aiAnalysis; 4 KB = 1 RCU (0.5 eventually consistent)
+
+# sort=relevance reads every candidate to rank it; cap the 1 MB pages read
+MAX_RELEVANCE_PAGES = 20
+
+# Term index over detected text and filenames written by AnalyzeImage
+TERM_ITEM_PREFIX = 'term#'
+TERM_LINE_GAP = 1000
+MAX_TERM_LENGTH = 64
+INDEX_BATCH_SIZE = 50  # Candidate images read per BatchGetItem
+
+# Filename trigram index written by ProcessImage
+GRAM_ITEM_PREFIX = 'gram#'
+NAME_INDEX_PENDING_ID = 'meta#nameindex-pending'  # Backfill running: postings incomplete
+
+# Perceptual hash band index written by ProcessImage: 8 bands of 8 bits, so
+# every hash within Hamming distance 7 shares a band with the query
+PHASH_ITEM_PREFIX = 'phash#'
+PHASH_BANDS = 8
+DEFAULT_SIMILAR_DISTANCE = 6
+
 table = dynamodb.Table(DYNAMODB_TABLE)
 
 def lambda_handler(event, context):
@@ -32,9 +75,16 @@ def lambda_handler(event, context):
     - dateTo: End date (YYYY-MM-DD or Unix timestamp)
     - hasFaces: true/false
     - hasText: true/false
+    - faceAttributes: Comma-separated face attributes, all required
+      (e.g., "smiling,emotion:happy,age:20-30")
+    - color: Comma-separated dominant color names, all required (e.g., "blue")
     - limit: Results per page (1-100, default: 20)
     - sortOrder: asc/desc (default: desc - newest first)
+    - sort: "relevance" to rank by label confidence and matched terms
     - lastKey: Pagination token
+    - q: Boolean query, replaces the filters above, e.g.
+         beach AND (sunset OR dusk) NOT people faces:>2 text:"menu" date:2024-06
+    - explain: true to include the query plan and its read cost
     """
     
     try:
@@ -44,6 +94,15 @@ def lambda_handler(event, context):
         # Get query parameters
         params = event.get('queryStringParameters') or {}
         
+        if is_facets_request(event):
+            return get_facets(user_id, params)
+        
+        if is_similar_request(event):
+            return get_similar(user_id, event['pathParameters']['imageId'], params)
+        
+        if params.get('q'):
+            return handle_query(user_id, params)
+        
         # Parse search criteria
         search_tags = params.get('tags', '').lower().split(',') if params.get('tags') else []
         search_filename = params.get('filename', '').lower()
@@ -51,6 +110,10 @@ def lambda_handler(event, context):
         date_to = parse_timestamp(params.get('dateTo'))
         has_faces = params.get('hasFaces', '').lower() == 'true' if params.get('hasFaces') else None
         has_text = params.get('hasText', '').lower() == 'true' if params.get('hasText') else None
+        face_attributes = [
+            attribute.strip() for attribute in params.get('faceAttributes', '').lower().split(',') if attribute.strip()
+        ]
+        colors = [color_bucket(color) for color in params.get('color', '').split(',') if color.strip()]
         
         # Pagination parameters
         limit = min(int(params.get('limit', 20)), 100)
@@ -59,20 +122,37 @@ def lambda_handler(event, context):
         
         print(f"Search - User: {user_id}, Tags: {search_tags}, Filename: {search_filename}")
         
+        if search_filename:
+            # Substring match through the filename trigram index
+            return execute_query(user_id, legacy_query(
+                search_tags, search_filename, date_from, date_to, has_faces, has_text, face_attributes, colors
+            ), params)
+        
         # Build query
         query_params = build_query(
             user_id=user_id,
             tags=search_tags,
-            filename=search_filename,
             date_from=date_from,
             date_to=date_to,
             has_faces=has_faces,
             has_text=has_text,
+            face_attributes=face_attributes,
+            colors=colors,
             limit=limit,
             sort_order=sort_order,
             last_key=last_key
         )
         
+        if params.get('sort', '').lower() == 'relevance':
+            query_params.pop('Limit', None)
+            query_params.pop('ExclusiveStartKey', None)
+            stats = {'pages': 0, 'scanned': 0, 'consumed': 0.0}
+            items, next_key = rank_by_relevance(
+                query_pages(query_params, stats, MAX_RELEVANCE_PAGES),
+                [tag for tag in search_tags if tag], [], limit, stats, decode_relevance_cursor(last_key)
+            )
+            return search_response(user_id, items, next_key, stats)
+        
         # Execute search
         response = table.query(**query_params)
         
@@ -91,9 +171,8 @@ def lambda_handler(event, context):
         
         # Add pagination token if more results available
         if 'LastEvaluatedKey' in response:
-            import base64
             result['nextKey'] = base64.b64encode(
-                json.dumps(response['LastEvaluatedKey']).encode()
+                json.dumps(response['LastEvaluatedKey'], cls=DecimalEncoder).encode()
             ).decode()
         
         return {
@@ -113,6 +192,17 @@ def lambda_handler(event, context):
             })
         }
     
+    except ValueError as e:
+        print(f"Invalid parameter: {str(e)}")
+        return {
+            'statusCode': 400,
+            'headers': get_cors_headers(),
+            'body': json.dumps({
+                'error': 'Bad Request',
+                'message': str(e)
+            })
+        }
+    
     except Exception as e:
         print(f"Search error: {str(e)}")
         return {
@@ -125,13 +215,1041 @@ def lambda_handler(event, context):
         }
 
 
-def build_query(user_id, tags, filename, date_from, date_to, has_faces, has_text, limit, sort_order, last_key):
+def is_facets_request(event):
+    """GET /images/facets is routed to this function as well."""
+    path = event.get('resource') or event.get('path') or ''
+    return path.rstrip('/').endswith('/facets')
+
+
+def get_facets(user_id, params):
+    """
+    Return the user's precomputed facet counts: both aggregate items in one
+    BatchGetItem instead of scanning the library.
+    
+    Query Parameters:
+    - tagLimit: Number of top tags to return (1-100, default: 20)
+    """
+    try:
+        tag_limit = min(max(int(params.get('tagLimit', DEFAULT_FACET_TAGS)), 1), 100)
+    except ValueError:
+        tag_limit = DEFAULT_FACET_TAGS
+    
+    request = {
+        DYNAMODB_TABLE: {
+            'Keys': [
+                {'userId': user_id, 'imageId': FACETS_ITEM_ID},
+                {'userId': user_id, 'imageId': TAG_DICTIONARY_ID}
+            ]
+        }
+    }
+    items = {}
+    while request:
+        response = dynamodb.batch_get_item(RequestItems=request)
+        for item in response.get('Responses', {}).get(DYNAMODB_TABLE, []):
+            items[item['imageId']] = item
+        # Throttled keys come back unprocessed; read them again
+        request = response.get('UnprocessedKeys')
+    facets = items.get(FACETS_ITEM_ID, {})
+    tag_counts = items.get(TAG_DICTIONARY_ID, {}).get('tagCounts', {})
+    
+    result = {name: int(facets.get(name, 0)) for name in FACET_COUNTERS}
+    result['months'] = [
+        {'month': month, 'count': int(count)}
+        for month, count in sorted(facets.get('months', {}).items())
+        if count > 0
+    ]
+    top_tags = sorted(
+        ((tag, int(count)) for tag, count in tag_counts.items() if count > 0),
+        key=lambda entry: (-entry[1], entry[0])
+    )[:tag_limit]
+    result['tags'] = [{'tag': tag, 'count': count} for tag, count in top_tags]
+    result['faceAttributes'] = [
+        {'attribute': attribute, 'count': int(count)}
+        for attribute, count in sorted(facets.get('faceAttributes', {}).items(), key=lambda entry: (-entry[1], entry[0]))
+        if count > 0
+    ]
+    
+    return {
+        'statusCode': 200,
+        'headers': get_cors_headers(),
+        'body': json.dumps(result, cls=DecimalEncoder)
+    }
+
+
+def is_similar_request(event):
+    """GET /images/{imageId}/similar is routed to this function as well."""
+    path = event.get('resource') or event.get('path') or ''
+    return path.rstrip('/').endswith('/similar')
+
+
+def get_similar(user_id, image_id, params):
+    """
+    Images that look like the given one, nearest first.
+    
+    Multi-index hashing: each of the image's 8 hash bands is one key-prefix
+    Query on the band index; any image within Hamming distance 7 appears
+    in at least one of them. Postings carry the full hash, so candidates
+    are ranked before any image item is read.
+    
+    Query parameters:
+    - maxDistance: Largest Hamming distance to return (0-7, default: 6)
+    - limit: Results (1-100, default: 20)
+    """
+    # Index and meta items share the partition; image IDs never contain '#'
+    if '#' in image_id:
+        return {
+            'statusCode': 400,
+            'headers': get_cors_headers(),
+            'body': json.dumps({'error': 'Bad Request', 'message': f'Invalid image ID: {image_id}'})
+        }
+    
+    limit = min(max(int(params.get('limit', 20)), 1), 100)
+    max_distance = min(max(int(params.get('maxDistance', DEFAULT_SIMILAR_DISTANCE)), 0), PHASH_BANDS - 1)
+    
+    source = table.get_item(
+        Key={'userId': user_id, 'imageId': image_id},
+        ProjectionExpression='imageId, phash, phashType, uploadTimestamp'
+    ).get('Item')
+    if not source or 'uploadTimestamp' not in source:
+        return {
+            'statusCode': 404,
+            'headers': get_cors_headers(),
+            'body': json.dumps({'error': 'Not Found', 'message': 'Image not found'})
+        }
+    
+    result = {'imageId': image_id, 'images': [], 'count': 0}
+    if 'phash' not in source:
+        # Processed without Pillow, or before hashes were computed
+        result['message'] = 'Image has no perceptual hash'
+    else:
+        phash = int(source['phash'], 16)
+        candidates = {}
+        for band in range(PHASH_BANDS):
+            band_key = f"{source['phashType']}{band}#{source['phash'][band * 2:band * 2 + 2]}"
+            query_params = {
+                'KeyConditionExpression': Key('userId').eq(user_id) & Key('imageId').begins_with(
+                    f"{PHASH_ITEM_PREFIX}{band_key}#"),
+                'ProjectionExpression': 'targetImageId, phash'
+            }
+            while True:
+                response = table.query(**query_params)
+                for posting in response.get('Items', []):
+                    candidates[posting['targetImageId']] = posting['phash']
+                if 'LastEvaluatedKey' not in response:
+                    break
+                query_params['ExclusiveStartKey'] = response['LastEvaluatedKey']
+        
+        candidates.pop(image_id, None)
+        nearest = sorted(
+            (bin(phash ^ int(other, 16)).count('1'), other_id) for other_id, other in candidates.items()
+        )
+        nearest = [(distance, other_id) for distance, other_id in nearest if distance <= max_distance][:limit]
+        
+        found = batch_get_images(user_id, [other_id for _, other_id in nearest], {'pages': 0, 'consumed': 0.0})
+        for distance, other_id in nearest:
+            if other_id in found:
+                image = format_image_item(found[other_id])
+                image['distance'] = distance
+                result['images'].append(image)
+        result['count'] = len(result['images'])
+        result['candidates'] = len(candidates)
+    
+    return {
+        'statusCode': 200,
+        'headers': get_cors_headers(),
+        'body': json.dumps(result, cls=DecimalEncoder)
+    }
+
+
+# ---------------------------------------------------------------------------
+# Query language
+#
+#   query   := or
+#   or      := and ("OR" and)*
+#   and     := not (["AND"] not)*          juxtaposition means AND
+#   not     := "NOT" not | atom
+#   atom    := "(" or ")" | field ":" value | "phrase" | word
+#
+# Words and phrases match tags. Fields: tag:, name: (filename), text: (OCR),
+# faces: (N, >N, >=N, <N, <=N), has:faces, has:text, date: (YYYY,
+# YYYY-MM, YYYY-MM-DD or FROM..TO) and face attributes: face: (smiling,
+# eyeglasses, sunglasses, beard), emotion:, age: (N or 20-30) and color:
+# (a COLOR_BUCKETS name). Nodes are dicts with an 'op' key.
+# ---------------------------------------------------------------------------
+
+TOKEN_PATTERN = re.compile(r'''
+    \s*(?:
+        (?P<lparen>\() |
+        (?P<rparen>\)) |
+        (?P<field>[A-Za-z]+):(?:"(?P<quoted>[^"]*)"|(?P<value>[^\s()"]+)) |
+        "(?P<phrase>[^"]*)" |
+        (?P<word>[^\s()"]+)
+    )''', re.VERBOSE)
+FACES_PATTERN = re.compile(r'^(>=|<=|>|<|=)?(\d+)$')
+MAX_TIMESTAMP = 253402300799  # 9999-12-31T23:59:59Z, open-ended date ranges
+AGE_PATTERN = re.compile(r'^(\d{1,3})(?:-\d{1,3})?$')  # Decade buckets: age:25 and age:20-30 both mean 20-30
+# Dominant color names ProcessImage stores in 'colors'
+COLOR_BUCKETS = ('red', 'orange', 'brown', 'yellow', 'green', 'teal', 'blue', 'purple', 'pink',
+                 'white', 'gray', 'black')
+DATE_PATTERN = re.compile(r'^(\d{4})(?:-(\d{2}))?(?:-(\d{2}))?$')
+OPERATORS = {'AND', 'OR', 'NOT'}
+
+
+def tokenize_query(text):
+    """Split a query into (kind, value) tokens."""
+    tokens = []
+    position = 0
+    text = text.strip()
+    while position < len(text):
+        match = TOKEN_PATTERN.match(text, position)
+        if not match or match.end() == position:
+            raise ValueError(f'Unexpected character at position {position}')
+        position = match.end()
+        
+        if match.group('lparen'):
+            tokens.append(('(', None))
+        elif match.group('rparen'):
+            tokens.append((')', None))
+        elif match.group('field'):
+            value = match.group('quoted') if match.group('quoted') is not None else match.group('value')
+            tokens.append(('field', (match.group('field').lower(), value)))
+        elif match.group('phrase') is not None:
+            tokens.append(('term', match.group('phrase')))
+        elif match.group('word') in OPERATORS:
+            tokens.append((match.group('word'), None))
+        else:
+            tokens.append(('term', match.group('word')))
+    return tokens
+
+
+def parse_query(text):
+    """
+    Parse a query string into an AST.
+    
+    Raises:
+        ValueError: On syntax errors or unknown fields
+    """
+    tokens = tokenize_query(text)
+    if not tokens:
+        raise ValueError('Empty query')
+    
+    position = 0
+    
+    def peek():
+        return tokens[position][0] if position < len(tokens) else None
+    
+    def take():
+        nonlocal position
+        token = tokens[position]
+        position += 1
+        return token
+    
+    def parse_or():
+        args = [parse_and()]
+        while peek() == 'OR':
+            take()
+            args.append(parse_and())
+        return args[0] if len(args) == 1 else {'op': 'or', 'args': args}
+    
+    def parse_and():
+        args = [parse_not()]
+        while peek() in ('AND', 'NOT', '(', 'field', 'term'):
+            if peek() == 'AND':
+                take()
+            args.append(parse_not())
+        return args[0] if len(args) == 1 else {'op': 'and', 'args': args}
+    
+    def parse_not():
+        if peek() == 'NOT':
+            take()
+            return {'op': 'not', 'arg': parse_not()}
+        return parse_atom()
+    
+    def parse_atom():
+        kind = peek()
+        if kind is None:
+            raise ValueError('Query ends unexpectedly')
+        kind, value = take()
+        if kind == '(':
+            node = parse_or()
+            if peek() != ')':
+                raise ValueError('Missing closing parenthesis')
+            take()
+            return node
+        if kind == 'term':
+            return {'op': 'tag', 'value': value.lower()}
+        if kind == 'field':
+            return parse_field(*value)
+        raise ValueError(f'Unexpected {kind}')
+    
+    node = parse_or()
+    if position != len(tokens):
+        raise ValueError(f'Unexpected {tokens[position][0]}')
+    return node
+
+
+def parse_field(field, value):
+    """Build the AST node for field:value."""
+    if field == 'tag':
+        return {'op': 'tag', 'value': value.lower()}
+    if field == 'name':
+        return {'op': 'name', 'value': normalize_name(value)}
+    if field == 'text':
+        # Words match whole terms, several words a phrase; a trailing *
+        # makes the last word a prefix
+        tokens = text_tokens(value)
+        if not tokens:
+            raise ValueError(f'No words in text:{value}')
+        return {'op': 'text', 'value': value.lower(), 'tokens': tokens, 'prefix': value.endswith('*')}
+    if field == 'has' and value.lower() in ('faces', 'text'):
+        if value.lower() == 'faces':
+            return {'op': 'faces', 'cmp': '>', 'value': 0}
+        return {'op': 'hastext'}
+    if field == 'faces':
+        match = FACES_PATTERN.match(value)
+        if not match:
+            raise ValueError(f'Invalid faces value: {value}')
+        return {'op': 'faces', 'cmp': match.group(1) or '=', 'value': int(match.group(2))}
+    if field == 'face':
+        return {'op': 'face', 'value': value.lower()}
+    if field == 'emotion':
+        return {'op': 'face', 'value': f'emotion:{value.lower()}'}
+    if field == 'age':
+        match = AGE_PATTERN.match(value)
+        if not match:
+            raise ValueError(f'Invalid age: {value}')
+        decade = int(match.group(1)) // 10 * 10
+        return {'op': 'face', 'value': f'age:{decade}-{decade + 10}'}
+    if field == 'color':
+        return {'op': 'color', 'value': color_bucket(value)}
+    if field == 'date':
+        start_text, _, end_text = value.partition('..')
+        start = date_bounds(start_text)[0]
+        end = date_bounds(end_text or start_text)[1]
+        return {'op': 'date', 'from': start, 'to': end}
+    raise ValueError(f'Unknown field: {field}')
+
+
+def color_bucket(value):
+    """Validate a color name (grey is accepted for gray)."""
+    color = value.strip().lower().replace('grey', 'gray')
+    if color not in COLOR_BUCKETS:
+        raise ValueError(f"Unknown color: {value} (one of {', '.join(COLOR_BUCKETS)})")
+    return color
+
+
+def date_bounds(text):
+    """First and last second (UTC) of a year, month or day."""
+    match = DATE_PATTERN.match(text)
+    if not match:
+        raise ValueError(f'Invalid date: {text}')
+    year, month, day = match.group(1), match.group(2), match.group(3)
+    year = int(year)
+    if month is None:
+        start, end = datetime(year, 1, 1), datetime(year + 1, 1, 1)
+    elif day is None:
+        month = int(month)
+        start = datetime(year, month, 1)
+        end = datetime(year + month // 12, month % 12 + 1, 1)
+    else:
+        start = datetime(year, int(month), int(day))
+        end = start + timedelta(days=1)
+    return calendar.timegm(start.timetuple()), calendar.timegm(end.timetuple()) - 1
+
+
+def describe(node):
+    """Readable form of an AST node for explain output."""
+    op = node['op']
+    if op in ('and', 'or'):
+        return '(' + f' {op.upper()} '.join(describe(arg) for arg in node['args']) + ')'
+    if op == 'not':
+        return f"NOT {describe(node['arg'])}"
+    if op == 'faces':
+        return f"faces {node['cmp']} {node['value']}"
+    if op == 'date':
+        return f"uploadTimestamp BETWEEN {node['from']} AND {node['to']}"
+    if op == 'hastext':
+        return 'hasText'
+    return f"{op}:\"{node['value']}\""
+
+
+def to_condition(node):
+    """
+    Translate a node into a DynamoDB FilterExpression, or None if any part
+    of it can't be evaluated by DynamoDB (case-insensitive substring
+    matches over the filename and OCR text).
+    """
+    op = node['op']
+    if op == 'tag':
+        # Derived tags (label parents, synonyms) make broad terms one lookup
+        return Attr('tags').contains(node['value']) | Attr('derivedTags').contains(node['value'])
+    if op == 'hastext':
+        return Attr('aiAnalysis.hasText').eq(True)
+    if op == 'face':
+        return Attr('faceAttributes').contains(node['value'])
+    if op == 'color':
+        return Attr('colors').contains(node['value'])
+    if op == 'date':
+        return Attr('uploadTimestamp').between(node['from'], node['to'])
+    if op == 'faces':
+        attr = Attr('aiAnalysis.faceCount')
+        return {
+            '=': attr.eq, '>': attr.gt, '>=': attr.gte, '<': attr.lt, '<=': attr.lte
+        }[node['cmp']](node['value'])
+    if op == 'not':
+        inner = to_condition(node['arg'])
+        return ~inner if inner is not None else None
+    if op in ('and', 'or'):
+        conditions = [to_condition(arg) for arg in node['args']]
+        if any(condition is None for condition in conditions):
+            return None
+        combined = conditions[0]
+        for condition in conditions[1:]:
+            combined = (combined & condition) if op == 'and' else (combined | condition)
+        return combined
+    return None
+
+
+def evaluate(node, item):
+    """Evaluate a node against an item in Lambda (post-filter)."""
+    op = node['op']
+    ai = item.get('aiAnalysis') or {}
+    if op == 'and':
+        return all(evaluate(arg, item) for arg in node['args'])
+    if op == 'or':
+        return any(evaluate(arg, item) for arg in node['args'])
+    if op == 'not':
+        return not evaluate(node['arg'], item)
+    if op == 'tag':
+        return node['value'] in (item.get('tags') or []) or node['value'] in (item.get('derivedTags') or [])
+    if op == 'name':
+        return node['value'] in normalize_name(item.get('imageName', ''))
+    if op == 'text':
+        lines = [str(detection.get('text', '')) for detection in ai.get('textDetections') or []]
+        postings = term_postings(lines + [os.path.splitext(item.get('imageName', ''))[0]])
+        last = len(node['tokens']) - 1
+        return phrase_match([
+            {
+                position for term, positions in postings.items()
+                if term == token or (node['prefix'] and i == last and term.startswith(token))
+                for position in positions
+            }
+            for i, token in enumerate(node['tokens'])
+        ])
+    if op == 'hastext':
+        return bool(ai.get('hasText'))
+    if op == 'face':
+        return node['value'] in (item.get('faceAttributes') or [])
+    if op == 'color':
+        return node['value'] in (item.get('colors') or [])
+    if op == 'date':
+        return node['from'] <= int(item.get('uploadTimestamp', 0)) <= node['to']
+    if op == 'faces':
+        count = int(ai.get('faceCount', 0))
+        return {
+            '=': count == node['value'], '>': count > node['value'], '>=': count >= node['value'],
+            '<': count < node['value'], '<=': count <= node['value']
+        }[node['cmp']]
+    return False
+
+
+def conjuncts(node):
+    """Top-level AND terms of a query."""
+    return node['args'] if node['op'] == 'and' else [node]
+
+
+def plan_query(ast, facets, index_matches=None, index_terms=()):
+    """
+    Choose an access path and split the predicates.
+    
+    Candidate paths are ranked by how many items they would read, estimated
+    from the facets item (imageCount, uploads per month). A required date
+    range becomes a key condition on UploadTimeIndex; otherwise the user's
+    whole partition of the index is read. Required text: and name: terms
+    were already looked up in their indexes (index_matches, imageId ->
+    uploadTimestamp), so that path's estimate is exact. Remaining predicates go to the
+    FilterExpression when DynamoDB can evaluate them (saves response size,
+    not read capacity) and are post-filtered in Lambda otherwise.
+    """
+    terms = conjuncts(ast)
+    date_terms = [term for term in terms if term['op'] == 'date']
+    other_terms = [term for term in terms if term['op'] != 'date']
+    
+    candidates = [{
+        'accessPath': 'UploadTimeIndex (full partition)',
+        'range': None,
+        'terms': terms,
+        'estimatedItems': facets.get('imageCount')
+    }]
+    
+    if date_terms:
+        start = max(term['from'] for term in date_terms)
+        end = min(term['to'] for term in date_terms)
+        candidates.append({
+            'accessPath': 'UploadTimeIndex (uploadTimestamp range)',
+            'range': (start, end),
+            'terms': other_terms,
+            'estimatedItems': estimate_range(facets, start, end)
+        })
+    
+    if index_matches is not None:
+        if date_terms:
+            index_matches = {
+                image_id: uploaded for image_id, uploaded in index_matches.items()
+                if start <= uploaded <= end
+            }
+        indexes = sorted({'TermIndex' if term['op'] == 'text' else 'NameTrigramIndex' for term in index_terms})
+        candidates.append({
+            'accessPath': ' + '.join(indexes) + ' (postings)',
+            'range': None,
+            'matches': index_matches,
+            # Text postings are exact; trigram matches are verified on the name
+            'terms': [term for term in other_terms if not (term['op'] == 'text' and term in index_terms)],
+            'estimatedItems': len(index_matches)
+        })
+    
+    # Unknown estimates rank after known ones; later (narrower) paths win ties
+    chosen = min(
+        reversed(candidates),
+        key=lambda c: (c['estimatedItems'] is None, c['estimatedItems'] or 0)
+    )
+    
+    pushed = []
+    post = []
+    for term in chosen['terms']:
+        # Images read by key can't take a FilterExpression
+        pushable = 'matches' not in chosen and to_condition(term) is not None
+        (pushed if pushable else post).append(term)
+    
+    chosen['pushed'] = pushed
+    chosen['post'] = post
+    chosen['candidates'] = [
+        {'accessPath': c['accessPath'], 'estimatedItems': c['estimatedItems']} for c in candidates
+    ]
+    return chosen
+
+
+def estimate_range(facets, start, end):
+    """Items uploaded in [start, end], from the per-month histogram."""
+    months = facets.get('months')
+    if months is None:
+        return None
+    if start > end:
+        return 0
+    first = datetime.utcfromtimestamp(start).strftime('%Y-%m')
+    last = datetime.utcfromtimestamp(end).strftime('%Y-%m')
+    return sum(int(count) for month, count in months.items() if first <= month <= last)
+
+
+def estimated_read_units(items):
+    """Eventually consistent read capacity for reading items through a query."""
+    if items is None:
+        return None
+    return math.ceil(items * AVG_ITEM_BYTES / 4096) * 0.5
+
+
+def handle_query(user_id, params):
+    """Run a q= search: parse, plan, read the chosen path, post-filter."""
+    try:
+        ast = parse_query(params['q'])
+    except ValueError as e:
+        return {
+            'statusCode': 400,
+            'headers': get_cors_headers(),
+            'body': json.dumps({'error': 'Bad Request', 'message': f'Invalid query: {str(e)}'})
+        }
+    
+    return execute_query(user_id, ast, params)
+
+
+def legacy_query(tags, filename, date_from, date_to, has_faces, has_text, face_attributes=(), colors=()):
+    """The tags/filename/date/hasFaces/hasText parameters as a query AST."""
+    terms = []
+    tag_terms = [{'op': 'tag', 'value': tag} for tag in tags if tag]
+    if tag_terms:
+        terms.append(tag_terms[0] if len(tag_terms) == 1 else {'op': 'or', 'args': tag_terms})
+    if filename:
+        terms.append({'op': 'name', 'value': normalize_name(filename)})
+    if date_from or date_to:
+        terms.append({'op': 'date', 'from': date_from or 0, 'to': date_to or MAX_TIMESTAMP})
+    if has_faces is not None:
+        terms.append({'op': 'faces', 'cmp': '>' if has_faces else '=', 'value': 0})
+    if has_text is not None:
+        terms.append({'op': 'hastext'} if has_text else {'op': 'not', 'arg': {'op': 'hastext'}})
+    terms.extend({'op': 'face', 'value': attribute} for attribute in face_attributes)
+    terms.extend({'op': 'color', 'value': color} for color in colors)
+    return terms[0] if len(terms) == 1 else {'op': 'and', 'args': terms}
+
+
+def execute_query(user_id, ast, params):
+    """Plan and run a parsed query; params carry limit, sort, lastKey and explain."""
+    limit = min(max(int(params.get('limit', 20)), 1), 100)
+    sort_desc = params.get('sortOrder', 'desc').lower() == 'desc'
+    explain = params.get('explain', '').lower() == 'true'
+    relevance = params.get('sort', '').lower() == 'relevance'
+    stats = {'pages': 0, 'scanned': 0, 'consumed': 0.0, 'postings': 0}
+    
+    facets = get_facets_item(user_id) if explain or any(t['op'] == 'date' for t in conjuncts(ast)) else {}
+    
+    # Required text and filename terms are looked up in their indexes
+    # before planning; each lookup narrows the candidates further
+    index_matches = None
+    index_terms = []
+    name_index_ready = None
+    for term in conjuncts(ast):
+        if term['op'] == 'text':
+            matches = lookup_text(user_id, term, stats)
+        elif term['op'] == 'name' and len(term['value']) >= 3:
+            if name_index_ready is None:
+                name_index_ready = name_index_complete(user_id)
+            if not name_index_ready:
+                continue  # Stays in the post-filter over the partition
+            matches = lookup_name(user_id, term, stats)
+        else:
+            continue
+        index_terms.append(term)
+        index_matches = matches if index_matches is None else {
+            image_id: uploaded for image_id, uploaded in index_matches.items() if image_id in matches
+        }
+        if not index_matches:
+            break
+    
+    plan = plan_query(ast, facets, index_matches, index_terms)
+    
+    query_params = {
+        'IndexName': 'UploadTimeIndex',
+        'KeyConditionExpression': Key('userId').eq(user_id),
+        'ScanIndexForward': not sort_desc,
+        'ReturnConsumedCapacity': 'TOTAL'
+    }
+    if not relevance:
+        query_params['Limit'] = limit * 3  # Fetch extra to account for filtering
+    if plan['range']:
+        query_params['KeyConditionExpression'] &= Key('uploadTimestamp').between(*plan['range'])
+    if plan['pushed']:
+        query_params['FilterExpression'] = to_condition({'op': 'and', 'args': plan['pushed']})
+    
+    start_key = None
+    if params.get('lastKey') and not relevance:
+        start_key = json.loads(base64.b64decode(params['lastKey']).decode())
+        query_params['ExclusiveStartKey'] = start_key
+    
+    if plan['range'] and plan['range'][0] > plan['range'][1]:
+        # Contradictory date terms: nothing can match, skip the read
+        pages = iter([])
+    elif 'matches' in plan:
+        pages = index_pages(user_id, plan['matches'], stats, sort_desc, start_key)
+    else:
+        pages = query_pages(query_params, stats, MAX_RELEVANCE_PAGES if relevance else MAX_QUERY_PAGES)
+    
+    if relevance:
+        items, next_key = rank_by_relevance(
+            pages, positive_tags(ast), plan['post'], limit, stats, decode_relevance_cursor(params.get('lastKey'))
+        )
+    else:
+        items, next_key = run_query(pages, plan['post'], limit, stats)
+    
+    extra = {}
+    if explain:
+        if 'matches' in plan:
+            key_condition = ' + '.join(
+                f"userId = :user AND begins_with(imageId, '{prefix}')"
+                for term in index_terms for prefix in index_prefixes(term)
+            )
+        else:
+            key_condition = 'userId = :user' + (
+                f" AND uploadTimestamp BETWEEN {plan['range'][0]} AND {plan['range'][1]}" if plan['range'] else '')
+        extra['explain'] = {
+            'query': describe(ast),
+            'accessPath': plan['accessPath'],
+            'keyCondition': key_condition,
+            'filterExpression': [describe(term) for term in plan['pushed']],
+            'postFilter': [describe(term) for term in plan['post']],
+            'candidates': plan['candidates'],
+            'estimatedItemsRead': plan['estimatedItems'],
+            'estimatedReadUnits': estimated_read_units(plan['estimatedItems']),
+            'postingsRead': stats['postings'],
+            'pagesRead': stats['pages'],
+            'itemsRead': stats['scanned'],
+            'consumedReadUnits': stats['consumed'],
+            'sort': 'relevance' if relevance else 'uploadTimestamp'
+        }
+    
+    return search_response(user_id, items, next_key, stats, extra)
+
+
+def search_response(user_id, items, next_key, stats, extra=None):
+    """200 response for a page of search results."""
+    result = {
+        'images': [format_image_item(item) for item in items],
+        'count': len(items),
+        'userId': user_id,
+        'hasMore': next_key is not None
+    }
+    if next_key:
+        result['nextKey'] = base64.b64encode(json.dumps(next_key, cls=DecimalEncoder).encode()).decode()
+    if 'scores' in stats:
+        for image, score in zip(result['images'], stats['scores']):
+            image['score'] = score
+    if stats.get('partial'):
+        result['partial'] = True
+    result.update(extra or {})
+    
+    return {
+        'statusCode': 200,
+        'headers': get_cors_headers(),
+        'body': json.dumps(result, cls=DecimalEncoder)
+    }
+
+
+def query_pages(query_params, stats, max_pages):
+    """
+    Yield result pages of a Query until the end or max_pages; when the
+    budget runs out, stats['lastEvaluatedKey'] is where reading stopped.
+    """
+    while True:
+        response = table.query(**query_params)
+        stats['pages'] += 1
+        stats['scanned'] += response.get('ScannedCount', 0)
+        stats['consumed'] += float(response.get('ConsumedCapacity', {}).get('CapacityUnits', 0))
+        yield response.get('Items', [])
+        
+        last_evaluated = response.get('LastEvaluatedKey')
+        if not last_evaluated:
+            return
+        if stats['pages'] >= max_pages:
+            stats['truncated'] = True
+            stats['lastEvaluatedKey'] = last_evaluated
+            return
+        query_params['ExclusiveStartKey'] = last_evaluated
+
+
+def index_pages(user_id, matches, stats, sort_desc, start_key=None):
+    """
+    Yield the images of term index matches in upload order, INDEX_BATCH_SIZE
+    per BatchGetItem. Postings of images deleted since are dropped here, as
+    every candidate is verified against its live item.
+    """
+    ordered = sorted(matches.items(), key=lambda match: (match[1], match[0]), reverse=sort_desc)
+    if start_key:
+        position = (int(start_key['uploadTimestamp']), start_key['imageId'])
+        ordered = [
+            match for match in ordered
+            if ((match[1], match[0]) < position if sort_desc else (match[1], match[0]) > position)
+        ]
+    
+    for i in range(0, len(ordered), INDEX_BATCH_SIZE):
+        image_ids = [image_id for image_id, _ in ordered[i:i + INDEX_BATCH_SIZE]]
+        found = batch_get_images(user_id, image_ids, stats)
+        stats['scanned'] += len(found)
+        yield [found[image_id] for image_id in image_ids if image_id in found]
+
+
+def batch_get_images(user_id, image_ids, stats):
+    """Read image items by key (up to 100), retrying unprocessed keys; imageId -> item."""
+    found = {}
+    if not image_ids:
+        return found
+    request = {DYNAMODB_TABLE: {'Keys': [{'userId': user_id, 'imageId': image_id} for image_id in image_ids]}}
+    while request:
+        response = dynamodb.batch_get_item(RequestItems=request, ReturnConsumedCapacity='TOTAL')
+        stats['pages'] += 1
+        for item in response.get('Responses', {}).get(DYNAMODB_TABLE, []):
+            found[item['imageId']] = item
+        for capacity in response.get('ConsumedCapacity', []):
+            stats['consumed'] += float(capacity.get('CapacityUnits', 0))
+        request = response.get('UnprocessedKeys')
+    return found
+
+
+def run_query(pages, post_filters, limit, stats):
+    """
+    Collect items passing the post-filters until limit is reached or the
+    pages run out.
+    
+    Returns:
+        tuple: (items, next_key); next_key resumes right after the last
+        returned item, or where the read budget stopped
+    """
+    items = []
+    for page in pages:
+        for item in page:
+            if all(evaluate(term, item) for term in post_filters):
+                items.append(item)
+                if len(items) == limit:
+                    return items, index_key(item)
+    return items, stats.get('lastEvaluatedKey')
+
+
+def relevance_score(item, terms):
+    """
+    Score an item for the query's tag terms: one point per matched term
+    plus the mean confidence (0-1) of the matched labels, so matching more
+    terms always ranks first and confidence orders images within a count.
+    """
+    if not terms:
+        return 0.0
+    confidences = {
+        str(label.get('name', '')).lower(): float(label.get('confidence', 0))
+        for label in (item.get('aiAnalysis') or {}).get('labels') or []
+    }
+    # Derived tags (parents, synonyms) count as a match with no confidence
+    tags = set(item.get('tags') or []) | set(item.get('derivedTags') or [])
+    matched = [confidences.get(term, 0.0) for term in terms if term in tags or term in confidences]
+    if not matched:
+        return 0.0
+    return round(len(matched) + sum(matched) / len(matched) / 100, 4)
+
+
+def relevance_key(item, score):
+    """Total order for relevance results: score, then newest, then imageId."""
+    return (score, int(item.get('uploadTimestamp', 0)), item['imageId'])
+
+
+def rank_by_relevance(pages, terms, post_filters, limit, stats, cursor=None):
+    """
+    Stream every candidate page and keep the top `limit` by relevance in a
+    bounded min-heap, so memory stays O(limit) however many images match.
+    
+    cursor is the relevance key of the last item of the previous page; only
+    items ordered strictly after it are ranked, which keeps pages stable
+    (no repeats or gaps) as long as the library doesn't change.
+    
+    Returns:
+        tuple: (items, next_cursor); stats['scores'] is aligned to items
+    """
+    heap = []
+    remaining = 0  # Eligible candidates that didn't fit in this page
+    
+    for page in pages:
+        for item in page:
+            if not all(evaluate(term, item) for term in post_filters):
+                continue
+            key = relevance_key(item, relevance_score(item, terms))
+            if cursor is not None and key >= cursor:
+                continue
+            if len(heap) < limit:
+                heapq.heappush(heap, (key, item))
+            else:
+                remaining += 1
+                if key > heap[0][0]:
+                    heapq.heapreplace(heap, (key, item))
+    
+    # Read budget ran out before every candidate was ranked
+    stats['partial'] = stats.get('truncated', False)
+    
+    ranked = sorted(heap, key=lambda entry: entry[0], reverse=True)
+    stats['scores'] = [key[0] for key, _ in ranked]
+    
+    next_cursor = None
+    if ranked and (remaining or stats['partial']):
+        score, uploaded, image_id = ranked[-1][0]
+        next_cursor = {'sort': 'relevance', 'score': score, 'uploadTimestamp': uploaded, 'imageId': image_id}
+    
+    return [item for _, item in ranked], next_cursor
+
+
+def decode_relevance_cursor(last_key):
+    """Relevance key from a lastKey token, or None for the first page."""
+    if not last_key:
+        return None
+    cursor = json.loads(base64.b64decode(last_key).decode())
+    if cursor.get('sort') != 'relevance':
+        raise ValueError('lastKey is not a relevance cursor')
+    return (cursor['score'], cursor['uploadTimestamp'], cursor['imageId'])
+
+
+def positive_tags(node):
+    """Tag terms that count toward relevance (not under a NOT)."""
+    if node['op'] == 'tag':
+        return [node['value']]
+    if node['op'] in ('and', 'or'):
+        return [tag for arg in node['args'] for tag in positive_tags(arg)]
+    return []
+
+
+def text_tokens(text):
+    """Case-folded words (letters and digits), as AnalyzeImage indexes them."""
+    return [token for token in re.findall(r'[^\W_]+', text.casefold()) if len(token) <= MAX_TERM_LENGTH]
+
+
+def term_postings(lines):
+    """Term -> positions across lines; line n starts at n * TERM_LINE_GAP."""
+    postings = {}
+    for line_number, line in enumerate(lines):
+        for offset, token in enumerate(text_tokens(line)):
+            postings.setdefault(token, []).append(line_number * TERM_LINE_GAP + offset)
+    return postings
+
+
+def phrase_match(position_sets):
+    """
+    True if the words' positions line up: a single word needs any position,
+    a phrase needs each word one position after the previous one.
+    """
+    if not all(position_sets):
+        return False
+    return any(
+        all(start + i in positions for i, positions in enumerate(position_sets[1:], 1))
+        for start in position_sets[0]
+    )
+
+
+def lookup_text(user_id, node, stats):
+    """
+    Images matching a text: node, from the term index.
+    
+    Each word is one key-prefix Query on term#<word>#; a prefix word drops
+    the trailing # so every term starting with it matches. Phrases are
+    checked on the returned positions.
+    
+    Returns:
+        dict: imageId -> uploadTimestamp
+    """
+    postings = []  # Per token: imageId -> list of position lists
+    uploaded = {}
+    for i, token in enumerate(node['tokens']):
+        prefix = node['prefix'] and i == len(node['tokens']) - 1
+        key_prefix = f"{TERM_ITEM_PREFIX}{token}" + ('' if prefix else '#')
+        by_image = {}
+        
+        query_params = {
+            'KeyConditionExpression': Key('userId').eq(user_id) & Key('imageId').begins_with(key_prefix),
+            'ProjectionExpression': 'targetImageId, positions, uploadedAt',
+            'ReturnConsumedCapacity': 'TOTAL'
+        }
+        while True:
+            response = table.query(**query_params)
+            stats['consumed'] += float(response.get('ConsumedCapacity', {}).get('CapacityUnits', 0))
+            for posting in response.get('Items', []):
+                stats['postings'] += 1
+                by_image.setdefault(posting['targetImageId'], []).append(posting['positions'])
+                uploaded[posting['targetImageId']] = int(posting['uploadedAt'])
+            if 'LastEvaluatedKey' not in response:
+                break
+            query_params['ExclusiveStartKey'] = response['LastEvaluatedKey']
+        
+        if not by_image:
+            return {}
+        postings.append(by_image)
+    
+    matches = {}
+    for image_id in postings[0]:
+        position_sets = [
+            {int(position) for found in by_image.get(image_id, []) for position in found}
+            for by_image in postings
+        ]
+        if phrase_match(position_sets):
+            matches[image_id] = uploaded[image_id]
+    return matches
+
+
+def normalize_name(name):
+    """NFKC, case-folded filename, as ProcessImage indexes it."""
+    return unicodedata.normalize('NFKC', name).casefold()
+
+
+def name_trigram_cover(value):
+    """
+    Trigrams covering every character of the value (positions 0, 3, 6, ...
+    and the last one): enough to narrow candidates, fewer lookups than
+    every trigram. The verify step removes false positives.
+    Values shorter than 3 characters have no trigrams: the cover is empty
+    and the name is only checked by the post-filter.
+    """
+    if len(value) < 3:
+        return []
+    starts = list(range(0, len(value) - 2, 3))
+    if starts[-1] != len(value) - 3:
+        starts.append(len(value) - 3)
+    return list(dict.fromkeys(value[start:start + 3] for start in starts))
+
+
+def index_prefixes(term):
+    """Key prefixes read for an index lookup (explain output)."""
+    if term['op'] == 'name':
+        return [f"{GRAM_ITEM_PREFIX}{gram}#" for gram in name_trigram_cover(term['value'])]
+    last = len(term['tokens']) - 1
+    return [
+        f"{TERM_ITEM_PREFIX}{token}" + ('' if term['prefix'] and i == last else '#')
+        for i, token in enumerate(term['tokens'])
+    ]
+
+
+def name_index_complete(user_id):
+    """
+    False while ProcessImage's backfill is still writing the user's
+    filename postings (images processed before the index existed).
+    """
+    return 'Item' not in table.get_item(
+        Key={'userId': user_id, 'imageId': NAME_INDEX_PENDING_ID},
+        ProjectionExpression='imageId'
+    )
+
+
+def lookup_name(user_id, node, stats):
+    """
+    Candidate images for a name: substring (at least 3 characters) from
+    the trigram index: the intersection of the covering trigrams' postings.
+    Candidates can still be false positives (trigrams in another order);
+    the name term stays in the post-filter to verify them.
+    
+    Returns:
+        dict: imageId -> uploadTimestamp
+    """
+    candidates = None
+    for gram in name_trigram_cover(node['value']):
+        found = {}
+        query_params = {
+            'KeyConditionExpression': Key('userId').eq(user_id) & Key('imageId').begins_with(
+                f"{GRAM_ITEM_PREFIX}{gram}#"),
+            'ProjectionExpression': 'targetImageId, uploadedAt',
+            'ReturnConsumedCapacity': 'TOTAL'
+        }
+        while True:
+            response = table.query(**query_params)
+            stats['consumed'] += float(response.get('ConsumedCapacity', {}).get('CapacityUnits', 0))
+            for posting in response.get('Items', []):
+                stats['postings'] += 1
+                if candidates is None or posting['targetImageId'] in candidates:
+                    found[posting['targetImageId']] = int(posting['uploadedAt'])
+            if 'LastEvaluatedKey' not in response:
+                break
+            query_params['ExclusiveStartKey'] = response['LastEvaluatedKey']
+        
+        candidates = found
+        if not candidates:
+            break
+    return candidates
+
+
+def index_key(item):
+    """UploadTimeIndex position of an item, usable as ExclusiveStartKey."""
+    return {
+        'userId': item['userId'],
+        'imageId': item['imageId'],
+        'uploadTimestamp': item['uploadTimestamp']
+    }
+
+
+def get_facets_item(user_id):
+    """The user's facets item (for estimates), or {} if not built yet."""
+    response = table.get_item(
+        Key={'userId': user_id, 'imageId': FACETS_ITEM_ID},
+        ProjectionExpression='imageCount, months'
+    )
+    return response.get('Item', {})
+
+
+def build_query(user_id, tags, date_from, date_to, has_faces, has_text, limit, sort_order, last_key,
+                face_attributes=(), colors=()):
     """
     Build DynamoDB query with filters.
     
     Strategy:
     1. Use GSI (UploadTimeIndex) for date-based queries
-    2. Apply filters for tags, filename, faces, text
+    2. Apply filters for tags, faces, text (filename searches go through
+       execute_query and the trigram index)
     3. Filter in application layer (DynamoDB has 1MB limit)
     """
     
@@ -156,7 +1274,7 @@ def build_query(user_id, tags, filename, date_from, date_to, has_faces, has_text
     
     # Filter by tags (must contain at least one tag)
     if tags and tags[0]:  # Check if tags list is not empty
-        tag_filters = [Attr('tags').contains(tag) for tag in tags if tag]
+        tag_filters = [Attr('tags').contains(tag) | Attr('derivedTags').contains(tag) for tag in tags if tag]
         if tag_filters:
             # Combine with OR logic
             combined_filter = tag_filters[0]
@@ -164,10 +1282,6 @@ def build_query(user_id, tags, filename, date_from, date_to, has_faces, has_text
                 combined_filter |= tag_filter
             filter_expressions.append(combined_filter)
     
-    # Filter by filename
-    if filename:
-        filter_expressions.append(Attr('imageName').contains(filename))
-    
     # Filter by face presence
     if has_faces is not None:
         if has_faces:
@@ -179,6 +1293,14 @@ def build_query(user_id, tags, filename, date_from, date_to, has_faces, has_text
     if has_text is not None:
         filter_expressions.append(Attr('aiAnalysis.hasText').eq(has_text))
     
+    # Filter by face attributes (rolled up at analysis time)
+    for attribute in face_attributes:
+        filter_expressions.append(Attr('faceAttributes').contains(attribute))
+    
+    # Filter by dominant colors (named by ProcessImage)
+    for color in colors:
+        filter_expressions.append(Attr('colors').contains(color))
+    
     # Combine all filters with AND logic
     if filter_expressions:
         combined_filter = filter_expressions[0]
@@ -188,7 +1310,6 @@ def build_query(user_id, tags, filename, date_from, date_to, has_faces, has_text
     
     # Add pagination token
     if last_key:
-        import base64
         query_params['ExclusiveStartKey'] = json.loads(
             base64.b64decode(last_key).decode()
         )
@@ -227,8 +1348,13 @@ def format_image_item(item):
             'original': f"https://{PROCESSED_BUCKET.replace('processed', 'uploads')}.s3.amazonaws.com/uploads/{user_id}/{image_id}-{item.get('uploadTimestamp', '')}-{item.get('imageName', '')}"
         },
         'tags': item.get('tags', []),
+        'derivedTags': item.get('derivedTags', []),
+        'faceAttributes': item.get('faceAttributes', []),
+        'palette': item.get('palette', []),
+        'colors': item.get('colors', []),
         'processingStatus': item.get('processingStatus', 'unknown')
     }
+    formatted['renditions'] = build_renditions(item, formatted['urls'])
     
     # Add AI analysis summary if available
     if 'aiAnalysis' in item:
@@ -243,6 +1369,28 @@ def format_image_item(item):
     return formatted
 
 
+def build_renditions(item, urls):
+    """
+    Build the rendition manifest (smallest first) for srcset selection.
+    Items processed before manifests were stored get nominal widths.
+    """
+    renditions = []
+    seen_widths = set()
+    for rendition in sorted(item.get('renditions') or DEFAULT_RENDITIONS, key=lambda r: int(r['width'])):
+        width = int(rendition['width'])
+        # Small originals produce identical renditions; list each width once
+        if width in seen_widths or rendition['name'] not in urls:
+            continue
+        seen_widths.add(width)
+        renditions.append({
+            'name': rendition['name'],
+            'url': urls[rendition['name']],
+            'width': width,
+            'format': rendition.get('format', 'jpeg')
+        })
+    return renditions
+
+
 def parse_timestamp(date_str):
     """
     Convert date string to Unix timestamp.
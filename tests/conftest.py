@@ -0,0 +1,16 @@
+"""
+boto3/botocore are replaced by stubs before any Lambda is imported, so the
+tests need neither the SDK nor AWS credentials; each test points the
+module's table and clients at the fakes it needs.
+"""
+
+import pytest
+
+from tests.support import FakeTable, install_aws_stubs
+
+install_aws_stubs()
+
+
+@pytest.fixture
+def fake_table():
+    return FakeTable()
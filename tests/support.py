@@ -0,0 +1,186 @@
+"""
+Test helpers: stand-ins for the AWS SDK (installed by conftest.py before
+any Lambda is imported), a module loader for the Lambda functions, which
+all share the module name lambda_function, and an in-memory images table.
+"""
+
+import importlib.util
+import sys
+import types
+from decimal import Decimal
+from pathlib import Path
+from unittest import mock
+
+LAMBDA_DIR = Path(__file__).resolve().parent.parent / 'lambda-functions'
+
+
+class Condition:
+    """A boto3 condition expression, kept as a tree for assertions."""
+    
+    def __init__(self, op, *args):
+        self.op = op
+        self.args = args
+    
+    def __and__(self, other):
+        return Condition('and', self, other)
+    
+    def __or__(self, other):
+        return Condition('or', self, other)
+    
+    def __invert__(self):
+        return Condition('not', self)
+    
+    def __repr__(self):
+        return f'{self.op}{self.args}'
+
+
+class Name:
+    """Key('x') / Attr('x'): every method builds a Condition on the name."""
+    
+    def __init__(self, name):
+        self.name = name
+    
+    def __getattr__(self, op):
+        return lambda *args: Condition(op, self.name, *args)
+
+
+class ClientError(Exception):
+    def __init__(self, error_response, operation_name):
+        super().__init__(f"{error_response.get('Error', {}).get('Code')} ({operation_name})")
+        self.response = error_response
+        self.operation_name = operation_name
+
+
+class TypeDeserializer:
+    """Stream image (typed JSON) to Python values, like boto3's."""
+    
+    def deserialize(self, value):
+        (kind, data), = value.items()
+        if kind == 'N':
+            return Decimal(data)
+        if kind == 'M':
+            return {key: self.deserialize(item) for key, item in data.items()}
+        if kind == 'L':
+            return [self.deserialize(item) for item in data]
+        if kind in ('SS', 'NS'):
+            return {Decimal(item) if kind == 'NS' else item for item in data}
+        if kind == 'NULL':
+            return None
+        return data
+
+
+def install_aws_stubs():
+    boto3 = types.ModuleType('boto3')
+    boto3.client = lambda *args, **kwargs: mock.MagicMock(name=f'client:{args[0]}')
+    boto3.resource = lambda *args, **kwargs: mock.MagicMock(name=f'resource:{args[0]}')
+    dynamodb = types.ModuleType('boto3.dynamodb')
+    conditions = types.ModuleType('boto3.dynamodb.conditions')
+    conditions.Key = conditions.Attr = Name
+    dynamodb_types = types.ModuleType('boto3.dynamodb.types')
+    dynamodb_types.TypeDeserializer = TypeDeserializer
+    boto3.dynamodb = dynamodb
+    dynamodb.conditions = conditions
+    dynamodb.types = dynamodb_types
+    
+    botocore = types.ModuleType('botocore')
+    exceptions = types.ModuleType('botocore.exceptions')
+    exceptions.ClientError = ClientError
+    botocore.exceptions = exceptions
+    
+    sys.modules.update({
+        'boto3': boto3,
+        'boto3.dynamodb': dynamodb,
+        'boto3.dynamodb.conditions': conditions,
+        'boto3.dynamodb.types': dynamodb_types,
+        'botocore': botocore,
+        'botocore.exceptions': exceptions,
+    })
+
+
+
+def load_lambda(name):
+    """Import lambda-functions/<name>/lambda_function.py as its own module."""
+    module_name = f"{name.replace('-', '_')}_lambda"
+    spec = importlib.util.spec_from_file_location(module_name, LAMBDA_DIR / name / 'lambda_function.py')
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def key_prefix(condition):
+    """The begins_with prefix of a `userId = :u AND begins_with(imageId, :p)` key condition."""
+    begins_with = condition.args[1]
+    assert begins_with.op == 'begins_with'
+    return begins_with.args[1]
+
+
+def matches(condition, item):
+    """Evaluate the attribute_exists filters FakeTable supports."""
+    if condition is None:
+        return True
+    if condition.op == 'exists':
+        return condition.args[0] in item
+    raise AssertionError(f'Unsupported filter {condition}')
+
+
+class FakeTable:
+    """
+    In-memory stand-in for the images table: get/put/delete by key,
+    partition and key-prefix queries (imageId begins_with), scans and a
+    batch writer.
+    """
+    
+    def __init__(self, items=()):
+        self.items = {}
+        for item in items:
+            self.put_item(Item=item)
+    
+    def get_item(self, Key, **kwargs):
+        item = self.items.get((Key['userId'], Key['imageId']))
+        return {'Item': dict(item)} if item else {}
+    
+    def put_item(self, Item, **kwargs):
+        old = self.items.get((Item['userId'], Item['imageId']))
+        self.items[(Item['userId'], Item['imageId'])] = dict(Item)
+        return {'Attributes': old} if old and kwargs.get('ReturnValues') == 'ALL_OLD' else {}
+    
+    def delete_item(self, Key, **kwargs):
+        self.items.pop((Key['userId'], Key['imageId']), None)
+        return {}
+    
+    def query(self, KeyConditionExpression, FilterExpression=None, **kwargs):
+        if KeyConditionExpression.op == 'eq':
+            user_id, prefix = KeyConditionExpression.args[1], ''
+        else:
+            prefix = key_prefix(KeyConditionExpression)
+            user_id = KeyConditionExpression.args[0].args[1]
+        found = [
+            dict(item) for (owner, image_id), item in sorted(self.items.items())
+            if owner == user_id and image_id.startswith(prefix) and matches(FilterExpression, item)
+        ]
+        return {'Items': found, 'Count': len(found), 'ScannedCount': len(found)}
+    
+    def scan(self, FilterExpression=None, **kwargs):
+        found = [dict(item) for _, item in sorted(self.items.items()) if matches(FilterExpression, item)]
+        return {'Items': found, 'Count': len(found), 'ScannedCount': len(self.items)}
+    
+    def batch_writer(self):
+        table = self
+        
+        class Writer:
+            def __enter__(self):
+                return self
+            
+            def __exit__(self, *exc):
+                return False
+            
+            def put_item(self, Item):
+                table.put_item(Item=Item)
+            
+            def delete_item(self, Key):
+                table.delete_item(Key=Key)
+        
+        return Writer()
+    
+    def keys(self, prefix=''):
+        return sorted(image_id for _, image_id in self.items if image_id.startswith(prefix))
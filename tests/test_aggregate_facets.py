@@ -0,0 +1,111 @@
+"""AggregateFacets stream processing and the facets read in SearchImages."""
+
+import json
+from unittest import mock
+
+from tests.support import ClientError, load_lambda
+
+facets = load_lambda('aggregate-facets')
+search = load_lambda('search-images')
+
+
+def image(user_id, image_id, **attributes):
+    """Stream image (DynamoDB JSON) of an image item uploaded in June 2024."""
+    item = {
+        'userId': {'S': user_id},
+        'imageId': {'S': image_id},
+        'uploadTimestamp': {'N': '1718000000'},
+    }
+    item.update(attributes)
+    return item
+
+
+def record(sequence, new=None, old=None):
+    ddb = {'SequenceNumber': sequence}
+    if new:
+        ddb['NewImage'] = new
+    if old:
+        ddb['OldImage'] = old
+    return {'eventName': 'MODIFY' if new and old else 'INSERT' if new else 'REMOVE', 'dynamodb': ddb}
+
+
+def applied(update_item):
+    """(userId, sorted delta values) for each UpdateItem call."""
+    return [
+        (call.kwargs['Key']['userId'], sorted(
+            value for name, value in call.kwargs['ExpressionAttributeValues'].items() if name != ':zero'
+        ))
+        for call in update_item.call_args_list
+    ]
+
+
+def test_records_are_applied_one_by_one(monkeypatch):
+    table = mock.MagicMock()
+    monkeypatch.setattr(facets, 'table', table)
+    analyzed = image('u1', 'a', analysisStatus={'S': 'completed'},
+                     aiAnalysis={'M': {'faceCount': {'N': '2'}, 'hasText': {'BOOL': False}}},
+                     faceAttributes={'L': [{'S': 'smiling'}]})
+    event = {'Records': [
+        record('1', new=image('u1', 'a')),
+        record('2', new=analyzed, old=image('u1', 'a')),
+        record('3', new={'userId': {'S': 'u1'}, 'imageId': {'S': 'hash#x'}}),  # Not an image: no write
+        record('4', old=image('u2', 'b')),
+    ]}
+
+    assert facets.lambda_handler(event, None) == {'batchItemFailures': []}
+    calls = table.update_item.call_args_list
+    assert len(calls) == 3
+    assert calls[0].kwargs['UpdateExpression'] == (
+        'SET months.#m1 = if_not_exists(months.#m1, :zero) + :d1 ADD imageCount :d0')
+    # Analysis: analyzed, withFaces and the face attribute, but not imageCount again
+    assert sorted(calls[1].kwargs['ExpressionAttributeValues'].values()) == [0, 1, 1, 1]
+    assert 'imageCount' not in calls[1].kwargs['UpdateExpression']
+    assert applied(table.update_item)[2] == ('u2', [-1, -1])
+
+
+def test_failure_stops_the_batch_and_reports_only_that_record(monkeypatch):
+    table = mock.MagicMock()
+    table.update_item.side_effect = [
+        {}, ClientError({'Error': {'Code': 'ProvisionedThroughputExceededException'}}, 'UpdateItem'), {}, {}
+    ]
+    monkeypatch.setattr(facets, 'table', table)
+    event = {'Records': [record(str(i), new=image('u1', f'img-{i}')) for i in range(1, 5)]}
+
+    assert facets.lambda_handler(event, None) == {'batchItemFailures': [{'itemIdentifier': '2'}]}
+    # Records after the failure were not applied, so the retry from 2 counts each image once
+    assert table.update_item.call_count == 2
+
+    table.update_item.reset_mock(side_effect=True)
+    assert facets.lambda_handler({'Records': event['Records'][1:]}, None) == {'batchItemFailures': []}
+    assert table.update_item.call_count == 3
+
+
+def test_missing_map_is_created_before_the_retry(monkeypatch):
+    table = mock.MagicMock()
+    table.update_item.side_effect = [ClientError({'Error': {'Code': 'ValidationException'}}, 'UpdateItem'), {}, {}]
+    monkeypatch.setattr(facets, 'table', table)
+
+    assert facets.lambda_handler({'Records': [record('1', new=image('u1', 'a'))]}, None) == {'batchItemFailures': []}
+    expressions = [call.kwargs['UpdateExpression'] for call in table.update_item.call_args_list]
+    assert expressions[1].startswith('SET months = if_not_exists(months, :empty)')
+    assert expressions[0] == expressions[2]
+
+
+def test_get_facets_retries_unprocessed_keys(monkeypatch):
+    facets_item = {'imageId': 'meta#facets', 'imageCount': 3, 'months': {'2024-06': 3}}
+    tags_item = {'imageId': 'meta#tags', 'tagCounts': {'beach': 2, 'dog': 0}}
+    responses = [
+        {'Responses': {search.DYNAMODB_TABLE: [facets_item]},
+         'UnprocessedKeys': {search.DYNAMODB_TABLE: {'Keys': [{'userId': 'u1', 'imageId': 'meta#tags'}]}}},
+        {'Responses': {search.DYNAMODB_TABLE: [tags_item]}, 'UnprocessedKeys': {}},
+    ]
+    batch_get_item = mock.MagicMock(side_effect=responses)
+    monkeypatch.setattr(search.dynamodb, 'batch_get_item', batch_get_item)
+
+    body = json.loads(search.get_facets('u1', {})['body'])
+    assert batch_get_item.call_count == 2
+    assert batch_get_item.call_args.kwargs['RequestItems'][search.DYNAMODB_TABLE]['Keys'] == [
+        {'userId': 'u1', 'imageId': 'meta#tags'}
+    ]
+    assert body['imageCount'] == 3
+    assert body['tags'] == [{'tag': 'beach', 'count': 2}]
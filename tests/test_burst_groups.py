@@ -0,0 +1,257 @@
+"""Burst groups: sharpness and grouping (ProcessImage), collapsing (GetImages)."""
+
+from decimal import Decimal
+
+import pytest
+
+from tests.support import ClientError, load_lambda
+
+process = load_lambda('process-image')
+get_images = load_lambda('get-images')
+
+
+# ---------------------------------------------------------------------------
+# Sharpness
+# ---------------------------------------------------------------------------
+
+@pytest.fixture
+def checkerboard():
+    Image = pytest.importorskip('PIL.Image')
+    image = Image.new('L', (128, 128))
+    image.putdata([255 if (x // 8 + y // 8) % 2 else 0 for y in range(128) for x in range(128)])
+    return image.convert('RGB')
+
+
+@pytest.mark.parametrize('numpy', [True, False])
+def test_laplacian_variance_ranks_sharp_above_blurred(checkerboard, monkeypatch, numpy):
+    ImageFilter = pytest.importorskip('PIL.ImageFilter')
+    if numpy:
+        pytest.importorskip('numpy')
+    monkeypatch.setattr(process, 'NUMPY_AVAILABLE', numpy)
+    sharp = process.laplacian_variance(checkerboard)
+    soft = process.laplacian_variance(checkerboard.filter(ImageFilter.GaussianBlur(2)))
+    blurred = process.laplacian_variance(checkerboard.filter(ImageFilter.GaussianBlur(6)))
+    assert sharp > soft > blurred
+
+
+def test_laplacian_variance_of_a_flat_image_is_zero(monkeypatch):
+    Image = pytest.importorskip('PIL.Image')
+    monkeypatch.setattr(process, 'NUMPY_AVAILABLE', False)
+    assert process.laplacian_variance(Image.new('RGB', (64, 64), (90, 120, 200))) == 0
+
+
+# ---------------------------------------------------------------------------
+# Grouping
+# ---------------------------------------------------------------------------
+
+def cancelled():
+    return ClientError({'Error': {'Code': 'TransactionCanceledException'}}, 'TransactWriteItems')
+
+
+def transact(table):
+    """
+    Apply ProcessImage's TransactItems to a FakeTable, all or nothing, for
+    the condition and update forms join_group uses.
+    """
+    def check(current, condition):
+        if condition == 'attribute_not_exists(imageId)':
+            return current is None
+        if condition == 'attribute_exists(imageId)':
+            return current is not None
+        if condition == 'attribute_exists(imageId) AND attribute_not_exists(groupId)':
+            return current is not None and 'groupId' not in current
+        if condition == 'attribute_exists(members)':
+            return current is not None and 'members' in current
+        raise AssertionError(f'Unexpected condition {condition}')
+
+    def transact_write_items(TransactItems):
+        writes = []
+        for action in TransactItems:
+            (kind, body), = action.items()
+            key = body['Item'] if kind == 'Put' else body['Key']
+            current = table.get_item(Key=key).get('Item')
+            if not check(current, body['ConditionExpression']):
+                raise cancelled()
+            writes.append((kind, body, current))
+        for kind, body, current in writes:
+            if kind == 'Put':
+                table.put_item(Item=body['Item'])
+            elif body['UpdateExpression'] == 'SET groupId = :group, updatedAt = :now':
+                values = body['ExpressionAttributeValues']
+                table.put_item(Item=dict(current, groupId=values[':group'], updatedAt=values[':now']))
+            elif body['UpdateExpression'] == 'SET members.#image = :member':
+                members = dict(current['members'])
+                members[body['ExpressionAttributeNames']['#image']] = body['ExpressionAttributeValues'][':member']
+                table.put_item(Item=dict(current, members=members))
+            else:
+                raise AssertionError(f"Unexpected update {body['UpdateExpression']}")
+        return {}
+
+    return transact_write_items
+
+
+@pytest.fixture
+def library(fake_table, monkeypatch):
+    monkeypatch.setattr(process, 'table', fake_table)
+    monkeypatch.setattr(process.dynamodb.meta.client, 'transact_write_items', transact(fake_table))
+    return fake_table
+
+
+def add_image(table, image_id, phash, uploaded, **attributes):
+    item = dict({
+        'userId': 'user-1', 'imageId': image_id, 'phash': phash, 'phashType': 'dct',
+        'uploadTimestamp': uploaded, 'updatedAt': uploaded * 1000, 'sharpness': Decimal(10)
+    }, **attributes)
+    table.put_item(Item=item)
+    process.put_phash_bands('user-1', image_id, item)
+    return item
+
+
+def test_find_burst_neighbour_needs_close_hash_and_time(library):
+    add_image(library, 'near', 'ffff000000000000', 1000)
+    add_image(library, 'nearest', 'ffff000000000001', 1010)
+    add_image(library, 'late', 'ffff000000000000', 1000 + process.GROUP_WINDOW_SECONDS + 30)
+    add_image(library, 'different', '00000000ffffffff', 1000)
+    item = {'phash': 'ffff000000000003', 'phashType': 'dct', 'uploadTimestamp': 1020}
+    assert process.find_burst_neighbour('user-1', 'new', item) == 'nearest'
+    # The camera's clock wins over the upload time
+    assert process.find_burst_neighbour('user-1', 'new', dict(item, capturedAt=50000)) is None
+
+
+def test_first_neighbour_founds_a_group(library):
+    add_image(library, 'first', 'ffff000000000000', 1000, sharpness=Decimal(3))
+    item = add_image(library, 'second', 'ffff000000000001', 1005, sharpness=Decimal(8))
+
+    assert process.assign_group('user-1', 'second', item) == 'first'
+
+    group = library.get_item(Key={'userId': 'user-1', 'imageId': 'group#first'})['Item']
+    assert group['members'] == {
+        'first': {'sharpness': Decimal(3), 'uploadTimestamp': 1000},
+        'second': {'sharpness': Decimal(8), 'uploadTimestamp': 1005},
+    }
+    for image_id in ('first', 'second'):
+        assert library.get_item(Key={'userId': 'user-1', 'imageId': image_id})['Item']['groupId'] == 'first'
+
+
+def test_later_images_join_the_existing_group(library):
+    add_image(library, 'first', 'ffff000000000000', 1000)
+    second = add_image(library, 'second', 'ffff000000000001', 1005)
+    process.assign_group('user-1', 'second', second)
+    third = add_image(library, 'third', 'ffff000000000003', 1010)
+
+    assert process.assign_group('user-1', 'third', third) == 'first'
+    group = library.get_item(Key={'userId': 'user-1', 'imageId': 'group#first'})['Item']
+    assert set(group['members']) == {'first', 'second', 'third'}
+
+
+def test_failed_transaction_writes_nothing(library):
+    add_image(library, 'first', 'ffff000000000000', 1000)
+    item = add_image(library, 'second', 'ffff000000000001', 1005)
+    stored_get = library.get_item
+
+    def stale_neighbour_read(Key, **kwargs):
+        # The neighbour as assign_group read it, before it was grouped elsewhere
+        if 'ProjectionExpression' in kwargs:
+            return {'Item': {'imageId': 'first', 'uploadTimestamp': 1000}}
+        return stored_get(Key=Key)
+
+    library.get_item = stale_neighbour_read
+    library.put_item(Item=dict(stored_get(Key={'userId': 'user-1', 'imageId': 'first'})['Item'], groupId='other'))
+
+    assert process.assign_group('user-1', 'second', item) is None
+    assert 'groupId' not in stored_get(Key={'userId': 'user-1', 'imageId': 'second'})['Item']
+    assert library.keys('group#') == []
+
+
+def test_reprocessed_image_stays_in_its_group(library):
+    add_image(library, 'first', 'ffff000000000000', 1000)
+    second = add_image(library, 'second', 'ffff000000000001', 1005)
+    process.assign_group('user-1', 'second', second)
+    # ProcessImage's put_item replaced the item without groupId
+    reprocessed = add_image(library, 'second', 'ffff000000000001', 1005, sharpness=Decimal(20))
+
+    assert process.assign_group('user-1', 'second', reprocessed, previous_group_id='first') == 'first'
+    group = library.get_item(Key={'userId': 'user-1', 'imageId': 'group#first'})['Item']
+    assert group['members']['second']['sharpness'] == Decimal(20)
+    assert library.get_item(Key={'userId': 'user-1', 'imageId': 'second'})['Item']['groupId'] == 'first'
+
+
+# ---------------------------------------------------------------------------
+# collapseGroups
+# ---------------------------------------------------------------------------
+
+def image(image_id, uploaded, group_id=None):
+    item = {'userId': 'user-1', 'imageId': image_id, 'uploadTimestamp': uploaded}
+    if group_id:
+        item['groupId'] = group_id
+    return item
+
+
+MEMBERS = {
+    'a': {'sharpness': Decimal(9), 'uploadTimestamp': 10},
+    'c': {'sharpness': Decimal(3), 'uploadTimestamp': 30},
+    'd': {'sharpness': Decimal(1), 'uploadTimestamp': 40},
+}
+
+# Newest first, as UploadTimeIndex returns them
+LIBRARY = [image('e', 50), image('d', 40, 'a'), image('c', 30, 'a'), image('b', 20), image('a', 10, 'a')]
+
+
+@pytest.fixture
+def stored(monkeypatch):
+    items = {item['imageId']: item for item in LIBRARY}
+    items['group#a'] = {'userId': 'user-1', 'imageId': 'group#a', 'members': dict(MEMBERS)}
+    reads = []
+
+    def batch_get_item(RequestItems):
+        keys = RequestItems[get_images.DYNAMODB_TABLE]['Keys']
+        reads.append([key['imageId'] for key in keys])
+        return {'Responses': {get_images.DYNAMODB_TABLE: [
+            items[key['imageId']] for key in keys if key['imageId'] in items
+        ]}}
+
+    monkeypatch.setattr(get_images.dynamodb, 'batch_get_item', batch_get_item)
+    return items, reads
+
+
+def collapsed(page, sort_desc=True):
+    return [(item['imageId'], item.get('groupCount')) for item in get_images.collapse_groups('user-1', page, sort_desc)]
+
+
+def test_group_appears_once_as_its_sharpest_member_at_the_newest_position(stored):
+    assert collapsed(LIBRARY) == [('e', None), ('a', 3), ('b', None)]
+
+
+def test_group_is_anchored_to_its_oldest_member_when_ascending(stored):
+    assert collapsed(LIBRARY[::-1], sort_desc=False) == [('a', 3), ('b', None), ('e', None)]
+
+
+def test_group_never_spans_two_pages(stored):
+    first, second = LIBRARY[:2], LIBRARY[2:]
+    assert collapsed(first) == [('e', None), ('a', 3)]
+    assert collapsed(second) == [('b', None)]
+
+
+def test_representative_off_the_page_is_read(stored):
+    items, reads = stored
+    collapsed(LIBRARY[:2])
+    assert reads == [['group#a'], ['a']]
+
+
+def test_deleted_representative_falls_back_to_the_anchor(stored):
+    items, _ = stored
+    del items['a']  # Deleted after the group item was read
+    assert collapsed(LIBRARY[:2]) == [('e', None), ('d', 3)]
+
+
+def test_images_outside_their_group_pass_through(stored):
+    items, _ = stored
+    page = [image('x', 60, 'a'), image('y', 55, 'gone')] + LIBRARY[:1]
+    assert collapsed(page) == [('x', None), ('y', None), ('e', None)]
+
+
+def test_pages_without_groups_are_not_read(stored):
+    _, reads = stored
+    page = [image('e', 50), image('b', 20)]
+    assert get_images.collapse_groups('user-1', page, True) == page
+    assert reads == []
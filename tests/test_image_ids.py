@@ -0,0 +1,55 @@
+"""Path image IDs never reach index or meta items (DeleteImage, similar lookup)."""
+
+import json
+from unittest import mock
+
+import pytest
+
+from tests.support import load_lambda
+
+delete = load_lambda('delete-image')
+search = load_lambda('search-images')
+
+RESERVED = ['meta#stats', 'meta#tags', 'meta#facets', 'hash#0123', 'group#abc', 'term#beach#img-1']
+
+
+@pytest.fixture
+def partition(fake_table, monkeypatch):
+    monkeypatch.setattr(delete, 'table', fake_table)
+    monkeypatch.setattr(delete, 's3', mock.MagicMock())
+    monkeypatch.setattr(search, 'table', fake_table)
+    for image_id in RESERVED:
+        fake_table.put_item(Item={'userId': 'user-1', 'imageId': image_id, 'imageCount': 3})
+    # An item without '#' that is still not an image
+    fake_table.put_item(Item={'userId': 'user-1', 'imageId': 'legacy-marker'})
+    return fake_table
+
+
+def delete_request(image_id):
+    return delete.lambda_handler({
+        'pathParameters': {'imageId': image_id},
+        'requestContext': {'authorizer': {'claims': {'sub': 'user-1'}}}
+    }, None)
+
+
+@pytest.mark.parametrize('image_id', RESERVED)
+def test_delete_rejects_index_and_meta_ids(partition, image_id):
+    response = delete_request(image_id)
+    assert response['statusCode'] == 400
+    assert json.loads(response['body'])['error'] == 'Bad Request'
+    assert partition.get_item(Key={'userId': 'user-1', 'imageId': image_id})
+    delete.s3.delete_object.assert_not_called()
+
+
+def test_delete_of_a_non_image_item_is_not_found(partition):
+    assert delete_request('legacy-marker')['statusCode'] == 404
+    assert partition.get_item(Key={'userId': 'user-1', 'imageId': 'legacy-marker'})
+
+
+@pytest.mark.parametrize('image_id', RESERVED)
+def test_similar_rejects_index_and_meta_ids(partition, image_id):
+    assert search.get_similar('user-1', image_id, {})['statusCode'] == 400
+
+
+def test_similar_of_a_non_image_item_is_not_found(partition):
+    assert search.get_similar('user-1', 'legacy-marker', {})['statusCode'] == 404
@@ -0,0 +1,97 @@
+"""GetImages change feed: the full sync seeds from UploadTimeIndex, deltas follow UpdatedAtIndex."""
+
+import json
+
+import pytest
+
+from tests.support import load_lambda
+
+get_images = load_lambda('get-images')
+
+SEED_START_MS = 1_700_000_000_000
+
+
+class IndexTable:
+    """Serves the two GSIs the change feed reads, paged by Limit."""
+
+    def __init__(self, items):
+        self.items = items
+
+    def query(self, IndexName, KeyConditionExpression, Limit, ExclusiveStartKey=None, **kwargs):
+        if IndexName == get_images.UPLOAD_TIME_INDEX:
+            sort_key = 'uploadTimestamp'
+            found = [item for item in self.items if sort_key in item]
+        else:
+            assert IndexName == get_images.UPDATED_AT_INDEX
+            sort_key = 'updatedAt'
+            after = KeyConditionExpression.args[1].args[1]
+            found = [item for item in self.items if item.get(sort_key, 0) > after]
+        found.sort(key=lambda item: (item[sort_key], item['imageId']))
+        if ExclusiveStartKey:
+            start = [item['imageId'] for item in found].index(ExclusiveStartKey['imageId']) + 1
+            found = found[start:]
+        response = {'Items': found[:Limit]}
+        if len(found) > Limit:
+            last = found[Limit - 1]
+            response['LastEvaluatedKey'] = {'userId': 'user-1', 'imageId': last['imageId'], sort_key: last[sort_key]}
+        return response
+
+
+def image(image_id, uploaded, updated=None):
+    item = {'userId': 'user-1', 'imageId': image_id, 'imageName': f'{image_id}.jpg', 'uploadTimestamp': uploaded}
+    if updated is not None:
+        item['updatedAt'] = updated
+    return item
+
+
+@pytest.fixture
+def library(monkeypatch):
+    clock = {'ms': SEED_START_MS}
+    monkeypatch.setattr(get_images.time, 'time', lambda: clock['ms'] / 1000)
+    table = IndexTable([
+        image('legacy', 1672531200),  # Written before updatedAt existed
+        image('img-1', 1685577600, SEED_START_MS - 60_000),
+        image('img-2', 1688169600, SEED_START_MS - 30_000),
+    ])
+    monkeypatch.setattr(get_images, 'table', table)
+    return table, clock
+
+
+def changes(**params):
+    response = get_images.handle_changes('user-1', {key: str(value) for key, value in params.items()})
+    return response['statusCode'], json.loads(response['body'])
+
+
+def test_full_sync_includes_images_without_updated_at(library):
+    table, clock = library
+    seen = []
+    status, body = changes(since=0, limit=2)
+    while True:
+        assert status == 200
+        seen += [change['imageId'] for change in body['changes']]
+        # The cursor is when the seed started, not when its last page ran
+        assert body['cursor'] == SEED_START_MS
+        if not body['hasMore']:
+            break
+        clock['ms'] += 10_000
+        status, body = changes(since=0, limit=2, lastKey=body['nextKey'])
+    assert seen == ['legacy', 'img-1', 'img-2']
+
+
+def test_delta_after_the_seed_returns_writes_made_during_it(library):
+    table, clock = library
+    status, body = changes(since=0, limit=2)
+    cursor = body['cursor']
+    # Written while the later seed pages were being read
+    table.items.append(image('img-3', 1690848000, SEED_START_MS + 5_000))
+    clock['ms'] += 20_000
+
+    status, body = changes(since=cursor)
+    assert status == 200
+    assert [change['imageId'] for change in body['changes']] == ['img-3']
+
+
+@pytest.mark.parametrize('last_key', ['not json', '{"imageId": "img-1"}', '[]'])
+def test_full_sync_rejects_an_invalid_last_key(library, last_key):
+    status, _ = changes(since=0, lastKey=last_key)
+    assert status == 400
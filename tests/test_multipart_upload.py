@@ -0,0 +1,80 @@
+"""GetUploadUrl multipart actions: part number validation and completion errors."""
+
+import json
+from unittest import mock
+
+import pytest
+
+from tests.support import ClientError, load_lambda
+
+upload = load_lambda('get-upload-url')
+
+KEY = 'uploads/user-1/abc-photo.jpg'
+
+
+@pytest.fixture
+def s3(monkeypatch):
+    client = mock.MagicMock()
+    client.generate_presigned_url.side_effect = lambda *args, **kwargs: f"https://s3/{kwargs['Params']['PartNumber']}"
+    monkeypatch.setattr(upload, 's3_client', client)
+    return client
+
+
+def action(name, **body):
+    response = upload.handle_multipart_action('user-1', name, dict({'key': KEY, 'uploadId': 'up-1'}, **body))
+    return response['statusCode'], json.loads(response['body'])
+
+
+def test_presign_parts_signs_each_part(s3):
+    status, body = action('presignParts', partNumbers=[1, 2])
+    assert status == 200
+    assert [part['partNumber'] for part in body['parts']] == [1, 2]
+
+
+@pytest.mark.parametrize('part_numbers', [[], [0], [10001], ['1'], [1.0], [True], [1, False]])
+def test_presign_parts_rejects_non_integer_part_numbers(s3, part_numbers):
+    status, _ = action('presignParts', partNumbers=part_numbers)
+    assert status == 400
+    s3.generate_presigned_url.assert_not_called()
+
+
+def test_complete_sorts_the_parts(s3):
+    status, body = action('completeMultipart', parts=[{'partNumber': 2, 'etag': 'b'}, {'partNumber': 1, 'etag': 'a'}])
+    assert status == 200 and body['key'] == KEY
+    assert s3.complete_multipart_upload.call_args.kwargs['MultipartUpload'] == {
+        'Parts': [{'PartNumber': 1, 'ETag': 'a'}, {'PartNumber': 2, 'ETag': 'b'}]
+    }
+
+
+def test_complete_rejected_by_s3_is_a_bad_request_with_the_s3_code(s3):
+    s3.complete_multipart_upload.side_effect = ClientError(
+        {'Error': {'Code': 'InvalidPart', 'Message': 'One or more of the specified parts could not be found.'}},
+        'CompleteMultipartUpload'
+    )
+    status, body = action('completeMultipart', parts=[{'partNumber': 1, 'etag': 'stale'}])
+    assert status == 400
+    assert body['code'] == 'InvalidPart'
+    assert 'could not be found' in body['error']
+
+
+def test_other_users_keys_are_forbidden(s3):
+    response = upload.handle_multipart_action('user-2', 'completeMultipart', {'key': KEY, 'uploadId': 'up-1', 'parts': [1]})
+    assert response['statusCode'] == 403
+
+
+def test_abort_of_an_unknown_upload_succeeds(s3):
+    s3.abort_multipart_upload.side_effect = ClientError(
+        {'Error': {'Code': 'NoSuchUpload', 'Message': 'The specified upload does not exist.'}},
+        'AbortMultipartUpload'
+    )
+    status, body = action('abortMultipart')
+    assert status == 200 and body['key'] == KEY
+
+
+def test_abort_rejected_by_s3_is_a_bad_request_with_the_s3_code(s3):
+    s3.abort_multipart_upload.side_effect = ClientError(
+        {'Error': {'Code': 'AccessDenied', 'Message': 'Access Denied'}}, 'AbortMultipartUpload'
+    )
+    status, body = action('abortMultipart')
+    assert status == 400
+    assert body['code'] == 'AccessDenied'
@@ -0,0 +1,140 @@
+"""Filename substring search: normalization, trigram index and cover, verify step."""
+
+import json
+from unittest import mock
+
+import pytest
+
+from tests.support import load_lambda
+
+process = load_lambda('process-image')
+search = load_lambda('search-images')
+
+
+@pytest.mark.parametrize('name, normalized', [
+    ('Beach.JPG', 'beach.jpg'),
+    ('Straße', 'strasse'),
+    ('ＩＭＧ＿２０４１', 'img_2041'),  # Full-width forms
+    ('ﬁle', 'file'),  # Ligature
+    ('Café', 'café'),  # Combining accent composed
+])
+def test_names_are_nfkc_case_folded(name, normalized):
+    assert search.normalize_name(name) == normalized
+    assert search.parse_query(f'name:{name}') == {'op': 'name', 'value': normalized}
+
+
+def test_query_and_index_normalize_the_same_way():
+    name = 'ＤＳＣ_Straße.JPG'
+    normalized = search.normalize_name(name)
+    assert process.name_trigrams(name) == {normalized[i:i + 3] for i in range(len(normalized) - 2)}
+
+
+@pytest.mark.parametrize('value, cover', [
+    ('abc', ['abc']),
+    ('abcd', ['abc', 'bcd']),
+    ('abcdef', ['abc', 'def']),
+    ('abcdefg', ['abc', 'def', 'efg']),
+    ('aaaaaa', ['aaa']),
+])
+def test_cover_spans_every_character(value, cover):
+    assert search.name_trigram_cover(value) == cover
+
+
+def test_cover_of_any_value_spans_it():
+    value = 'img_2041-holiday'
+    for length in range(3, len(value) + 1):
+        grams = search.name_trigram_cover(value[:length])
+        covered = {i for gram in grams for start in range(length - 2)
+                   if value[start:start + 3] == gram for i in range(start, start + 3)}
+        assert covered == set(range(length))
+
+
+@pytest.mark.parametrize('value', ['', 'a', 'ab'])
+def test_values_shorter_than_a_trigram_have_no_cover(value):
+    assert search.name_trigram_cover(value) == []
+    assert search.index_prefixes({'op': 'name', 'value': value}) == []
+
+
+@pytest.fixture
+def names(fake_table, monkeypatch):
+    monkeypatch.setattr(process, 'table', fake_table)
+    monkeypatch.setattr(search, 'table', fake_table)
+    library = {'a': 'Holiday-Beach.jpg', 'b': 'beach_day.png', 'c': 'day-beach.jpg', 'd': 'IMG_2041.jpg'}
+    for uploaded, (image_id, name) in enumerate(sorted(library.items())):
+        process.put_name_grams('user-1', image_id, name, 1000 + uploaded)
+    return library
+
+
+def lookup(value):
+    return search.lookup_name('user-1', {'op': 'name', 'value': value}, {'consumed': 0.0, 'postings': 0})
+
+
+def test_lookup_intersects_the_cover_postings(names):
+    assert lookup('beach') == {'a': 1000, 'b': 1001, 'c': 1002}
+    assert lookup('2041') == {'d': 1003}
+    assert lookup('sunset') == {}
+
+
+def test_verify_step_drops_trigram_false_positives(fake_table, monkeypatch):
+    monkeypatch.setattr(process, 'table', fake_table)
+    monkeypatch.setattr(search, 'table', fake_table)
+    process.put_name_grams('user-1', 'x', 'def-abc.jpg', 1)
+    process.put_name_grams('user-1', 'y', 'abcdef.jpg', 2)
+    node = search.parse_query('name:abcdef')
+    # Both names have 'abc' and 'def', the cover of 'abcdef'
+    assert set(lookup('abcdef')) == {'x', 'y'}
+    assert not search.evaluate(node, {'imageName': 'def-abc.jpg'})
+    assert search.evaluate(node, {'imageName': 'abcdef.jpg'})
+
+
+# ---------------------------------------------------------------------------
+# Backfill of images processed before the index existed
+# ---------------------------------------------------------------------------
+
+LEGACY_KEY = 'uploads/user-1/550e8400-e29b-41d4-a716-446655440000-20240101120000-Beach.jpg'
+
+
+@pytest.fixture
+def legacy(fake_table, monkeypatch):
+    monkeypatch.setattr(process, 'table', fake_table)
+    monkeypatch.setattr(search, 'table', fake_table)
+    fake_table.update_item = lambda Key, ExpressionAttributeValues, **kwargs: fake_table.put_item(Item=dict(
+        fake_table.get_item(Key=Key)['Item'], imageName=ExpressionAttributeValues[':name']))
+    # Split at the first two dashes by the old key parser, and indexed that way
+    fake_table.put_item(Item={'userId': 'user-1', 'imageId': '550e8400', 'uploadTimestamp': 1000,
+                              'imageName': 'e29b-41d4-a716-446655440000-20240101120000-Beach.jpg',
+                              'originalKey': LEGACY_KEY})
+    process.put_name_grams('user-1', '550e8400', 'e29b-41d4-a716-446655440000-20240101120000-Beach.jpg', 1000)
+    # Processed before filename postings were written
+    fake_table.put_item(Item={'userId': 'user-1', 'imageId': 'old', 'uploadTimestamp': 900, 'imageName': 'beach-day.png'})
+    fake_table.put_item(Item={'userId': 'user-2', 'imageId': 'other', 'uploadTimestamp': 800, 'imageName': 'dunes.jpg'})
+    fake_table.put_item(Item={'userId': 'user-1', 'imageId': 'meta#stats', 'imageCount': 2})
+    return fake_table
+
+
+def test_backfill_indexes_every_image_and_repairs_names(legacy):
+    assert process.lambda_handler({'backfillNameIndex': True}, None) == {'users': 2, 'images': 3}
+    assert legacy.get_item(Key={'userId': 'user-1', 'imageId': '550e8400'})['Item']['imageName'] == 'Beach.jpg'
+    assert set(lookup('beach')) == {'550e8400', 'old'}
+    # Postings of the UUID fragments and the timestamp are gone
+    assert lookup('2024') == {}
+    assert lookup('e29') == {}
+    assert legacy.keys(process.NAME_INDEX_PENDING_ID) == []
+
+
+def test_backfill_of_one_user(legacy):
+    assert process.backfill_name_index('user-2') == {'users': 1, 'images': 1}
+    assert lookup('beach') == {'550e8400': 1000}  # user-1 untouched
+
+
+def test_search_filters_the_partition_while_the_backfill_is_pending(legacy, monkeypatch):
+    legacy.put_item(Item={'userId': 'user-1', 'imageId': search.NAME_INDEX_PENDING_ID})
+    assert not search.name_index_complete('user-1')
+    monkeypatch.setattr(search, 'lookup_name', mock.Mock(side_effect=AssertionError('index read')))
+    body = json.loads(search.handle_query('user-1', {'q': 'name:beach', 'explain': 'true'})['body'])
+    # The legacy images have no postings yet but are still found
+    assert {image['imageId'] for image in body['images']} == {'550e8400', 'old'}
+    assert body['explain']['accessPath'] == 'UploadTimeIndex (full partition)'
+
+    legacy.delete_item(Key={'userId': 'user-1', 'imageId': search.NAME_INDEX_PENDING_ID})
+    assert search.name_index_complete('user-1')
@@ -0,0 +1,162 @@
+"""Perceptual hash (ProcessImage), band index and similar-image lookup (SearchImages)."""
+
+import json
+import random
+
+import pytest
+
+from tests.support import load_lambda
+
+process = load_lambda('process-image')
+search = load_lambda('search-images')
+delete = load_lambda('delete-image')
+
+
+def distance(a, b):
+    return bin(int(a, 16) ^ int(b, 16)).count('1')
+
+
+@pytest.fixture
+def photo():
+    """A synthetic photo: gradient sky, a dark hill and a bright sun."""
+    Image = pytest.importorskip('PIL.Image')
+    ImageDraw = pytest.importorskip('PIL.ImageDraw')
+    image = Image.linear_gradient('L').resize((640, 480)).convert('RGB')
+    draw = ImageDraw.Draw(image)
+    draw.ellipse((420, 60, 540, 180), fill=(250, 220, 90))
+    draw.polygon([(0, 480), (0, 330), (260, 250), (640, 380), (640, 480)], fill=(40, 70, 30))
+    return image
+
+
+@pytest.fixture
+def other_photo():
+    Image = pytest.importorskip('PIL.Image')
+    ImageDraw = pytest.importorskip('PIL.ImageDraw')
+    image = Image.new('RGB', (640, 480), (230, 230, 230))
+    draw = ImageDraw.Draw(image)
+    for x in range(0, 640, 80):
+        draw.rectangle((x, 0, x + 40, 480), fill=(20, 20, 120))
+    draw.ellipse((100, 200, 260, 360), fill=(200, 30, 30))
+    return image
+
+
+def test_dct_hash_survives_resizing_and_recompression(photo):
+    pytest.importorskip('numpy')
+    original = f'{process.dct_hash(photo):016x}'
+    smaller = f'{process.dct_hash(photo.resize((200, 150))):016x}'
+    assert distance(original, smaller) <= 4
+
+
+def test_dct_hash_separates_different_images(photo, other_photo):
+    pytest.importorskip('numpy')
+    assert distance(f'{process.dct_hash(photo):016x}', f'{process.dct_hash(other_photo):016x}') > 16
+
+
+def test_difference_hash_survives_resizing(photo, other_photo):
+    original = f'{process.difference_hash(photo):016x}'
+    assert distance(original, f'{process.difference_hash(photo.resize((200, 150))):016x}') <= 4
+    assert distance(original, f'{process.difference_hash(other_photo):016x}') > 16
+
+
+def test_image_features_reports_the_hash_type(photo, monkeypatch):
+    monkeypatch.setattr(process, 'NUMPY_AVAILABLE', False)
+    features = process.image_features(photo)
+    assert features['phashType'] == 'dhash'
+    assert len(features['phash']) == 16
+    int(features['phash'], 16)
+
+    pytest.importorskip('numpy')
+    monkeypatch.setattr(process, 'NUMPY_AVAILABLE', True)
+    assert process.image_features(photo)['phashType'] == 'dct'
+
+
+def test_phash_bands_are_eight_two_hex_digit_slices():
+    bands = process.phash_bands('0123456789abcdef', 'dct')
+    assert bands == ['dct0#01', 'dct1#23', 'dct2#45', 'dct3#67', 'dct4#89', 'dct5#ab', 'dct6#cd', 'dct7#ef']
+
+
+def test_hash_types_never_share_a_band():
+    assert not set(process.phash_bands('00' * 8, 'dct')) & set(process.phash_bands('00' * 8, 'dhash'))
+
+
+def test_delete_image_removes_every_band_posting(fake_table, monkeypatch):
+    monkeypatch.setattr(process, 'table', fake_table)
+    monkeypatch.setattr(delete, 'table', fake_table)
+    item = {'phash': 'fedcba9876543210', 'phashType': 'dct', 'uploadTimestamp': 1000}
+    process.put_phash_bands('user-1', 'img-1', item)
+    assert len(fake_table.keys('phash#')) == 8
+    delete.delete_phash_bands('user-1', 'img-1', item['phash'], item['phashType'])
+    assert fake_table.keys('phash#') == []
+
+
+def flip_bits(phash, count, rng):
+    value = int(phash, 16)
+    for bit in rng.sample(range(64), count):
+        value ^= 1 << bit
+    return f'{value:016x}'
+
+
+@pytest.fixture
+def library(fake_table, monkeypatch):
+    """Source image plus neighbours at every distance 0-12, indexed by ProcessImage."""
+    monkeypatch.setattr(process, 'table', fake_table)
+    monkeypatch.setattr(search, 'table', fake_table)
+    monkeypatch.setattr(search.dynamodb, 'batch_get_item', lambda RequestItems, **kwargs: {
+        'Responses': {search.DYNAMODB_TABLE: [
+            fake_table.get_item(Key=key)['Item']
+            for key in RequestItems[search.DYNAMODB_TABLE]['Keys'] if fake_table.get_item(Key=key)
+        ]}
+    })
+
+    rng = random.Random(48)
+    source = 'a5c3f00f0ff05a3c'
+    hashes = {'source': source}
+    for d in range(13):
+        for copy in range(12):
+            hashes[f'd{d:02d}-{copy:02d}'] = flip_bits(source, d, rng)
+
+    for image_id, phash in hashes.items():
+        item = {'userId': 'user-1', 'imageId': image_id, 'phash': phash, 'phashType': 'dct', 'uploadTimestamp': 1000}
+        fake_table.put_item(Item=item)
+        process.put_phash_bands('user-1', image_id, item)
+    return hashes
+
+
+def similar(max_distance, limit=100):
+    response = search.get_similar('user-1', 'source', {'maxDistance': str(max_distance), 'limit': str(limit)})
+    assert response['statusCode'] == 200
+    return json.loads(response['body'])
+
+
+def test_get_similar_finds_every_image_within_distance_seven(library):
+    body = similar(7)
+    found = {image['imageId']: image['distance'] for image in body['images']}
+    expected = {image_id for image_id, phash in library.items()
+                if image_id != 'source' and distance(phash, library['source']) <= 7}
+    assert set(found) == expected
+    assert all(found[image_id] == distance(library[image_id], library['source']) for image_id in found)
+
+
+def test_get_similar_ranks_nearest_first_and_honours_max_distance(library):
+    body = similar(3, limit=10)
+    distances = [image['distance'] for image in body['images']]
+    assert distances == sorted(distances)
+    assert max(distances) <= 3
+    assert len(distances) == 10
+
+
+def test_hashes_within_distance_seven_always_share_a_band():
+    """Any two hashes at distance <= 7 share a band, so the band Queries see the neighbour."""
+    rng = random.Random(7)
+    for _ in range(500):
+        source = f'{rng.getrandbits(64):016x}'
+        neighbour = flip_bits(source, rng.randint(0, 7), rng)
+        assert set(process.phash_bands(source, 'dct')) & set(process.phash_bands(neighbour, 'dct'))
+
+
+def test_get_similar_without_hash_or_image(fake_table, monkeypatch):
+    monkeypatch.setattr(search, 'table', fake_table)
+    fake_table.put_item(Item={'userId': 'user-1', 'imageId': 'plain', 'uploadTimestamp': 1})
+    assert search.get_similar('user-1', 'missing', {})['statusCode'] == 404
+    body = json.loads(search.get_similar('user-1', 'plain', {})['body'])
+    assert body['images'] == [] and 'message' in body
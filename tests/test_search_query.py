@@ -0,0 +1,274 @@
+"""SearchImages query language: parser, date bounds, planner and paging."""
+
+import calendar
+import time
+from datetime import datetime
+
+import pytest
+
+from tests.support import load_lambda
+
+search = load_lambda('search-images')
+
+
+def tag(value):
+    return {'op': 'tag', 'value': value}
+
+
+def utc(*args):
+    return calendar.timegm(datetime(*args).timetuple())
+
+
+# ---------------------------------------------------------------------------
+# Parser
+# ---------------------------------------------------------------------------
+
+def test_single_word_is_a_tag():
+    assert search.parse_query('Beach') == tag('beach')
+
+
+def test_juxtaposition_means_and():
+    assert search.parse_query('beach sunset') == {'op': 'and', 'args': [tag('beach'), tag('sunset')]}
+    assert search.parse_query('beach AND sunset') == search.parse_query('beach sunset')
+
+
+def test_and_binds_tighter_than_or():
+    assert search.parse_query('beach OR sunset dusk') == {
+        'op': 'or', 'args': [tag('beach'), {'op': 'and', 'args': [tag('sunset'), tag('dusk')]}]
+    }
+
+
+def test_parentheses_group():
+    assert search.parse_query('(beach OR sunset) dusk') == {
+        'op': 'and', 'args': [{'op': 'or', 'args': [tag('beach'), tag('sunset')]}, tag('dusk')]
+    }
+
+
+def test_not_applies_to_the_next_atom():
+    assert search.parse_query('beach NOT people') == {
+        'op': 'and', 'args': [tag('beach'), {'op': 'not', 'arg': tag('people')}]
+    }
+    assert search.parse_query('NOT NOT beach') == {'op': 'not', 'arg': {'op': 'not', 'arg': tag('beach')}}
+
+
+def test_lowercase_operators_are_words():
+    assert search.parse_query('beach or sunset') == {
+        'op': 'and', 'args': [tag('beach'), tag('or'), tag('sunset')]
+    }
+
+
+def test_quoted_phrase_is_one_tag():
+    assert search.parse_query('"Ice Cream" cone') == {'op': 'and', 'args': [tag('ice cream'), tag('cone')]}
+
+
+def test_fields():
+    assert search.parse_query('faces:>=2') == {'op': 'faces', 'cmp': '>=', 'value': 2}
+    assert search.parse_query('faces:3') == {'op': 'faces', 'cmp': '=', 'value': 3}
+    assert search.parse_query('has:faces') == {'op': 'faces', 'cmp': '>', 'value': 0}
+    assert search.parse_query('has:text') == {'op': 'hastext'}
+    assert search.parse_query('age:25') == {'op': 'face', 'value': 'age:20-30'}
+    assert search.parse_query('text:"Costco Wholesale"') == {
+        'op': 'text', 'value': 'costco wholesale', 'tokens': ['costco', 'wholesale'], 'prefix': False
+    }
+    assert search.parse_query('text:cost*')['prefix'] is True
+
+
+def test_date_field_covers_the_whole_range():
+    assert search.parse_query('date:2024-06-01..2024-06-15') == {
+        'op': 'date', 'from': utc(2024, 6, 1), 'to': utc(2024, 6, 16) - 1
+    }
+
+
+@pytest.mark.parametrize('text', [
+    '', '   ', '(', '(beach', 'beach)', 'beach AND', 'NOT', 'OR beach', 'colour:blue',
+    'faces:many', 'date:2024-13', 'date:June', 'text:"!!"', 'age:old',
+])
+def test_invalid_queries_raise_value_error(text):
+    with pytest.raises(ValueError):
+        search.parse_query(text)
+
+
+def test_handler_returns_400_for_syntax_errors():
+    response = search.handle_query('user-1', {'q': '(beach'})
+    assert response['statusCode'] == 400
+
+
+# ---------------------------------------------------------------------------
+# date_bounds
+# ---------------------------------------------------------------------------
+
+def test_date_bounds_year():
+    assert search.date_bounds('2024') == (utc(2024, 1, 1), utc(2025, 1, 1) - 1)
+
+
+def test_date_bounds_month_rolls_over_december():
+    assert search.date_bounds('2024-02') == (utc(2024, 2, 1), utc(2024, 3, 1) - 1)
+    assert search.date_bounds('2024-12') == (utc(2024, 12, 1), utc(2025, 1, 1) - 1)
+
+
+def test_date_bounds_day():
+    assert search.date_bounds('2024-02-29') == (utc(2024, 2, 29), utc(2024, 3, 1) - 1)
+    assert search.date_bounds('2023-12-31') == (utc(2023, 12, 31), utc(2024, 1, 1) - 1)
+
+
+@pytest.mark.parametrize('tz', ['America/Los_Angeles', 'Asia/Tokyo'])
+def test_date_bounds_day_is_utc_in_any_local_timezone(monkeypatch, tz):
+    if not hasattr(time, 'tzset'):
+        pytest.skip('time.tzset is not available')
+    monkeypatch.setenv('TZ', tz)
+    time.tzset()
+    try:
+        assert search.date_bounds('2024-03-10') == (utc(2024, 3, 10), utc(2024, 3, 11) - 1)
+        assert search.date_bounds('2024-12-31') == (utc(2024, 12, 31), utc(2025, 1, 1) - 1)
+    finally:
+        monkeypatch.undo()
+        time.tzset()
+
+
+@pytest.mark.parametrize('text', ['24', '2024-1', '2024/01/01', '2024-02-30', ''])
+def test_date_bounds_rejects_invalid_dates(text):
+    with pytest.raises(ValueError):
+        search.date_bounds(text)
+
+
+# ---------------------------------------------------------------------------
+# Planner
+# ---------------------------------------------------------------------------
+
+FACETS = {'imageCount': 1000, 'months': {'2024-05': 400, '2024-06': 30, '2024-07': 570}}
+
+
+def test_plan_without_facets_reads_the_partition():
+    plan = search.plan_query(search.parse_query('beach'), {})
+    assert plan['accessPath'] == 'UploadTimeIndex (full partition)'
+    assert plan['range'] is None
+    assert plan['pushed'] == [tag('beach')]
+    assert plan['post'] == []
+
+
+def test_plan_uses_the_date_range_when_it_reads_less():
+    plan = search.plan_query(search.parse_query('beach date:2024-06'), FACETS)
+    assert plan['accessPath'] == 'UploadTimeIndex (uploadTimestamp range)'
+    assert plan['range'] == search.date_bounds('2024-06')
+    assert plan['estimatedItems'] == 30
+    assert plan['pushed'] == [tag('beach')]
+
+
+def test_plan_intersects_several_date_terms():
+    plan = search.plan_query(search.parse_query('date:2024 date:2024-06..2025'), FACETS)
+    assert plan['range'] == (utc(2024, 6, 1), utc(2025, 1, 1) - 1)
+
+
+def test_plan_keeps_dates_under_or_as_filters():
+    plan = search.plan_query(search.parse_query('date:2024-06 OR beach'), FACETS)
+    assert plan['range'] is None
+    assert len(plan['pushed']) == 1
+
+
+def test_plan_prefers_index_postings_when_they_are_fewer():
+    ast = search.parse_query('text:costco beach')
+    text_term = ast['args'][0]
+    plan = search.plan_query(ast, FACETS, {'a': utc(2024, 6, 2), 'b': utc(2024, 7, 2)}, [text_term])
+    assert plan['accessPath'] == 'TermIndex (postings)'
+    assert plan['matches'] == {'a': utc(2024, 6, 2), 'b': utc(2024, 7, 2)}
+    # Read by key: nothing can be pushed, and the text term is already exact
+    assert plan['pushed'] == []
+    assert plan['post'] == [tag('beach')]
+
+
+def test_plan_filters_index_matches_by_date():
+    ast = search.parse_query('name:beach date:2024-06')
+    name_term = ast['args'][0]
+    plan = search.plan_query(ast, FACETS, {'a': utc(2024, 6, 2), 'b': utc(2024, 7, 2)}, [name_term])
+    assert plan['accessPath'] == 'NameTrigramIndex (postings)'
+    assert plan['matches'] == {'a': utc(2024, 6, 2)}
+    # Trigram candidates are verified on the name
+    assert plan['post'] == [name_term]
+
+
+def test_plan_post_filters_what_dynamodb_cannot_evaluate():
+    plan = search.plan_query(search.parse_query('beach NOT name:ab'), {})
+    assert plan['pushed'] == [tag('beach')]
+    assert plan['post'] == [{'op': 'not', 'arg': {'op': 'name', 'value': 'ab'}}]
+
+
+# ---------------------------------------------------------------------------
+# Paging
+# ---------------------------------------------------------------------------
+
+def images(count):
+    """Newest first, as UploadTimeIndex returns them."""
+    return [
+        {'userId': 'user-1', 'imageId': f'img-{i:02d}', 'uploadTimestamp': 1000 - i, 'tags': ['even' if i % 2 == 0 else 'odd']}
+        for i in range(count)
+    ]
+
+
+class FakeIndex:
+    """UploadTimeIndex query with Limit/ExclusiveStartKey (descending)."""
+
+    def __init__(self, items):
+        self.items = items
+        self.calls = 0
+
+    def query(self, Limit, ExclusiveStartKey=None, **kwargs):
+        self.calls += 1
+        start = 0
+        if ExclusiveStartKey:
+            start = next(i for i, item in enumerate(self.items) if item['imageId'] == ExclusiveStartKey['imageId']) + 1
+        page = self.items[start:start + Limit]
+        response = {'Items': page, 'ScannedCount': len(page)}
+        if start + Limit < len(self.items):
+            response['LastEvaluatedKey'] = search.index_key(page[-1])
+        return response
+
+
+def test_run_query_stops_at_limit_inside_a_page():
+    stats = {}
+    items, next_key = search.run_query(iter([images(10)]), [], 3, stats)
+    assert [item['imageId'] for item in items] == ['img-00', 'img-01', 'img-02']
+    assert next_key == {'userId': 'user-1', 'imageId': 'img-02', 'uploadTimestamp': 998}
+
+
+def test_run_query_fills_the_limit_across_pages():
+    pages = iter([images(10)[:4], images(10)[4:8], images(10)[8:]])
+    items, next_key = search.run_query(pages, [tag('odd')], 3, {})
+    assert [item['imageId'] for item in items] == ['img-01', 'img-03', 'img-05']
+    assert next_key['imageId'] == 'img-05'
+
+
+def test_run_query_returns_no_key_when_pages_run_out():
+    items, next_key = search.run_query(iter([images(4)]), [tag('odd')], 3, {})
+    assert len(items) == 2
+    assert next_key is None
+
+
+def test_run_query_resumes_where_the_read_budget_stopped(monkeypatch):
+    index = FakeIndex(images(20))
+    monkeypatch.setattr(search, 'table', index)
+    stats = {'pages': 0, 'scanned': 0, 'consumed': 0.0}
+    pages = search.query_pages({'Limit': 2}, stats, max_pages=2)
+    # Only the "never" filter: nothing matches in the budget
+    items, next_key = search.run_query(pages, [tag('never')], 5, stats)
+    assert items == []
+    assert index.calls == 2
+    assert next_key == search.index_key(images(20)[3])
+
+
+def test_next_key_pages_through_every_match_once(monkeypatch):
+    index = FakeIndex(images(25))
+    monkeypatch.setattr(search, 'table', index)
+    seen = []
+    start_key = None
+    while True:
+        stats = {'pages': 0, 'scanned': 0, 'consumed': 0.0}
+        query_params = {'Limit': 4}
+        if start_key:
+            query_params['ExclusiveStartKey'] = start_key
+        items, start_key = search.run_query(
+            search.query_pages(query_params, stats, max_pages=3), [tag('even')], 3, stats
+        )
+        seen.extend(item['imageId'] for item in items)
+        if start_key is None:
+            break
+    assert seen == [f'img-{i:02d}' for i in range(0, 25, 2)]
@@ -0,0 +1,104 @@
+"""Tag dictionary: completions (GetTags) and counts across reprocessing."""
+
+import re
+
+import pytest
+
+from tests.support import ClientError, load_lambda
+
+get_tags = load_lambda('get-tags')
+process = load_lambda('process-image')
+analyze = load_lambda('analyze-image')
+
+
+# ---------------------------------------------------------------------------
+# Completions
+# ---------------------------------------------------------------------------
+
+COUNTS = {'beach': 5, 'bear': 5, 'bee': 2, 'bench': 0, 'dog': 9, 'beagle': 7}
+LAST_SEEN = {'beach': 100, 'bear': 300, 'bee': 200, 'dog': 50, 'beagle': 10}
+
+
+def completions(prefix, limit=10):
+    return [(entry['tag'], entry['count']) for entry in get_tags.top_completions(COUNTS, LAST_SEEN, prefix, limit)]
+
+
+def test_completions_are_ordered_by_count_then_last_seen():
+    assert completions('be') == [('beagle', 7), ('bear', 5), ('beach', 5), ('bee', 2)]
+
+
+def test_completions_skip_zero_counts_and_other_prefixes():
+    assert completions('ben') == []
+    assert completions('d') == [('dog', 9)]
+    assert [tag for tag, _ in completions('')] == ['dog', 'beagle', 'bear', 'beach', 'bee']
+
+
+def test_completions_stop_at_limit():
+    assert completions('be', limit=2) == [('beagle', 7), ('bear', 5)]
+
+
+def test_ties_without_last_seen_fall_back_to_the_tag():
+    entries = get_tags.top_completions({'b': 1, 'a': 1}, {}, '', 5)
+    assert [entry['tag'] for entry in entries] == ['a', 'b']
+    assert entries[0]['lastSeen'] == 0
+
+
+# ---------------------------------------------------------------------------
+# Counts across reprocessing
+# ---------------------------------------------------------------------------
+
+CLAUSE = re.compile(r'(tagCounts|tagLastSeen)\.(#\w+) = (?:if_not_exists\(\w+\.#\w+, (:\w+)\) ([+-]) (:\w+)|(:\w+))')
+
+
+class TagDictionary:
+    """The meta#tags item, applying the SET clauses both Lambdas write."""
+
+    def __init__(self):
+        self.counts = None
+        self.last_seen = None
+
+    def update_item(self, Key, UpdateExpression, ExpressionAttributeNames, ExpressionAttributeValues, **kwargs):
+        assert Key['imageId'] == 'meta#tags'
+        if self.counts is None:
+            if kwargs.get('ConditionExpression') == 'attribute_exists(tagCounts)':
+                raise ClientError({'Error': {'Code': 'ConditionalCheckFailedException'}}, 'UpdateItem')
+            raise ClientError({'Error': {'Code': 'ValidationException'}}, 'UpdateItem')
+        values = ExpressionAttributeValues
+        for attribute, name, default, sign, operand, assigned in CLAUSE.findall(UpdateExpression):
+            tag = ExpressionAttributeNames[name]
+            if attribute == 'tagLastSeen':
+                self.last_seen[tag] = values[assigned]
+            else:
+                step = values[operand] if sign == '+' else -values[operand]
+                self.counts[tag] = self.counts.get(tag, values[default]) + step
+
+    def put_item(self, Item, **kwargs):
+        self.counts, self.last_seen = dict(Item['tagCounts']), dict(Item['tagLastSeen'])
+
+
+@pytest.fixture
+def dictionary(monkeypatch):
+    tags = TagDictionary()
+    monkeypatch.setattr(process, 'table', tags)
+    monkeypatch.setattr(analyze, 'table', tags)
+    return tags
+
+
+def test_reprocessing_subtracts_the_replaced_tags(dictionary):
+    dictionary.counts, dictionary.last_seen = {'beach': 2, 'sand': 1}, {}
+    process.decrement_tag_counts('user-1', ['beach', 'sand', 'beach'])
+    assert dictionary.counts == {'beach': 1, 'sand': 0}
+
+
+def test_reprocessing_before_the_dictionary_exists_is_ignored(dictionary):
+    process.decrement_tag_counts('user-1', ['beach'])
+    assert dictionary.counts is None
+
+
+def test_analyze_reprocess_analyze_counts_each_tag_once(dictionary):
+    analyze.update_tag_dictionary('user-1', {'beach', 'sea'}, set(), 1000)
+    # ProcessImage replaced the analysed item; AnalyzeImage sees no previous tags
+    process.decrement_tag_counts('user-1', ['beach', 'sea'])
+    analyze.update_tag_dictionary('user-1', {'beach', 'sea'}, set(), 2000)
+    assert dictionary.counts == {'beach': 1, 'sea': 1}
+    assert dictionary.last_seen == {'beach': 2000, 'sea': 2000}
@@ -0,0 +1,105 @@
+"""Text term index: postings (AnalyzeImage) and text: lookups (SearchImages)."""
+
+from unittest import mock
+
+import pytest
+
+from tests.support import load_lambda
+
+analyze = load_lambda('analyze-image')
+search = load_lambda('search-images')
+
+
+def test_postings_record_every_position_of_a_term():
+    assert analyze.term_postings(['Sale sale SALE', 'final sale']) == {
+        'sale': [0, 1, 2, analyze.TERM_LINE_GAP + 1],
+        'final': [analyze.TERM_LINE_GAP],
+    }
+
+
+def test_tokens_are_case_folded_words():
+    assert analyze.tokenize('Straße_Nr. 42!') == ['strasse', 'nr', '42']
+    assert analyze.tokenize('x' * (analyze.MAX_TERM_LENGTH + 1)) == []
+
+
+def test_both_lambdas_compute_the_same_postings():
+    lines = ['Costco WHOLESALE #123', 'Thank you', 'IMG_2041']
+    assert search.term_postings(lines) == analyze.term_postings(lines)
+    assert search.TERM_LINE_GAP == analyze.TERM_LINE_GAP
+
+
+def test_phrase_match_needs_consecutive_positions():
+    assert search.phrase_match([{5}])
+    assert search.phrase_match([{1, 7}, {8}, {9}])
+    assert not search.phrase_match([{1}, {3}])
+    assert not search.phrase_match([{2}, {1}])
+    assert not search.phrase_match([{1}, set()])
+
+
+def test_phrase_never_matches_across_lines():
+    postings = search.term_postings(['cost co', 'wholesale'])
+    # Last word of line 0 and first word of line 1 are not adjacent
+    assert not search.phrase_match([set(postings['co']), set(postings['wholesale'])])
+    postings = search.term_postings(['costco wholesale'])
+    assert search.phrase_match([set(postings['costco']), set(postings['wholesale'])])
+
+
+# ---------------------------------------------------------------------------
+# Index writes and lookups
+# ---------------------------------------------------------------------------
+
+@pytest.fixture
+def index(fake_table, monkeypatch):
+    fake_table.update_item = mock.MagicMock()
+    monkeypatch.setattr(analyze, 'table', fake_table)
+    monkeypatch.setattr(search, 'table', fake_table)
+    return fake_table
+
+
+def analyze_text(table, image_id, lines, old_item=None):
+    """Run update_term_index and return the image as it would be stored."""
+    item = dict(old_item or {'userId': 'user-1', 'imageId': image_id, 'uploadTimestamp': 1000})
+    analyze.update_term_index('user-1', image_id, lines, item)
+    item['textTerms'] = table.update_item.call_args.kwargs['ExpressionAttributeValues'][':terms']
+    return item
+
+
+def text(query):
+    return search.lookup_text('user-1', search.parse_query(query), {'consumed': 0.0, 'postings': 0})
+
+
+def test_update_term_index_writes_one_posting_per_term(index):
+    item = analyze_text(index, 'img-1', ['Costco Wholesale', 'costco'])
+    assert index.keys('term#') == ['term#costco#img-1', 'term#wholesale#img-1']
+    posting = index.get_item(Key={'userId': 'user-1', 'imageId': 'term#costco#img-1'})['Item']
+    assert posting['positions'] == [0, analyze.TERM_LINE_GAP]
+    assert posting['targetImageId'] == 'img-1'
+    assert posting['uploadedAt'] == 1000
+    assert item['textTerms'] == ['costco', 'wholesale']
+
+
+def test_lookup_text_matches_words_and_phrases(index):
+    analyze_text(index, 'img-1', ['Costco Wholesale'])
+    analyze_text(index, 'img-2', ['wholesale costco'])
+    analyze_text(index, 'img-3', ['costco', 'wholesale'])
+    assert set(text('text:costco')) == {'img-1', 'img-2', 'img-3'}
+    assert text('text:"costco wholesale"') == {'img-1': 1000}
+    assert text('text:walmart') == {}
+
+
+def test_prefix_lookup_matches_longer_terms(index):
+    analyze_text(index, 'img-1', ['Costco Wholesale'])
+    analyze_text(index, 'img-2', ['cost'])
+    analyze_text(index, 'img-3', ['cosy'])
+    assert set(text('text:cost*')) == {'img-1', 'img-2'}
+    # Only the last word of a phrase is a prefix
+    assert set(text('text:"costco whole*"')) == {'img-1'}
+    assert text('text:"cost wholesale*"') == {}
+
+
+def test_reanalysis_removes_stale_postings(index):
+    item = analyze_text(index, 'img-1', ['Costco Wholesale'])
+    analyze_text(index, 'img-1', ['Costco Receipt'], old_item=item)
+    assert index.keys('term#') == ['term#costco#img-1', 'term#receipt#img-1']
+    assert text('text:wholesale') == {}
+    assert text('text:"costco receipt"') == {'img-1': 1000}
@@ -0,0 +1,53 @@
+"""GetUploadUrl batch requests: one call signs a whole selection."""
+
+import json
+from unittest import mock
+
+import pytest
+
+from tests.support import load_lambda
+
+upload = load_lambda('get-upload-url')
+
+MB = 1024 * 1024
+
+
+@pytest.fixture
+def s3(monkeypatch):
+    client = mock.MagicMock()
+    client.generate_presigned_post.return_value = {'url': 'https://uploads', 'fields': {}}
+    monkeypatch.setattr(upload, 's3_client', client)
+    monkeypatch.setattr(upload, 'find_existing_images', lambda user_id, hashes: {})
+    monkeypatch.setattr(upload, 'get_usage', lambda user_id: {})
+    monkeypatch.setattr(upload, 'reserve_quota', lambda usage, descriptor: None)
+    return client
+
+
+def batch(count, size):
+    files = [{'filename': f'img-{i}.jpg', 'contentType': 'image/jpeg', 'fileSize': size} for i in range(count)]
+    return json.loads(upload.handle_batch_request('user-1', files, 'POST')['body'])
+
+
+def test_small_batches_keep_the_default_expiry(s3):
+    body = batch(2, 100 * 1024)
+    assert body['expiresIn'] == upload.URL_EXPIRATION + 1
+
+
+def test_expiry_grows_with_the_batch(s3):
+    body = batch(200, 5 * MB)
+    # 1000 MB would take over an hour at the assumed uplink
+    assert body['expiresIn'] == upload.MAX_BATCH_URL_EXPIRATION
+    body = batch(50, 2 * MB)
+    assert body['expiresIn'] == upload.URL_EXPIRATION + 400
+    assert {entry['expiresIn'] for entry in body['uploads']} == {body['expiresIn']}
+    assert {call.kwargs['ExpiresIn'] for call in s3.generate_presigned_post.call_args_list} == {
+        upload.MAX_BATCH_URL_EXPIRATION, upload.URL_EXPIRATION + 400}
+
+
+def test_rejected_files_do_not_extend_the_expiry(s3):
+    files = [{'filename': 'ok.jpg', 'fileSize': 1024},
+             {'filename': 'huge.jpg', 'fileSize': upload.MAX_FILE_SIZE + 1},
+             {'filename': 'notes.txt', 'fileSize': 5 * MB}]
+    body = json.loads(upload.handle_batch_request('user-1', files, 'POST')['body'])
+    assert body['rejected'] == 2
+    assert body['expiresIn'] == upload.URL_EXPIRATION + 1
@@ -0,0 +1,48 @@
+"""Upload keys: built by GetUploadUrl, parsed back by ProcessImage."""
+
+from unittest import mock
+from urllib.parse import quote_plus
+
+import pytest
+
+from tests.support import load_lambda
+
+upload = load_lambda('get-upload-url')
+process = load_lambda('process-image')
+
+
+@pytest.mark.parametrize('filename', ['sunset.jpg', 'IMG-2041-edit.jpeg', 'my photo (1).png', 'été.webp'])
+def test_keys_from_get_upload_url_round_trip(filename):
+    image_id, key = upload.build_upload_key('user-1', filename)
+    assert process.parse_upload_key(key) == ('user-1', image_id, filename)
+
+
+@pytest.mark.parametrize('key', [
+    'uploads/user-1/photo.jpg',
+    'uploads/user-1/abc-20240101120000-photo.jpg',  # Not a UUID
+    'uploads/550e8400-e29b-41d4-a716-446655440000-20240101120000-photo.jpg',  # No user
+    'thumbnails/user-1/550e8400-e29b-41d4-a716-446655440000-20240101120000-photo.jpg',
+])
+def test_other_keys_are_rejected(key):
+    assert process.parse_upload_key(key) is None
+
+
+def test_handler_stores_the_full_image_id_and_name(fake_table, monkeypatch):
+    fake_table.update_item = mock.MagicMock()
+    s3 = mock.MagicMock()
+    s3.head_object.return_value = {'ContentLength': 1024, 'ContentType': 'image/jpeg', 'Metadata': {}}
+    monkeypatch.setattr(process, 'table', fake_table)
+    monkeypatch.setattr(process, 's3', s3)
+    monkeypatch.setattr(process, 'PIL_AVAILABLE', False)
+
+    image_id, key = upload.build_upload_key('user-1', 'Beach day 2.jpg')
+    # S3 event notifications carry the key URL-encoded
+    event = {'Records': [{'s3': {'bucket': {'name': 'uploads'}, 'object': {'key': quote_plus(key, safe='/')}}}]}
+    assert process.lambda_handler(event, None)['statusCode'] == 200
+
+    item = fake_table.get_item(Key={'userId': 'user-1', 'imageId': image_id})['Item']
+    assert item['imageName'] == 'Beach day 2.jpg'
+    assert item['originalKey'] == key
+    assert s3.head_object.call_args.kwargs['Key'] == key
+    # The filename index holds the name's trigrams only, no UUID or timestamp digits
+    assert {gram.split('#')[1] for gram in fake_table.keys('gram#')} == process.name_trigrams('Beach day 2.jpg')